@@ -0,0 +1,186 @@
+"""Headless bulk account plan generation
+
+Reads a list of companies and writes one JSON plan per company, using the same
+SYSTEM_PROMPT / JSON plan generation pipeline as the Streamlit app.
+Companies that already have an output file are skipped, so an interrupted run
+resumes where it stopped.
+
+Usage:
+    python batch_research.py companies.csv --out plans/ --workers 4
+    python batch_research.py companies.jsonl --out plans/ --parallel-sections
+    python batch_research.py companies.csv --metrics groq_metrics.prom
+
+Input formats:
+    CSV   - a "company" column (or the first column), optional "focus" column
+    JSONL - {"company": "...", "focus": "..."} objects, or plain JSON strings
+"""
+import argparse
+import csv
+import hashlib
+import json
+import os
+import re
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from datetime import datetime
+from typing import Dict, List
+
+from dotenv import load_dotenv
+
+from document_index import document_index_from_env
+from groq_client import (
+    AsyncGroqRunner, async_enabled, is_retryable_error, is_throttle_error, make_sync_client, retry_after_seconds
+)
+from plan_store import PlanStore
+from rate_limit import limiter_from_env
+from research import MODEL, ResearchPipeline, detect_account_plan_intent
+from response_cache import cache_from_env
+
+
+def load_companies(path: str) -> List[Dict[str, str]]:
+    """Read companies from CSV or JSONL, dropping blanks and duplicates"""
+    rows = []
+    with open(path, newline="", encoding="utf-8") as f:
+        if path.lower().endswith((".jsonl", ".ndjson")):
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                item = json.loads(line)
+                rows.append(item if isinstance(item, dict) else {"company": str(item)})
+        else:
+            reader = csv.DictReader(f)
+            column = "company" if "company" in (reader.fieldnames or []) else (reader.fieldnames or [None])[0]
+            for row in reader:
+                rows.append({"company": row.get(column) or "", "focus": row.get("focus") or ""})
+
+    companies = []
+    seen = set()
+    for row in rows:
+        company = (row.get("company") or "").strip()
+        if company and company.lower() not in seen:
+            seen.add(company.lower())
+            companies.append({"company": company, "focus": (row.get("focus") or "").strip()})
+    return companies
+
+
+def output_path(out_dir: str, company: str) -> str:
+    """Readable slug plus a hash of the exact name, so names that slug alike (e.g. non-Latin ones) never share a file"""
+    slug = re.sub(r"[^a-z0-9]+", "-", company.lower()).strip("-") or "company"
+    digest = hashlib.sha1(company.encode("utf-8")).hexdigest()[:8]
+    return os.path.join(out_dir, f"{slug}-{digest}.json")
+
+
+def is_complete(path: str, company: str) -> bool:
+    """A plan file counts as done only if it is valid JSON holding this company's plan (writes are atomic, but be safe)"""
+    try:
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+    except (OSError, ValueError):
+        return False
+    return isinstance(data, dict) and "plan" in data and data.get("company") == company
+
+
+def write_json_atomic(path: str, data: Dict) -> None:
+    tmp_path = f"{path}.tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def research_company(pipeline: ResearchPipeline, company: str, focus: str, parallel_sections: bool) -> Dict:
+    """Generate and parse one account plan"""
+    prompt = f"Create an account plan for {company}"
+    if focus:
+        prompt += f" focused on {focus}"
+
+    started = time.perf_counter()
+    if parallel_sections:
+        response_text, plan = pipeline.generate_account_plan_parallel(prompt)
+    else:
+        response_text, plan = pipeline.generate_account_plan(prompt)
+
+    return {
+        "company": company,
+        "focus": focus,
+        "model": MODEL,
+        "generated_at": datetime.now().isoformat(timespec="seconds"),
+        "duration_seconds": round(time.perf_counter() - started, 2),
+        "is_account_plan": detect_account_plan_intent(response_text),
+        "plan": plan,
+        "response": response_text
+    }
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Generate account plans for a list of companies")
+    parser.add_argument("input", help="CSV or JSONL file listing companies")
+    parser.add_argument("--out", default="plans", help="directory for one JSON plan per company")
+    parser.add_argument("--workers", type=int, default=4, help="companies researched concurrently")
+    parser.add_argument("--parallel-sections", action="store_true",
+                        help="generate the ten sections of each plan as concurrent requests")
+    parser.add_argument("--store", action="store_true",
+                        help="also save plans to the app's plan store (PLAN_STORE_PATH)")
+    parser.add_argument("--metrics", metavar="PATH",
+                        help="write Groq call latency/token histograms in Prometheus text format when done")
+    args = parser.parse_args(argv)
+
+    load_dotenv()
+    api_key = os.getenv("GROQ_API_KEY")
+    if not api_key:
+        print("GROQ_API_KEY not found in environment variables (.env)", file=sys.stderr)
+        return 2
+
+    os.makedirs(args.out, exist_ok=True)
+    companies = load_companies(args.input)
+    pending = [c for c in companies if not is_complete(output_path(args.out, c["company"]), c["company"])]
+    print(f"{len(companies)} companies, {len(companies) - len(pending)} already done, {len(pending)} to research")
+    if not pending:
+        return 0
+
+    pipeline = ResearchPipeline(
+        make_sync_client(api_key),
+        cache_from_env(),
+        async_runner=AsyncGroqRunner(api_key) if async_enabled() else None,
+        rate_limiter=limiter_from_env(
+            is_retryable=is_retryable_error,
+            retry_after=retry_after_seconds,
+            is_throttle=is_throttle_error
+        ),
+        document_index=document_index_from_env()
+    )
+    plan_store = PlanStore(os.getenv("PLAN_STORE_PATH", "data/account_plans.sqlite3")) if args.store else None
+
+    failures = 0
+    with ThreadPoolExecutor(max_workers=args.workers) as executor:
+        futures = {
+            executor.submit(research_company, pipeline, c["company"], c["focus"], args.parallel_sections): c
+            for c in pending
+        }
+        for done, future in enumerate(as_completed(futures), start=1):
+            company = futures[future]["company"]
+            try:
+                result = future.result()
+            except Exception as e:
+                failures += 1
+                print(f"[{done}/{len(pending)}] ✗ {company}: {e}", file=sys.stderr)
+                continue
+            write_json_atomic(output_path(args.out, company), result)
+            if plan_store is not None:
+                plan_store.save_plan(company, result["plan"], source="batch")
+            flag = "" if result["is_account_plan"] else " (response did not look like a plan)"
+            print(f"[{done}/{len(pending)}] ✓ {company} in {result['duration_seconds']}s{flag}")
+
+    if args.metrics:
+        with open(args.metrics, "w", encoding="utf-8") as f:
+            f.write(pipeline.metrics.prometheus_text())
+    
+    if failures:
+        print(f"{failures} companies failed; rerun the same command to retry them", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,217 @@
+"""Local stand-in for the Groq chat-completions API, for benchmarks that should not spend quota
+
+Serves POST .../chat/completions (streamed and non-streamed) with simulated
+time to first token, token rate and injected failures. Prompts that ask for a
+plan get a ten-section account plan (a JSON object in JSON mode); everything
+else gets filler text.
+
+Usage:
+    python benchmarks/fake_groq_server.py --port 8765 --latency 0.3 --tokens-per-second 400
+    GROQ_BASE_URL=http://127.0.0.1:8765 streamlit run main.py
+"""
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, Tuple
+
+SECTION_HEADERS = [
+    "Executive Summary", "Company Overview", "Business Model & Products/Services",
+    "Market Position & Competitors", "Recent News & Strategic Initiatives",
+    "Key Stakeholders & Decision Makers", "Pain Points & Challenges",
+    "Opportunities & Recommendations", "Engagement Strategy", "Next Steps"
+]
+SECTION_IDS = [
+    "executive_summary", "company_overview", "business_model", "market_position", "recent_news",
+    "key_stakeholders", "pain_points", "opportunities", "engagement_strategy", "next_steps"
+]
+
+FILLER = (
+    "The account shows steady growth in its core segment, with expansion into adjacent markets "
+    "driven by a platform strategy and a renewed focus on enterprise customers. "
+)
+
+CHARS_PER_TOKEN = 4
+TOKENS_PER_CHUNK = 8
+
+
+class FakeGroqConfig:
+    """Simulation knobs; failure_rate is split evenly between 429 and 500 responses"""
+
+    def __init__(
+        self,
+        latency: float = 0.2,
+        tokens_per_second: float = 500.0,
+        completion_tokens: int = 400,
+        failure_rate: float = 0.0,
+        retry_after: float = 0.05,
+        seed: int = 0
+    ):
+        self.latency = latency
+        self.tokens_per_second = tokens_per_second
+        self.completion_tokens = completion_tokens
+        self.failure_rate = failure_rate
+        self.retry_after = retry_after
+        self.requests = 0
+        self.failures = 0
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+
+    def next_failure(self) -> int:
+        """HTTP status to fail the next request with, or 0 to serve it"""
+        with self._lock:
+            self.requests += 1
+            roll = self._random.random()
+            if roll >= self.failure_rate:
+                return 0
+            self.failures += 1
+            return 429 if roll < self.failure_rate / 2 else 500
+
+
+def completion_text(prompt: str, completion_tokens: int, json_mode: bool = False) -> str:
+    per_section = max(completion_tokens * CHARS_PER_TOKEN // len(SECTION_HEADERS), 40)
+    section_text = (FILLER * (per_section // len(FILLER) + 1))[:per_section]
+    if json_mode:
+        return json.dumps({key: f"- {section_text}" for key in SECTION_IDS})
+    if "plan" in prompt.lower():
+        return "".join(
+            f"## {n}. {header}\n- {section_text}\n\n"
+            for n, header in enumerate(SECTION_HEADERS, start=1)
+        )
+    size = completion_tokens * CHARS_PER_TOKEN
+    return (FILLER * (size // len(FILLER) + 1))[:size]
+
+
+def usage(prompt_tokens: int, text: str) -> Dict[str, int]:
+    completion_tokens = len(text) // CHARS_PER_TOKEN
+    return {
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "total_tokens": prompt_tokens + completion_tokens
+    }
+
+
+class FakeGroqHandler(BaseHTTPRequestHandler):
+    config: FakeGroqConfig = FakeGroqConfig()
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+        if not self.path.endswith("/chat/completions"):
+            return self.send_json(404, {"error": {"message": f"unknown path {self.path}"}})
+
+        status = self.config.next_failure()
+        if status == 429:
+            return self.send_json(
+                429, {"error": {"message": "Rate limit reached", "type": "tokens"}},
+                headers={"retry-after": f"{self.config.retry_after:g}"}
+            )
+        if status:
+            return self.send_json(500, {"error": {"message": "Injected server error"}})
+
+        messages = body.get("messages", [])
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // CHARS_PER_TOKEN
+        completion_tokens = min(body.get("max_tokens") or self.config.completion_tokens, self.config.completion_tokens)
+        json_mode = (body.get("response_format") or {}).get("type") in ("json_object", "json_schema")
+        text = completion_text(messages[-1].get("content", "") if messages else "", completion_tokens, json_mode)
+
+        time.sleep(self.config.latency)
+        if body.get("stream"):
+            self.stream(body, text, prompt_tokens)
+        else:
+            time.sleep(len(text) / CHARS_PER_TOKEN / self.config.tokens_per_second)
+            self.send_json(200, {
+                "id": "chatcmpl-fake",
+                "object": "chat.completion",
+                "created": int(time.time()),
+                "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+                "usage": usage(prompt_tokens, text)
+            })
+
+    def stream(self, body: Dict, text: str, prompt_tokens: int) -> None:
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        chunk_chars = TOKENS_PER_CHUNK * CHARS_PER_TOKEN
+        delay = TOKENS_PER_CHUNK / self.config.tokens_per_second
+        for start in range(0, len(text), chunk_chars):
+            self.send_event(self.chunk(body, {"content": text[start:start + chunk_chars]}))
+            time.sleep(delay)
+        final = self.chunk(body, {}, finish_reason="stop")
+        final["x_groq"] = {"id": "req-fake", "usage": usage(prompt_tokens, text)}
+        self.send_event(final)
+        self.write_chunk(b"data: [DONE]\n\n")
+        self.write_chunk(b"")
+
+    @staticmethod
+    def chunk(body: Dict, delta: Dict, finish_reason: str = None) -> Dict:
+        return {
+            "id": "chatcmpl-fake",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": body.get("model"),
+            "choices": [{"index": 0, "delta": delta, "finish_reason": finish_reason}]
+        }
+
+    def send_event(self, payload: Dict) -> None:
+        self.write_chunk(f"data: {json.dumps(payload)}\n\n".encode("utf-8"))
+
+    def write_chunk(self, data: bytes) -> None:
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_json(self, status: int, payload: Dict, headers: Dict[str, str] = None) -> None:
+        data = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(data)
+
+
+def start_server(config: FakeGroqConfig, port: int = 0) -> Tuple[ThreadingHTTPServer, str]:
+    """Serve in a daemon thread; returns the server and its base URL (port 0 picks a free port)"""
+    handler = type("ConfiguredFakeGroqHandler", (FakeGroqHandler,), {"config": config})
+    server = ThreadingHTTPServer(("127.0.0.1", port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument("--latency", type=float, default=0.2, help="seconds before the first token")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--completion-tokens", type=int, default=400, help="tokens per response (capped by max_tokens)")
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests failed with 429/500")
+    parser.add_argument("--retry-after", type=float, default=0.05, help="Retry-After seconds sent with 429s")
+    args = parser.parse_args()
+
+    config = FakeGroqConfig(
+        latency=args.latency,
+        tokens_per_second=args.tokens_per_second,
+        completion_tokens=args.completion_tokens,
+        failure_rate=args.failure_rate,
+        retry_after=args.retry_after
+    )
+    server, url = start_server(config, args.port)
+    print(f"Fake Groq API on {url} (Ctrl+C to stop)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,246 @@
+"""Load benchmark: the app's hot paths under N concurrent simulated sessions, against a fake Groq API
+
+Scenarios:
+    chat        streamed chat turns with a growing, token-windowed history (the call_groq_api path)
+    plan        streamed JSON account plans (generate_account_plan, as the plan job runs it)
+    enhance     section enhancements with unique content, so the memo cache misses
+    parse       parse_account_plan on messy plan text
+    export      text + JSON export of a parsed plan
+
+Each scenario reports throughput, p50/p95/p99 latency, errors and peak traced
+memory. Results can be saved as a baseline and later runs gated against it.
+
+Usage:
+    python benchmarks/load_bench.py --sessions 8 --iterations 5
+    python benchmarks/load_bench.py --failure-rate 0.1 --scenarios chat enhance
+    python benchmarks/load_bench.py --save-baseline benchmarks/baseline.json
+    python benchmarks/load_bench.py --baseline benchmarks/baseline.json --max-regression 0.25
+"""
+import argparse
+import json
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from typing import Callable, Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from groq import Groq  # noqa: E402
+
+from chat_history import build_history_window  # noqa: E402
+from fake_groq_server import FakeGroqConfig, start_server  # noqa: E402
+from groq_client import is_retryable_error, is_throttle_error, retry_after_seconds  # noqa: E402
+from parser_bench import messy_plan  # noqa: E402
+from plan_export import format_plan_json, format_plan_text  # noqa: E402
+from plan_parser import SECTION_TITLES, parse_account_plan  # noqa: E402
+from rate_limit import RateLimiter  # noqa: E402
+from research import ResearchPipeline, detect_account_plan_intent  # noqa: E402
+from response_cache import MemoryBackend, ResponseCache  # noqa: E402
+
+SCENARIOS = ("chat", "plan", "enhance", "parse", "export")
+
+# Scenario metrics compared against a baseline: name -> True if higher is better
+GATED_METRICS = {"throughput_per_second": True, "p95_ms": False, "p99_ms": False}
+
+
+def percentile(sorted_values: List[float], q: float) -> float:
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    index = min(len(sorted_values) - 1, max(0, int(round(q * len(sorted_values))) - 1))
+    return sorted_values[index]
+
+
+def make_pipeline(base_url: str, sessions: int) -> ResearchPipeline:
+    """Pipeline as the app builds it, with quota buckets off so only the fake server's speed matters"""
+    client = Groq(api_key="benchmark", base_url=base_url, max_retries=0)
+    rate_limiter = RateLimiter(
+        requests_per_minute=0,
+        tokens_per_minute=0,
+        is_retryable=is_retryable_error,
+        retry_after=retry_after_seconds,
+        is_throttle=is_throttle_error,
+        base_delay=0.05,
+        max_delay=1.0,
+        initial_concurrency=sessions,
+        max_concurrency=sessions
+    )
+    return ResearchPipeline(client, ResponseCache([MemoryBackend()]), rate_limiter=rate_limiter)
+
+
+def session_ops(scenario: str, pipeline: ResearchPipeline, session: int) -> Callable[[int], None]:
+    """One operation of a scenario for one simulated session; state lives in the closure"""
+    if scenario == "chat":
+        messages = []
+
+        def chat_turn(iteration: int) -> None:
+            prompt = f"Session {session} turn {iteration}: what is driving Company {session}'s growth this year?"
+            history, _ = build_history_window(messages, 6000, detect_account_plan_intent)
+            response = "".join(pipeline.chat(prompt, history, stream=True))
+            messages.extend([{"role": "user", "content": prompt}, {"role": "assistant", "content": response}])
+        return chat_turn
+
+    if scenario == "plan":
+        def plan(iteration: int) -> None:
+            # A new company each time, so the response cache misses
+            sections = []
+            _, plan_sections = pipeline.generate_account_plan(
+                f"Create an account plan for Company {session}-{iteration}",
+                on_section=lambda key, text: sections.append(key)
+            )
+            if len(plan_sections) != len(SECTION_TITLES) or len(sections) != len(SECTION_TITLES):
+                raise ValueError(f"incomplete plan: {len(plan_sections)} sections, {len(sections)} streamed")
+        return plan
+
+    if scenario == "enhance":
+        def enhance(iteration: int) -> None:
+            content = f"- Session {session} draft {iteration}: expand into the mid-market segment"
+            pipeline.enhance_section(content, "Opportunities & Recommendations")
+        return enhance
+
+    if scenario == "parse":
+        def parse(iteration: int) -> None:
+            parse_account_plan(messy_plan(session + iteration))
+        return parse
+
+    if scenario == "export":
+        plan = parse_account_plan(messy_plan(session))
+
+        def export(iteration: int) -> None:
+            format_plan_text(plan, datetime.now())
+            format_plan_json(plan)
+        return export
+
+    raise ValueError(f"unknown scenario {scenario}")
+
+
+def run_sessions(scenario: str, pipeline: ResearchPipeline, sessions: int, iterations: int) -> Dict:
+    latencies = []
+    errors = []
+    lock = threading.Lock()
+
+    def run_session(session: int) -> None:
+        op = session_ops(scenario, pipeline, session)
+        for iteration in range(iterations):
+            started = time.perf_counter()
+            try:
+                op(iteration)
+            except Exception as e:
+                with lock:
+                    errors.append(type(e).__name__)
+                continue
+            with lock:
+                latencies.append(time.perf_counter() - started)
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=sessions) as executor:
+        list(executor.map(run_session, range(sessions)))
+    elapsed = time.perf_counter() - started
+
+    latencies.sort()
+    return {
+        "operations": len(latencies),
+        "errors": len(errors),
+        "elapsed_seconds": round(elapsed, 3),
+        "throughput_per_second": round(len(latencies) / elapsed, 2) if elapsed else 0.0,
+        "p50_ms": round(percentile(latencies, 0.50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 0.95) * 1000, 2),
+        "p99_ms": round(percentile(latencies, 0.99) * 1000, 2)
+    }
+
+
+def run_scenario(scenario: str, base_url: str, sessions: int, iterations: int, trace_memory: bool) -> Dict:
+    """Timed pass, then (optionally) a second pass under tracemalloc so tracing does not skew latency"""
+    result = run_sessions(scenario, make_pipeline(base_url, sessions), sessions, iterations)
+    if trace_memory:
+        tracemalloc.start()
+        run_sessions(scenario, make_pipeline(base_url, sessions), sessions, iterations)
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        result["peak_memory_kb"] = round(peak / 1024, 1)
+    return result
+
+
+def compare(results: Dict, baseline: Dict, max_regression: float) -> List[str]:
+    """Descriptions of every gated metric that regressed beyond max_regression (a fraction)"""
+    regressions = []
+    for scenario, metrics in results.items():
+        base = baseline.get(scenario)
+        if not base:
+            continue
+        for name, higher_is_better in GATED_METRICS.items():
+            old, new = base.get(name), metrics.get(name)
+            if not old or new is None:
+                continue
+            change = (old - new) / old if higher_is_better else (new - old) / old
+            if change > max_regression:
+                regressions.append(f"{scenario}.{name}: {old} -> {new} ({change:+.0%} worse)")
+    return regressions
+
+
+def main(argv: List[str] = None) -> int:
+    parser = argparse.ArgumentParser(description="Benchmark the app's hot paths against a fake Groq API")
+    parser.add_argument("--scenarios", nargs="+", choices=SCENARIOS, default=list(SCENARIOS))
+    parser.add_argument("--sessions", type=int, default=8, help="concurrent simulated sessions")
+    parser.add_argument("--iterations", type=int, default=5, help="operations per session")
+    parser.add_argument("--latency", type=float, default=0.2, help="fake server seconds to first token")
+    parser.add_argument("--tokens-per-second", type=float, default=500.0)
+    parser.add_argument("--completion-tokens", type=int, default=400)
+    parser.add_argument("--failure-rate", type=float, default=0.0, help="fraction of requests failed with 429/500")
+    parser.add_argument("--base-url", help="use an already running server instead of starting one")
+    parser.add_argument("--no-memory", action="store_true", help="skip the tracemalloc pass")
+    parser.add_argument("--json", metavar="PATH", help="write results as JSON")
+    parser.add_argument("--save-baseline", metavar="PATH", help="write results as the new baseline")
+    parser.add_argument("--baseline", metavar="PATH", help="fail if results regress against this baseline")
+    parser.add_argument("--max-regression", type=float, default=0.2,
+                        help="allowed fractional regression of throughput and p95/p99 (default 0.2)")
+    args = parser.parse_args(argv)
+
+    server = None
+    base_url = args.base_url
+    if base_url is None:
+        server_config = FakeGroqConfig(
+            latency=args.latency,
+            tokens_per_second=args.tokens_per_second,
+            completion_tokens=args.completion_tokens,
+            failure_rate=args.failure_rate
+        )
+        server, base_url = start_server(server_config)
+
+    print(f"{args.sessions} sessions x {args.iterations} iterations against {base_url}\n")
+    print(f"{'scenario':<10}{'ops':>6}{'errors':>8}{'ops/s':>10}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}{'peak KB':>10}")
+    results = {}
+    for scenario in args.scenarios:
+        result = run_scenario(scenario, base_url, args.sessions, args.iterations, not args.no_memory)
+        results[scenario] = result
+        print(
+            f"{scenario:<10}{result['operations']:>6}{result['errors']:>8}{result['throughput_per_second']:>10}"
+            f"{result['p50_ms']:>10}{result['p95_ms']:>10}{result['p99_ms']:>10}{result.get('peak_memory_kb', '-'):>10}"
+        )
+    if server is not None:
+        server.shutdown()
+        print(f"\nFake server: {server_config.requests} requests, {server_config.failures} failures injected")
+
+    for path in (args.json, args.save_baseline):
+        if path:
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            regressions = compare(results, json.load(f), args.max_regression)
+        if regressions:
+            print("\nRegressions beyond the allowed threshold:")
+            for line in regressions:
+                print(f"  {line}")
+            return 1
+        print(f"\nNo regressions beyond {args.max_regression:.0%} against {args.baseline}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,203 @@
+"""Micro-benchmark: single-pass plan parser vs. the old nested marker scan
+
+Before timing, checks that parse_account_plan reads every messy_plan variant
+correctly, and that IncrementalPlanParser fed in random chunks agrees with
+parse_plan_json; exits with status 1 on a mismatch.
+
+Usage:
+    python benchmarks/parser_bench.py [--size-kb 100] [--repeat 20] [--seed 0]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import timeit
+from typing import Dict, List
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from plan_parser import SECTION_TITLES, IncrementalPlanParser, parse_account_plan, parse_plan_json  # noqa: E402
+
+# Header styles seen in real LLM output for the same plan
+HEADER_STYLES = [
+    "## {n}. {title}",
+    "### {title}",
+    "**{n}. {title}**",
+    "**{title}:**",
+    "{n}. {title}:",
+    "# {upper}",
+]
+
+BODY_LINES = [
+    "- **Revenue**: $4.2B (FY2024), up 12% year over year",
+    "The company is expanding into adjacent markets with a platform strategy.",
+    "- **Key Competitors**:",
+    "  - Competitor 1: larger install base, weaker analytics",
+    "",
+    "* Kubernetes migration is a stated 2025 priority for the platform team",
+    "Next steps: schedule discovery call with the VP of Engineering",
+    "- **Pain Points**: legacy ERP, fragmented data, long procurement cycles",
+]
+
+
+PREAMBLE = "Sure! Here's the comprehensive account plan you asked for."
+CLOSING = "Let me know if you'd like me to expand any section."
+
+# Every combination of header style and body rotation
+VARIANTS = len(HEADER_STYLES) * len(BODY_LINES)
+
+
+def section_lines(variant: int) -> List[str]:
+    return [BODY_LINES[(variant + i) % len(BODY_LINES)] for i in range(6)]
+
+
+def messy_plan(variant: int) -> str:
+    """One plan with a rotating header style, preamble and trailing chatter"""
+    lines = [PREAMBLE, ""]
+    for n, title in enumerate(SECTION_TITLES.values(), start=1):
+        style = HEADER_STYLES[(variant + n) % len(HEADER_STYLES)]
+        lines.append(style.format(n=n, title=title, upper=title.upper()))
+        lines.extend(section_lines(variant))
+        lines.append("")
+    lines.append(CLOSING)
+    return "\n".join(lines)
+
+
+def expected_sections(variant: int) -> Dict[str, str]:
+    """What parse_account_plan should return for messy_plan(variant)
+
+    Blank lines are dropped. The closing chatter cannot be told apart from the
+    last section's body, so it belongs to Next Steps.
+    """
+    body = "".join(line + "\n" for line in section_lines(variant) if line.strip())
+    sections = {key: body for key in SECTION_TITLES}
+    sections["next_steps"] += CLOSING + "\n"
+    return sections
+
+
+def json_plan(variant: int) -> str:
+    """The same plan as the JSON object plans are generated as, with characters that need escaping"""
+    body = "\n".join(section_lines(variant)) + '\n"Quoted" \\ tab\t, unicode caf\u00e9 \u2014 end'
+    return json.dumps({key: body for key in SECTION_TITLES}, ensure_ascii=variant % 2 == 0)
+
+
+def check_parsers(seed: int) -> List[str]:
+    """Mismatches between the parsers and the expected sections; empty when all is well"""
+    problems = []
+    for variant in range(VARIANTS):
+        parsed = parse_account_plan(messy_plan(variant))
+        for key, expected in expected_sections(variant).items():
+            if parsed.get(key) != expected:
+                problems.append(f"messy_plan({variant}): {key} is {parsed.get(key)!r}, expected {expected!r}")
+
+    rng = random.Random(seed)
+    for variant in range(VARIANTS):
+        text = json_plan(variant)
+        whole = parse_plan_json(text)
+        # Chunk sizes from 1 character up, so escapes and keys are split at every kind of boundary
+        for trial in range(5):
+            parser = IncrementalPlanParser()
+            completed = []
+            position = 0
+            while position < len(text):
+                size = rng.randint(1, 4 ** (trial % 4 + 1))
+                completed.extend(parser.feed(text[position:position + size]))
+                position += size
+            if parser.close() != whole:
+                problems.append(f"json_plan({variant}), trial {trial}: chunked close() differs from parse_plan_json")
+            if parser.sections != whole or sorted(completed) != sorted(whole):
+                problems.append(f"json_plan({variant}), trial {trial}: sections completed while streaming differ")
+    return problems
+
+
+def build_corpus(size_kb: int) -> str:
+    parts = []
+    size = 0
+    variant = 0
+    while size < size_kb * 1024:
+        plan = messy_plan(variant)
+        parts.append(plan)
+        size += len(plan) + 2
+        variant += 1
+    return "\n\n".join(parts)
+
+
+def legacy_parse_account_plan(text: str) -> Dict[str, str]:
+    """The nested marker scan parse_account_plan used before plan_parser"""
+    sections = {
+        "executive_summary": "",
+        "company_overview": "",
+        "business_model": "",
+        "market_position": "",
+        "recent_news": "",
+        "key_stakeholders": "",
+        "pain_points": "",
+        "opportunities": "",
+        "engagement_strategy": "",
+        "next_steps": ""
+    }
+    
+    section_markers = {
+        "Executive Summary": "executive_summary",
+        "Company Overview": "company_overview",
+        "Business Model": "business_model",
+        "Market Position": "market_position",
+        "Recent News": "recent_news",
+        "Key Stakeholders": "key_stakeholders",
+        "Pain Points": "pain_points",
+        "Opportunities": "opportunities",
+        "Engagement Strategy": "engagement_strategy",
+        "Next Steps": "next_steps"
+    }
+    
+    current_section = None
+    lines = text.split("\n")
+    
+    for line in lines:
+        line_stripped = line.strip()
+        
+        for marker, section_key in section_markers.items():
+            if marker.lower() in line_stripped.lower() and (
+                line_stripped.startswith("#") or 
+                line_stripped.startswith("**") or 
+                ":" in line_stripped
+            ):
+                current_section = section_key
+                break
+        
+        if current_section and line_stripped:
+            if not any(marker.lower() in line_stripped.lower() for marker in section_markers.keys()):
+                sections[current_section] += line + "\n"
+    
+    return sections
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--size-kb", type=int, default=100)
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0, help="seed for the random chunk sizes")
+    args = parser.parse_args()
+
+    problems = check_parsers(args.seed)
+    if problems:
+        print("Parser output does not match:")
+        for line in problems:
+            print(f"  {line}")
+        return 1
+    print(f"checked:            {VARIANTS} messy plans, {VARIANTS * 5} chunked JSON streams")
+
+    text = build_corpus(args.size_kb)
+    legacy = min(timeit.repeat(lambda: legacy_parse_account_plan(text), number=1, repeat=args.repeat))
+    current = min(timeit.repeat(lambda: parse_account_plan(text), number=1, repeat=args.repeat))
+
+    print(f"corpus:            {len(text) / 1024:.0f} KB, {text.count(chr(10)) + 1} lines")
+    print(f"legacy nested scan: {legacy * 1000:8.2f} ms")
+    print(f"single-pass regex:  {current * 1000:8.2f} ms")
+    print(f"speedup:            {legacy / current:8.1f}x")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,112 @@
+"""Token-budgeted windowing of the chat history sent with each Groq request"""
+import math
+from typing import Callable, Dict, List, Optional, Tuple
+
+# Rough characters-per-token ratio for English text on Llama tokenizers
+CHARS_PER_TOKEN = 4
+
+# Tokens charged per message for role and formatting overhead
+MESSAGE_OVERHEAD_TOKENS = 4
+
+PLAN_SUMMARY_PREFIX = "[Earlier account plan, summarized to save context]"
+
+
+def estimate_tokens(text: str) -> int:
+    """Cheap token estimate without loading a tokenizer"""
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def message_tokens(message: Dict) -> int:
+    return estimate_tokens(message["content"]) + MESSAGE_OVERHEAD_TOKENS
+
+
+def summarize_plan(text: str, max_line_chars: int = 100) -> str:
+    """Reduce an account plan to its section headers plus the first line of each section"""
+    summary = [PLAN_SUMMARY_PREFIX]
+    lines = [line.strip() for line in text.split("\n") if line.strip()]
+    for index, line in enumerate(lines):
+        if not line.startswith("#"):
+            continue
+        summary.append(line)
+        if index + 1 < len(lines) and not lines[index + 1].startswith("#"):
+            first_line = lines[index + 1]
+            if len(first_line) > max_line_chars:
+                first_line = first_line[:max_line_chars].rstrip() + "..."
+            summary.append(first_line)
+    return "\n".join(summary)
+
+
+def summarize_dropped_turns(messages: List[Dict], max_chars: int = 80) -> Optional[Dict]:
+    """One-message recap of the user questions that fell out of the window"""
+    questions = []
+    for message in messages:
+        if message["role"] != "user":
+            continue
+        question = " ".join(message["content"].split())
+        if len(question) > max_chars:
+            question = question[:max_chars].rstrip() + "..."
+        questions.append(f'"{question}"')
+    if not questions:
+        return None
+    return {
+        "role": "system",
+        "content": "Earlier in this conversation (omitted to save context) the user asked: " + "; ".join(questions)
+    }
+
+
+def build_history_window(
+    messages: List[Dict],
+    budget_tokens: int,
+    is_plan: Callable[[str], bool],
+    keep_recent: int = 2
+) -> Tuple[List[Dict], Dict[str, int]]:
+    """Fit the chat history into a token budget
+
+    Stale account plans (every plan except the most recent one) are replaced by
+    summaries, then the oldest turns are dropped until the rest fits. The last
+    keep_recent messages are always kept. Returns the windowed history and
+    token statistics for the request.
+    """
+    history = [{"role": m["role"], "content": m["content"]} for m in messages]
+    original_tokens = sum(message_tokens(m) for m in history)
+
+    plan_indexes = [i for i, m in enumerate(history) if m["role"] == "assistant" and is_plan(m["content"])]
+    summarized_plans = 0
+    for i in plan_indexes[:-1]:
+        history[i]["content"] = summarize_plan(history[i]["content"])
+        summarized_plans += 1
+
+    # Walk back from the newest message, keeping whatever fits
+    kept = []
+    used = 0
+    for position, message in enumerate(reversed(history)):
+        tokens = message_tokens(message)
+        if position >= keep_recent and used + tokens > budget_tokens:
+            # The latest plan gets one more chance in summarized form
+            if (message["role"] == "assistant"
+                    and not message["content"].startswith(PLAN_SUMMARY_PREFIX)
+                    and is_plan(message["content"])):
+                message = {"role": "assistant", "content": summarize_plan(message["content"])}
+                tokens = message_tokens(message)
+                summarized_plans += 1
+            if used + tokens > budget_tokens:
+                break
+        kept.append(message)
+        used += tokens
+    kept.reverse()
+
+    dropped = history[:len(history) - len(kept)]
+    if dropped:
+        recap = summarize_dropped_turns(dropped)
+        if recap and used + message_tokens(recap) <= budget_tokens:
+            kept.insert(0, recap)
+            used += message_tokens(recap)
+
+    stats = {
+        "original_tokens": original_tokens,
+        "window_tokens": used,
+        "saved_tokens": max(original_tokens - used, 0),
+        "dropped_messages": len(dropped),
+        "summarized_plans": summarized_plans
+    }
+    return kept, stats
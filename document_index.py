@@ -0,0 +1,285 @@
+"""Retrieval over a local folder of reference documents (10-Ks, press releases, CRM notes)
+
+Documents are split into chunks and full-text indexed (SQLite FTS5, BM25
+ranking). The folder is rescanned incrementally, on a background thread:
+only files whose size or modification time changed are re-chunked, and
+deleted files are dropped. Excerpts are injected as authoritative context,
+so retrieval favours precision: when the company is known every excerpt must
+mention it and at least one other content word of the query, otherwise every
+content word of the query must match.
+"""
+import html
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, Iterator, List, NamedTuple, Optional
+
+from chat_history import estimate_tokens
+from plan_store import company_key, query_terms
+
+SUPPORTED_EXTENSIONS = (".txt", ".md", ".markdown", ".csv", ".html", ".htm")
+
+_TAG = re.compile(r"<(script|style)\b.*?</\1>|<[^>]+>", re.IGNORECASE | re.DOTALL)
+_PARAGRAPH_BREAK = re.compile(r"\n\s*\n")
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+# Request wording that says what to do with the documents, not what to look for in them
+REQUEST_TERMS = frozenset({
+    "create", "generate", "build", "write", "make", "draft", "prepare", "account", "plan", "plans",
+    "research", "tell", "about", "give", "show", "please", "company", "companies", "know"
+})
+
+
+class Chunk(NamedTuple):
+    path: str
+    ordinal: int
+    content: str
+    score: float = 0.0
+
+    @property
+    def tokens(self) -> int:
+        return estimate_tokens(self.content)
+
+
+def read_document(path: str) -> str:
+    """Plain text of a supported document; HTML tags are stripped"""
+    with open(path, encoding="utf-8", errors="replace") as f:
+        text = f.read()
+    if path.lower().endswith((".html", ".htm")):
+        text = html.unescape(_TAG.sub(" ", text))
+    return text
+
+
+def chunk_text(text: str, chunk_tokens: int = 300) -> List[str]:
+    """Split text into chunks of about chunk_tokens, on paragraph and then sentence boundaries"""
+    pieces = []
+    for paragraph in _PARAGRAPH_BREAK.split(text):
+        paragraph = " ".join(paragraph.split())
+        if not paragraph:
+            continue
+        if estimate_tokens(paragraph) <= chunk_tokens:
+            pieces.append(paragraph)
+        else:
+            pieces.extend(_SENTENCE_END.split(paragraph))
+
+    chunks = []
+    current = []
+    current_tokens = 0
+    for piece in pieces:
+        piece_tokens = estimate_tokens(piece)
+        if current and current_tokens + piece_tokens > chunk_tokens:
+            chunks.append(" ".join(current))
+            current, current_tokens = [], 0
+        # A single sentence longer than a chunk is cut at the character limit
+        while piece_tokens > chunk_tokens:
+            cut = chunk_tokens * 4
+            chunks.append(piece[:cut])
+            piece = piece[cut:]
+            piece_tokens = estimate_tokens(piece)
+        if piece:
+            current.append(piece)
+            current_tokens += piece_tokens
+    if current:
+        chunks.append(" ".join(current))
+    return chunks
+
+
+def select_within_budget(chunks: List[Chunk], budget_tokens: int) -> List[Chunk]:
+    """Best-ranked chunks, in rank order, that fit together in budget_tokens"""
+    selected = []
+    used = 0
+    for chunk in chunks:
+        if used + chunk.tokens > budget_tokens:
+            continue
+        selected.append(chunk)
+        used += chunk.tokens
+    return selected
+
+
+def retrieval_match(query: str, company: Optional[str] = None) -> Optional[str]:
+    """FTS5 MATCH expression for retrieving reference excerpts, or None if the query has nothing to look for
+
+    With a company, excerpts must mention it and at least one of the query's other
+    content words, so a query that names only the company retrieves nothing; without
+    one, every content word must match.
+    """
+    terms = [term for term in query_terms(query) if term not in REQUEST_TERMS]
+    if company:
+        company_words = query_terms(company_key(company))
+        if company_words:
+            others = [f'"{term}"' for term in terms if term not in company_words]
+            if not others:
+                return None
+            return '"' + " ".join(company_words) + f'" AND ({" OR ".join(others)})'
+    return " AND ".join(f'"{term}"' for term in terms) if terms else None
+
+
+def format_reference_context(chunks: List[Chunk]) -> str:
+    return "\n\n".join(
+        f"[{index}] Source: {chunk.path} (excerpt {chunk.ordinal + 1})\n{chunk.content}"
+        for index, chunk in enumerate(chunks, start=1)
+    )
+
+
+class DocumentIndex:
+    """Chunked full-text index over the documents under root
+
+    Search results scoring below min_relative_score times the best result's
+    BM25 score are dropped as weak matches. retrieve() never scans the folder
+    itself: when a rescan is due it starts one on a background thread.
+    """
+
+    def __init__(
+        self,
+        root: str,
+        path: str,
+        chunk_tokens: int = 300,
+        refresh_interval: float = 30.0,
+        min_relative_score: float = 0.3
+    ):
+        self.root = root
+        self.chunk_tokens = chunk_tokens
+        self.refresh_interval = refresh_interval
+        self.min_relative_score = min_relative_score
+        self._refreshed_at = 0.0
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS documents (
+                path TEXT PRIMARY KEY,
+                mtime REAL NOT NULL,
+                size INTEGER NOT NULL
+            );
+            CREATE TABLE IF NOT EXISTS chunks (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                path TEXT NOT NULL,
+                ordinal INTEGER NOT NULL,
+                content TEXT NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_chunks_path ON chunks(path);
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS chunks_fts USING fts5(
+                content, content='chunks', content_rowid='id', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_insert AFTER INSERT ON chunks BEGIN
+                INSERT INTO chunks_fts(rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chunks_fts_delete AFTER DELETE ON chunks BEGIN
+                INSERT INTO chunks_fts(chunks_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+            """
+        )
+        self._conn.commit()
+
+    def _scan(self) -> Iterator[str]:
+        for directory, _, files in os.walk(self.root):
+            for name in files:
+                if name.lower().endswith(SUPPORTED_EXTENSIONS) and not name.startswith("."):
+                    yield os.path.join(directory, name)
+
+    def refresh(self) -> Dict[str, int]:
+        """Re-chunk new and changed files and drop deleted ones; returns counts of each
+
+        Files are read and chunked outside the connection lock, so searches run during a rescan.
+        """
+        with self._refresh_lock:
+            with self._lock:
+                known = {
+                    row[0]: (row[1], row[2])
+                    for row in self._conn.execute("SELECT path, mtime, size FROM documents")
+                }
+            seen = set()
+            changed = 0
+            for file_path in self._scan():
+                path = os.path.relpath(file_path, self.root)
+                seen.add(path)
+                try:
+                    stat = os.stat(file_path)
+                    if known.get(path) == (stat.st_mtime, stat.st_size):
+                        continue
+                    chunks = chunk_text(read_document(file_path), self.chunk_tokens)
+                except OSError:
+                    continue
+                with self._lock, self._conn:
+                    self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                    self._conn.executemany(
+                        "INSERT INTO chunks (path, ordinal, content) VALUES (?, ?, ?)",
+                        [(path, ordinal, content) for ordinal, content in enumerate(chunks)]
+                    )
+                    self._conn.execute(
+                        "INSERT OR REPLACE INTO documents (path, mtime, size) VALUES (?, ?, ?)",
+                        (path, stat.st_mtime, stat.st_size)
+                    )
+                changed += 1
+
+            removed = [path for path in known if path not in seen]
+            with self._lock, self._conn:
+                for path in removed:
+                    self._conn.execute("DELETE FROM chunks WHERE path = ?", (path,))
+                    self._conn.execute("DELETE FROM documents WHERE path = ?", (path,))
+            self._refreshed_at = time.monotonic()
+        return {"changed": changed, "removed": len(removed)}
+
+    def search(self, query: str, limit: int = 20, company: Optional[str] = None) -> List[Chunk]:
+        """Chunks ranked by BM25 relevance to query (see retrieval_match), without weak matches"""
+        match = retrieval_match(query, company)
+        if match is None:
+            return []
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT c.path, c.ordinal, c.content, bm25(chunks_fts) AS score
+                   FROM chunks_fts JOIN chunks c ON c.id = chunks_fts.rowid
+                   WHERE chunks_fts MATCH ?
+                   ORDER BY score LIMIT ?""",
+                (match, limit)
+            ).fetchall()
+        if not rows:
+            return []
+        # bm25() is negative, more negative for better matches
+        cutoff = rows[0][3] * self.min_relative_score
+        return [Chunk(*row) for row in rows if row[3] <= cutoff]
+
+    def retrieve(self, query: str, budget_tokens: int, top_k: int = 6, company: Optional[str] = None) -> List[Chunk]:
+        """Up to top_k most relevant chunks that fit in budget_tokens; starts a background rescan if due"""
+        self.refresh_if_due()
+        return select_within_budget(self.search(query, limit=top_k, company=company), budget_tokens)
+
+    def refresh_if_due(self) -> None:
+        """Start a refresh on a daemon thread if refresh_interval has passed and none is running"""
+        with self._lock:
+            if time.monotonic() - self._refreshed_at <= self.refresh_interval or self._refresh_lock.locked():
+                return
+            # Claimed now, so concurrent requests do not start a rescan each
+            self._refreshed_at = time.monotonic()
+        threading.Thread(target=self.refresh, name="document-index-refresh", daemon=True).start()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            documents = self._conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+            chunks = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+        return {"documents": documents, "chunks": chunks}
+
+
+def document_index_from_env() -> Optional[DocumentIndex]:
+    """Index over DOCUMENTS_PATH (default documents/), brought up to date, or None if that folder does not exist"""
+    root = os.getenv("DOCUMENTS_PATH", "documents")
+    if not root or not os.path.isdir(root):
+        return None
+    index = DocumentIndex(
+        root,
+        os.getenv("DOCUMENT_INDEX_PATH", ".cache/documents.sqlite3"),
+        chunk_tokens=int(os.getenv("DOCUMENT_CHUNK_TOKENS", "300")),
+        refresh_interval=float(os.getenv("DOCUMENT_REFRESH_SECONDS", "30")),
+        min_relative_score=float(os.getenv("DOCUMENT_MIN_RELATIVE_SCORE", "0.3"))
+    )
+    index.refresh()
+    return index
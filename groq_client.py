@@ -0,0 +1,147 @@
+"""Groq client construction with pooled HTTP connections and an asyncio request path"""
+import asyncio
+import os
+import queue
+import threading
+from concurrent.futures import Future
+from typing import Any, AsyncIterator, Awaitable, Dict, Hashable, Iterator, Optional, Tuple
+
+import httpx
+from groq import APIConnectionError, APIStatusError, AsyncGroq, Groq
+
+
+def http_timeout() -> httpx.Timeout:
+    """Request timeouts; the read timeout has to cover a full 8k-token completion"""
+    return httpx.Timeout(
+        float(os.getenv("GROQ_TIMEOUT_SECONDS", "120")),
+        connect=float(os.getenv("GROQ_CONNECT_TIMEOUT_SECONDS", "5"))
+    )
+
+
+def http_limits() -> httpx.Limits:
+    """Connection pool size and keep-alive policy shared by every session"""
+    return httpx.Limits(
+        max_connections=int(os.getenv("GROQ_MAX_CONNECTIONS", "20")),
+        max_keepalive_connections=int(os.getenv("GROQ_KEEPALIVE_CONNECTIONS", "10")),
+        keepalive_expiry=float(os.getenv("GROQ_KEEPALIVE_EXPIRY_SECONDS", "30"))
+    )
+
+
+def async_enabled() -> bool:
+    return os.getenv("GROQ_ASYNC", "false").lower() in ("1", "true", "yes")
+
+
+def is_retryable_error(error: Exception) -> bool:
+    """Throttling, server errors, timeouts and dropped connections are worth retrying"""
+    if isinstance(error, APIConnectionError):  # includes APITimeoutError
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 429) or error.status_code >= 500
+    return False
+
+
+def is_throttle_error(error: Exception) -> bool:
+    return isinstance(error, APIStatusError) and error.status_code == 429
+
+
+def retry_after_seconds(error: Exception) -> Optional[float]:
+    """Seconds from the Retry-After header of a failed response, if it sent one"""
+    if not isinstance(error, APIStatusError):
+        return None
+    value = error.response.headers.get("retry-after")
+    try:
+        return max(float(value), 0.0) if value is not None else None
+    except ValueError:
+        return None
+
+
+def make_sync_client(api_key: str) -> Groq:
+    """Synchronous client over a keep-alive connection pool
+
+    SDK retries are disabled; rate_limit.RateLimiter retries with shared backoff instead.
+    """
+    timeout = http_timeout()
+    return Groq(
+        api_key=api_key,
+        timeout=timeout,
+        max_retries=0,
+        http_client=httpx.Client(limits=http_limits(), timeout=timeout)
+    )
+
+
+class AsyncGroqRunner:
+    """Owns an event loop thread and an AsyncGroq client bound to that loop
+
+    Script threads hand coroutines to the loop, so every session shares one
+    pooled AsyncClient and waiting on the network costs no extra threads.
+    """
+
+    def __init__(self, api_key: str):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self.loop.run_forever, name="groq-async-loop", daemon=True)
+        self._thread.start()
+        # httpx.AsyncClient must be created and used on the loop that drives it
+        self.client: AsyncGroq = self.run(self._make_client(api_key))
+
+    async def _make_client(self, api_key: str) -> AsyncGroq:
+        timeout = http_timeout()
+        return AsyncGroq(
+            api_key=api_key,
+            timeout=timeout,
+            max_retries=0,
+            http_client=httpx.AsyncClient(limits=http_limits(), timeout=timeout)
+        )
+
+    def submit(self, coro: Awaitable) -> Future:
+        """Schedule a coroutine on the loop and return a concurrent.futures.Future"""
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Awaitable) -> Any:
+        """Run a coroutine on the loop and block the calling thread for its result"""
+        return self.submit(coro).result()
+
+    def gather(
+        self, coros: Dict[Hashable, Awaitable], limit: int
+    ) -> Iterator[Tuple[Hashable, Any, Optional[Exception]]]:
+        """Run coroutines concurrently on the loop, at most limit at a time, from a synchronous caller
+
+        Yields (key, result, error) as each finishes. The caller's thread is the
+        only one blocked; stopping the iteration early cancels what is left.
+        """
+        finished = queue.Queue()
+
+        async def run_one(key: Hashable, coro: Awaitable, semaphore: asyncio.Semaphore) -> None:
+            async with semaphore:
+                try:
+                    finished.put((key, await coro, None))
+                except Exception as e:
+                    finished.put((key, None, e))
+
+        async def run_all() -> None:
+            semaphore = asyncio.Semaphore(limit)
+            await asyncio.gather(*(run_one(key, coro, semaphore) for key, coro in coros.items()))
+
+        future = self.submit(run_all())
+        try:
+            for _ in coros:
+                yield finished.get()
+        finally:
+            future.cancel()
+
+    def iterate(self, stream: AsyncIterator) -> Iterator:
+        """Consume an async iterator (e.g. a streamed completion) from a synchronous caller"""
+        iterator = stream.__aiter__()
+
+        async def next_item():
+            return await iterator.__anext__()
+
+        while True:
+            try:
+                yield self.run(next_item())
+            except StopAsyncIteration:
+                return
+
+    def close(self) -> None:
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join(timeout=5)
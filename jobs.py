@@ -0,0 +1,201 @@
+"""Background jobs: long Groq calls run on a worker pool instead of a Streamlit script thread
+
+Job records (status, progress, result) are kept in SQLite, so any rerun, page
+reload or replica sharing the database can poll them by id or session. The
+work itself runs in the process that accepted the job; a job that stops
+reporting for stale_after seconds (e.g. its process died) is reported as failed.
+Low-priority jobs run on their own small pool and only start while no
+interactive job is running.
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+ACTIVE_STATUSES = (QUEUED, RUNNING)
+
+# report(progress, message, partial=None) lets a job publish a 0..1 progress fraction, a status line
+# and, optionally, a partial result that pollers can show before the job is done
+ProgressFn = Callable[..., None]
+
+
+class JobCancelled(Exception):
+    """Raised by report() once the job has been cancelled, to stop it at its next progress report"""
+
+
+class JobQueue:
+    """Worker pool plus a job table, shared by every session on this server"""
+
+    def __init__(self, path: str, max_workers: int = 4, stale_after: float = 900.0, low_priority_workers: int = 1):
+        self.stale_after = stale_after
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="job")
+        self._low_priority_executor = ThreadPoolExecutor(
+            max_workers=low_priority_workers, thread_name_prefix="job-low"
+        )
+        # Interactive jobs queued or running in this process; low-priority jobs wait for it to reach 0
+        self._interactive = 0
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS jobs (
+                id TEXT PRIMARY KEY,
+                kind TEXT NOT NULL,
+                session_id TEXT NOT NULL,
+                description TEXT NOT NULL,
+                status TEXT NOT NULL,
+                progress REAL NOT NULL DEFAULT 0,
+                message TEXT NOT NULL DEFAULT '',
+                result TEXT,
+                error TEXT,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_jobs_session ON jobs(session_id, created_at)")
+        self._conn.commit()
+
+    def submit(
+        self,
+        kind: str,
+        session_id: str,
+        fn: Callable[[ProgressFn], Optional[Dict]],
+        description: str = "",
+        low_priority: bool = False
+    ) -> str:
+        """Queue fn(report) on the worker pool and return the job id
+
+        fn must not call Streamlit; whatever it returns (JSON-serializable) becomes the job result.
+        """
+        job_id = uuid.uuid4().hex
+        now = time.time()
+        with self._lock, self._conn:
+            self._conn.execute(
+                """INSERT INTO jobs (id, kind, session_id, description, status, created_at, updated_at)
+                   VALUES (?, ?, ?, ?, ?, ?, ?)""",
+                (job_id, kind, session_id, description, QUEUED, now, now)
+            )
+            if not low_priority:
+                self._interactive += 1
+        if low_priority:
+            self._low_priority_executor.submit(self._run_low_priority, job_id, fn)
+        else:
+            self._executor.submit(self._run_interactive, job_id, fn)
+        return job_id
+
+    def cancel(self, job_id: str) -> bool:
+        """Cancel a queued or running job; a running one stops at its next progress report
+
+        A result that arrives after cancellation is discarded. Returns whether the job was still active.
+        """
+        with self._lock, self._conn:
+            return self._conn.execute(
+                f"UPDATE jobs SET status = ?, updated_at = ? WHERE id = ? AND status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})",
+                (CANCELLED, time.time(), job_id, *ACTIVE_STATUSES)
+            ).rowcount > 0
+
+    def _cancelled(self, job_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT status FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return row is not None and row[0] == CANCELLED
+
+    def _update(self, job_id: str, **fields) -> bool:
+        """Update a job unless it has been cancelled; returns whether it was updated"""
+        fields["updated_at"] = time.time()
+        assignments = ", ".join(f"{name} = ?" for name in fields)
+        with self._lock, self._conn:
+            return self._conn.execute(
+                f"UPDATE jobs SET {assignments} WHERE id = ? AND status != ?", (*fields.values(), job_id, CANCELLED)
+            ).rowcount > 0
+
+    def _run_interactive(self, job_id: str, fn: Callable[[ProgressFn], Optional[Dict]]) -> None:
+        try:
+            self._run(job_id, fn)
+        finally:
+            with self._lock:
+                self._interactive -= 1
+
+    def _run_low_priority(self, job_id: str, fn: Callable[[ProgressFn], Optional[Dict]]) -> None:
+        # Yield to interactive jobs, so background work never delays them
+        while self._interactive:
+            if self._cancelled(job_id):
+                return
+            time.sleep(0.5)
+        self._run(job_id, fn)
+
+    def _run(self, job_id: str, fn: Callable[[ProgressFn], Optional[Dict]]) -> None:
+        if not self._update(job_id, status=RUNNING):
+            return
+
+        def report(progress: float, message: str, partial: Optional[Dict] = None) -> None:
+            fields = {"progress": progress, "message": message}
+            if partial is not None:
+                fields["result"] = json.dumps(partial)
+            if not self._update(job_id, **fields):
+                raise JobCancelled(job_id)
+
+        try:
+            result = fn(report)
+        except JobCancelled:
+            return
+        except Exception as e:
+            self._update(job_id, status=FAILED, error=str(e) or type(e).__name__)
+            return
+        self._update(job_id, status=DONE, progress=1.0, result=json.dumps(result))
+
+    def _job(self, row) -> Dict:
+        job = dict(zip(
+            ("id", "kind", "session_id", "description", "status", "progress", "message",
+             "result", "error", "created_at", "updated_at"),
+            row
+        ))
+        job["result"] = json.loads(job["result"]) if job["result"] else None
+        if job["status"] in ACTIVE_STATUSES and time.time() - job["updated_at"] > self.stale_after:
+            job["status"] = FAILED
+            job["error"] = "Job was interrupted (no progress reported); please try again"
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+        return self._job(row) if row else None
+
+    def for_session(self, session_id: str, active_only: bool = False) -> List[Dict]:
+        """Jobs of a session, oldest first"""
+        query = "SELECT * FROM jobs WHERE session_id = ?"
+        if active_only:
+            query += f" AND status IN ({', '.join('?' for _ in ACTIVE_STATUSES)})"
+        with self._lock:
+            rows = self._conn.execute(
+                query + " ORDER BY created_at", (session_id, *(ACTIVE_STATUSES if active_only else ()))
+            ).fetchall()
+        jobs = [self._job(row) for row in rows]
+        # _job reports stale active jobs as failed
+        return [job for job in jobs if job["status"] in ACTIVE_STATUSES] if active_only else jobs
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            rows = self._conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status").fetchall()
+        return dict(rows)
+
+
+def job_queue_from_env() -> JobQueue:
+    return JobQueue(
+        os.getenv("JOB_STORE_PATH", ".cache/jobs.sqlite3"),
+        max_workers=int(os.getenv("JOB_WORKERS", "4")),
+        stale_after=float(os.getenv("JOB_STALE_SECONDS", "900")),
+        low_priority_workers=int(os.getenv("JOB_LOW_PRIORITY_WORKERS", "1"))
+    )
@@ -1,11 +1,25 @@
 import streamlit as st
-from groq import Groq
-import json
 from datetime import datetime
 import os
-import traceback
-from typing import List, Dict
+import re
+import time
+import uuid
+from typing import Dict, List, Iterator, Union, Optional
 from dotenv import load_dotenv
+from response_cache import ResponseCache, cache_from_env
+from groq_client import AsyncGroqRunner, make_sync_client, async_enabled, is_retryable_error, is_throttle_error, retry_after_seconds
+from rate_limit import limiter_from_env
+from chat_history import build_history_window
+from document_index import document_index_from_env
+from jobs import DONE, JobQueue, job_queue_from_env
+from plan_parser import SECTION_TITLES, align_sections
+from plan_store import PlanStore
+from session_store import ResearchSession, SessionStore, session_store_from_env
+from speculation import SPECULATIVE_PLAN, Speculator, speculator_from_env
+from research import (
+    ROUTES, ResearchPipeline, classify_turn, detect_account_plan_intent, detect_company, format_plan_markdown,
+    split_company_list
+)
 
 # Load environment variables
 load_dotenv()
@@ -17,21 +31,27 @@ st.set_page_config(
     layout="wide"
 )
 
-# Initialize session state
-if "messages" not in st.session_state:
-    st.session_state.messages = []
-if "account_plan" not in st.session_state:
-    st.session_state.account_plan = None
-if "research_notes" not in st.session_state:
-    st.session_state.research_notes = []
-if "chat_history" not in st.session_state:
-    st.session_state.chat_history = []
+SESSION_ID_PATTERN = re.compile(r"[0-9a-f]{32}")
+
+# Initialize session state; the conversation and plan live in the session store, keyed by session_id
 if "voice_mode" not in st.session_state:
     st.session_state.voice_mode = False
 if "voice_component_key" not in st.session_state:
     st.session_state.voice_component_key = 0
 if "voice_transcript" not in st.session_state:
     st.session_state.voice_transcript = ""
+if "parallel_plan_mode" not in st.session_state:
+    st.session_state.parallel_plan_mode = False
+if "comparison" not in st.session_state:
+    st.session_state.comparison = None
+if "watched_jobs" not in st.session_state:
+    st.session_state.watched_jobs = set()
+if "session_id" not in st.session_state:
+    # Carried in the URL, so a reload or a reconnect to another replica resumes the same session
+    requested_session = st.query_params.get("session", "")
+    st.session_state.session_id = requested_session if SESSION_ID_PATTERN.fullmatch(requested_session) else uuid.uuid4().hex
+if st.query_params.get("session") != st.session_state.session_id:
+    st.query_params["session"] = st.session_state.session_id
 
 # Custom CSS
 st.markdown("""
@@ -118,297 +138,480 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Initialize Groq client
-@st.cache_resource
-def get_groq_client():
+def get_groq_api_key() -> str:
     api_key = os.getenv("GROQ_API_KEY")
     if not api_key:
         st.error("⚠️ GROQ_API_KEY not found in environment variables!")
         st.info("Please add your GROQ_API_KEY to the .env file")
         st.info("Get a FREE API key at: https://console.groq.com/")
         st.stop()
-    return Groq(api_key=api_key)
+    return api_key
 
-client = get_groq_client()
+@st.cache_resource
+def get_groq_client():
+    return make_sync_client(get_groq_api_key())
 
-# System prompt
-SYSTEM_PROMPT = """You are an expert Company Research Assistant specialized in gathering business intelligence and creating comprehensive account plans for B2B sales and business development teams.
+@st.cache_resource
+def get_async_groq_runner():
+    """Event loop + AsyncGroq client shared by every session (GROQ_ASYNC=true)"""
+    return AsyncGroqRunner(get_groq_api_key())
 
-Your capabilities include:
-1. Conducting thorough company research and analysis based on your knowledge
-2. Analyzing company financials, market position, competitors, and strategic initiatives
-3. Identifying key decision-makers and stakeholders
-4. Generating structured account plans with actionable insights
-5. Providing research updates and asking clarifying questions
+# Response cache shared by every session on this server
+@st.cache_resource
+def get_response_cache() -> ResponseCache:
+    return cache_from_env()
 
-When a user seems confused or unclear, ask specific clarifying questions.
-When a user provides clear requirements, respond efficiently and directly.
-When a user goes off-topic, gently redirect them back to company research.
-Handle edge cases gracefully by explaining limitations and offering alternatives.
+# Groq calls behind the response cache, shared by every session on this server
+@st.cache_resource
+def get_research_pipeline() -> ResearchPipeline:
+    async_runner = get_async_groq_runner() if async_enabled() else None
+    rate_limiter = limiter_from_env(
+        is_retryable=is_retryable_error,
+        retry_after=retry_after_seconds,
+        is_throttle=is_throttle_error
+    )
+    return ResearchPipeline(
+        get_groq_client(),
+        get_response_cache(),
+        async_runner=async_runner,
+        rate_limiter=rate_limiter,
+        document_index=document_index_from_env()
+    )
 
-When generating account plans, you MUST use this EXACT format with clear section headers and comprehensive content:
+response_cache = get_response_cache()
+pipeline = get_research_pipeline()
 
-## 1. Executive Summary
-[2-3 paragraphs summarizing the company and key opportunities]
+# Saved account plans, shared by every session on this server
+@st.cache_resource
+def get_plan_store() -> PlanStore:
+    return PlanStore(os.getenv("PLAN_STORE_PATH", "data/account_plans.sqlite3"))
 
-## 2. Company Overview
-- **Industry**: [industry name]
-- **Founded**: [year]
-- **Headquarters**: [location]
-- **Revenue**: [annual revenue]
-- **Employees**: [number]
-- **Market Cap/Valuation**: [if public]
+plan_store = get_plan_store()
 
-## 3. Business Model & Products/Services
-- **Primary Business Model**: [description]
-- **Key Products/Services**:
-  - Product 1: [description]
-  - Product 2: [description]
-- **Revenue Streams**: [description]
-- **Target Markets**: [description]
+# Conversations and plans of every session on this server; idle ones are spilled to disk.
+# The search index drops a session's chat messages when the session expires
+@st.cache_resource
+def get_session_store() -> SessionStore:
+    return session_store_from_env(on_expire=plan_store.delete_messages)
 
-## 4. Market Position & Competitors
-- **Market Position**: [leader/challenger/niche]
-- **Market Share**: [percentage if known]
-- **Key Competitors**:
-  - Competitor 1: [comparison]
-  - Competitor 2: [comparison]
-- **Competitive Advantages**: [list]
+session_store = get_session_store()
 
-## 5. Recent News & Strategic Initiatives
-- **Recent Developments** (Last 12 months):
-  - [Initiative 1]
-  - [Initiative 2]
-  - [Initiative 3]
-- **Strategic Focus**: [description]
+def current_session() -> ResearchSession:
+    """This browser session's research session, loaded back from disk if it was spilled"""
+    return session_store.get(st.session_state.session_id)
 
-## 6. Key Stakeholders & Decision Makers
-- **CEO/Leadership**: [names and backgrounds]
-- **Key Executives**:
-  - [Title]: [Name] - [relevant info]
-  - [Title]: [Name] - [relevant info]
-- **Board Members**: [if relevant]
+# Worker pool for plan generation, so no script thread waits on a long Groq call
+@st.cache_resource
+def get_job_queue() -> JobQueue:
+    return job_queue_from_env()
 
-## 7. Pain Points & Challenges
-- **Challenge 1**: [description and impact]
-- **Challenge 2**: [description and impact]
-- **Challenge 3**: [description and impact]
+job_queue = get_job_queue()
+JOB_POLL_SECONDS = float(os.getenv("JOB_POLL_SECONDS", "2"))
 
-## 8. Opportunities & Recommendations
-- **Opportunity 1**: [specific recommendation with rationale]
-- **Opportunity 2**: [specific recommendation with rationale]
-- **Opportunity 3**: [specific recommendation with rationale]
+# Background plans for conversations that have settled on a company (SPECULATIVE_PLANS=1), or None
+@st.cache_resource
+def get_speculator() -> Optional[Speculator]:
+    return speculator_from_env(pipeline, job_queue)
 
-## 9. Engagement Strategy
-- **Approach**: [recommended engagement method]
-- **Key Messages**: [what to emphasize]
-- **Value Proposition**: [tailored value prop]
-- **Timeline**: [suggested timeline]
+speculator = get_speculator()
 
-## 10. Next Steps
-1. [Specific action item with owner and deadline]
-2. [Specific action item with owner and deadline]
-3. [Specific action item with owner and deadline]
+# Estimated tokens of chat history sent with each request; older turns are summarized or dropped
+HISTORY_TOKEN_BUDGET = int(os.getenv("HISTORY_TOKEN_BUDGET", "6000"))
+COMPARE_MAX_COMPANIES = int(os.getenv("COMPARE_MAX_COMPANIES", "5"))
 
-Be comprehensive, professional, and data-driven. Use bullet points, clear formatting, and specific details."""
+def call_groq_api(
+    user_message: str, chat_history: List = None, stream: bool = False, turn: Optional[str] = None
+) -> Union[str, Iterator[str]]:
+    """Call Groq API with chat history, on the model the turn kind is routed to
 
-def call_groq_api(user_message: str, chat_history: List = None) -> str:
-    """Call Groq API with chat history"""
+    With stream=True, returns an iterator of text deltas instead of the full response.
+    """
     try:
-        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-        
-        if chat_history:
-            messages.extend(chat_history)
-        
-        messages.append({"role": "user", "content": user_message})
-        
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=messages,
-            temperature=0.7,
-            max_tokens=8192,
-            top_p=0.95,
-            stream=False
-        )
-        
-        return response.choices[0].message.content
+        response = pipeline.chat(user_message, chat_history, stream=stream, turn=turn)
+        return report_stream_errors(response) if stream else response
     
     except Exception as e:
         st.error(f"Error calling Groq API: {str(e)}")
-        return "I apologize, but I encountered an error. Please try again."
+        fallback = "I apologize, but I encountered an error. Please try again."
+        return iter([fallback]) if stream else fallback
 
-def enhance_section(section_content: str, section_name: str) -> str:
-    """Enhance a specific section using Groq"""
+def report_stream_errors(deltas: Iterator[str]) -> Iterator[str]:
+    """Pass streamed deltas through, ending the stream with an error message if it breaks"""
     try:
-        prompt = f"""You are an expert business analyst enhancing an account plan section. You MUST significantly improve and expand the content.
+        yield from deltas
+    except Exception as e:
+        st.error(f"Error while streaming Groq response: {str(e)}")
 
-IMPORTANT: Do NOT just repeat the original content. You must:
-1. Add MORE specific details, data points, and examples
-2. Expand on key points with deeper analysis
-3. Include actionable recommendations
-4. Add relevant metrics, timelines, or frameworks
-5. Make it at least 30-50% longer and more comprehensive
-6. Use professional business language
+def add_research_note(action: str, session: Optional[ResearchSession] = None):
+    """Add a research note with proper formatting"""
+    (session or current_session()).add_note(datetime.now().strftime("%H:%M:%S"), action)
 
-Section: {section_name}
+def load_saved_plan(saved: dict):
+    """Make a plan from the plan store the current account plan"""
+    current_session().set_plan(saved["sections"], saved["id"], saved["company"])
+    add_research_note(f"Loaded saved plan for {saved['company']}")
 
-Current content:
-{section_content}
+def save_chat_message(role: str, content: str, session: Optional[ResearchSession] = None):
+    """Append a message to the chat and index it for search"""
+    session = session or current_session()
+    session.add_message(role, content)
+    plan_store.save_message(session.session_id, role, content, company=detect_company(session.messages))
 
-Now provide an ENHANCED, EXPANDED, and MORE DETAILED version (do NOT just copy the original):"""
+def run_plan_job(session_id: str, prompt: str, groq_history: List, parallel: bool, report) -> dict:
+    """Generate an account plan and store it in the session; runs on a job worker, so no Streamlit calls"""
+    failed = []
+    if parallel:
+        finished = []
+        
+        def on_section_done(section_key: str, error: Optional[str]):
+            finished.append(section_key)
+            if error:
+                failed.append(f"{SECTION_TITLES[section_key]} ({error})")
+            status = f"{SECTION_TITLES[section_key]} failed: {error}" if error else f"{SECTION_TITLES[section_key]} ready"
+            report(len(finished) / len(SECTION_TITLES), f"{status} ({len(finished)}/{len(SECTION_TITLES)})")
         
-        response = client.chat.completions.create(
-            model="llama-3.3-70b-versatile",
-            messages=[
-                {"role": "system", "content": "You are an expert business analyst who creates detailed, professional account plans. When asked to enhance content, you ALWAYS make it significantly better, longer, and more detailed. Never return the same content."},
-                {"role": "user", "content": prompt}
-            ],
-            temperature=0.8,
-            max_tokens=8192,
-            top_p=0.95
+        assistant_message, new_plan = pipeline.generate_account_plan_parallel(
+            prompt, groq_history, on_section_done=on_section_done
         )
-        enhanced_content = response.choices[0].message.content
+    else:
+        # Structured JSON output, streamed; each section is published as its value completes
+        partial = {}
         
-        # Verify the content actually changed
-        if enhanced_content.strip() == section_content.strip():
-            # If identical, force a second attempt with stronger instruction
-            prompt2 = f"""The previous enhancement was not sufficient. You MUST create a NEW, EXPANDED version that is SIGNIFICANTLY different from the original.
-
-Original section ({section_name}):
-{section_content}
-
-Create a COMPLETELY REWRITTEN and MUCH MORE DETAILED version with:
-- At least 50% more content
-- Specific examples and data
-- Actionable insights
-- Professional business frameworks
-- Strategic recommendations
-
-ENHANCED VERSION:"""
-            
-            response2 = client.chat.completions.create(
-                model="llama-3.3-70b-versatile",
-                messages=[
-                    {"role": "system", "content": "You are an expert business analyst. You MUST significantly expand and improve content. Never return unchanged content."},
-                    {"role": "user", "content": prompt2}
-                ],
-                temperature=0.9,
-                max_tokens=8192
+        def on_section(section_key: str, text: str):
+            partial[section_key] = text
+            report(
+                len(partial) / len(SECTION_TITLES),
+                f"{SECTION_TITLES[section_key]} ready ({len(partial)}/{len(SECTION_TITLES)})",
+                partial=partial
             )
-            enhanced_content = response2.choices[0].message.content
         
-        return enhanced_content
+        assistant_message, new_plan = pipeline.generate_account_plan(prompt, groq_history, on_section=on_section)
+        # A truncated or malformed response keeps only the sections that could be salvaged
+        failed = [f"{title} (missing from the response)" for key, title in SECTION_TITLES.items() if key not in new_plan]
     
-    except Exception as e:
-        st.error(f"Error enhancing section: {str(e)}")
-        return section_content
+    # Fetched now rather than at submit time: the session may have been reloaded or changed since
+    session = session_store.get(session_id)
+    save_chat_message("assistant", assistant_message, session=session)
+    company = detect_company(session.messages) or "Unknown company"
+    session.set_plan(new_plan, plan_store.save_plan(company, new_plan), company)
+    add_research_note(
+        "Account plan created successfully" + (" (parallel sections)" if parallel else ""), session=session
+    )
+    return {"company": company, "failed_sections": failed}
 
-def parse_account_plan(text: str) -> Dict[str, str]:
-    """Parse the account plan from AI response"""
-    sections = {
-        "executive_summary": "",
-        "company_overview": "",
-        "business_model": "",
-        "market_position": "",
-        "recent_news": "",
-        "key_stakeholders": "",
-        "pain_points": "",
-        "opportunities": "",
-        "engagement_strategy": "",
-        "next_steps": ""
-    }
-    
-    section_markers = {
-        "Executive Summary": "executive_summary",
-        "Company Overview": "company_overview",
-        "Business Model": "business_model",
-        "Market Position": "market_position",
-        "Recent News": "recent_news",
-        "Key Stakeholders": "key_stakeholders",
-        "Pain Points": "pain_points",
-        "Opportunities": "opportunities",
-        "Engagement Strategy": "engagement_strategy",
-        "Next Steps": "next_steps"
-    }
-    
-    current_section = None
-    lines = text.split("\n")
+def run_enhance_job(session_id: str, plan_id: Optional[int], sections: Dict[str, str], report) -> dict:
+    """AI-enhance plan sections and store them; runs on a job worker, so no Streamlit calls"""
+    pending = [key for key, content in sections.items() if content.strip()]
+    finished = []
+    failed = []
     
-    for line in lines:
-        line_stripped = line.strip()
-        
-        for marker, section_key in section_markers.items():
-            if marker.lower() in line_stripped.lower() and (
-                line_stripped.startswith("#") or 
-                line_stripped.startswith("**") or 
-                ":" in line_stripped
-            ):
-                current_section = section_key
-                break
-        
-        if current_section and line_stripped:
-            if not any(marker.lower() in line_stripped.lower() for marker in section_markers.keys()):
-                sections[current_section] += line + "\n"
+    def on_section_done(section_key: str, error: Optional[str]):
+        finished.append(section_key)
+        if error:
+            failed.append(f"{SECTION_TITLES[section_key]} ({error})")
+        status = f"{SECTION_TITLES[section_key]} failed: {error}" if error else f"{SECTION_TITLES[section_key]} enhanced"
+        report(len(finished) / len(pending), f"{status} ({len(finished)}/{len(pending)})")
     
-    return sections
+    enhanced_sections = pipeline.enhance_all_sections(sections, on_section_done=on_section_done)
+    if plan_id:
+        for key, enhanced_text in enhanced_sections.items():
+            plan_store.save_section(plan_id, key, enhanced_text, kind="enhance")
+    session = session_store.get(session_id)
+    # The session may have loaded another plan meanwhile; the enhancements then only go to the saved plan
+    if session.plan_id == plan_id:
+        session.update_sections(enhanced_sections)
+    add_research_note(f"✨ AI-enhanced {len(enhanced_sections)} of {len(pending)} sections", session=session)
+    return {"plan_id": plan_id, "enhanced": list(enhanced_sections), "failed_sections": failed}
 
-def detect_account_plan_intent(text: str) -> bool:
-    """Detect if the response contains or references an account plan"""
-    plan_keywords = [
-        "account plan",
-        "executive summary",
-        "company overview",
-        "engagement strategy",
-        "key stakeholders",
-        "pain points"
-    ]
+def run_comparison_job(session_id: str, companies: List[str], focus: str, existing: Dict, report) -> dict:
+    """Plans for companies side by side, reusing existing ones; runs on a job worker, so no Streamlit calls"""
+    pending = len(companies) - len(existing)
+    finished = []
+    failed = []
+    if pending:
+        report(0.0, f"Researching the shared industry context for {pending} new plans")
     
-    text_lower = text.lower()
-    matches = sum(1 for keyword in plan_keywords if keyword in text_lower)
-    return matches >= 3
-
-def add_research_note(action: str):
-    """Add a research note with proper formatting"""
-    note = {
-        "timestamp": datetime.now().strftime("%H:%M:%S"),
-        "action": action
+    def on_company_done(company: str, error: Optional[str]):
+        finished.append(company)
+        if error:
+            failed.append(f"{company} ({error})")
+        status = f"{company} failed: {error}" if error else f"{company} ready"
+        report(len(finished) / pending, f"{status} ({len(finished)}/{pending})")
+    
+    shared_context, plans = pipeline.compare_companies(
+        companies, focus, existing=existing, on_company_done=on_company_done
+    )
+    for company, sections in plans.items():
+        if company not in existing:
+            plan_store.save_plan(company, sections, source="compare")
+    add_research_note(
+        f"🆚 Compared {', '.join(plans)} ({len(existing)} saved plans reused)", session=session_store.get(session_id)
+    )
+    return {
+        "context": shared_context,
+        "plans": plans,
+        "reused": [company for company in plans if company in existing],
+        "failed_sections": failed
     }
-    st.session_state.research_notes.append(note)
 
-def generate_text_export() -> str:
-    """Generate formatted text export of account plan"""
-    section_names = {
-        "executive_summary": "Executive Summary",
-        "company_overview": "Company Overview",
-        "business_model": "Business Model & Products/Services",
-        "market_position": "Market Position & Competitors",
-        "recent_news": "Recent News & Strategic Initiatives",
-        "key_stakeholders": "Key Stakeholders & Decision Makers",
-        "pain_points": "Pain Points & Challenges",
-        "opportunities": "Opportunities & Recommendations",
-        "engagement_strategy": "Engagement Strategy",
-        "next_steps": "Next Steps"
-    }
+def render_voice_response(assistant_message: str):
+    """Browser text-to-speech player for an assistant response"""
+    st.markdown("---")
+    st.markdown("### 🔊 Audio Response")
+    
+    # Clean text for TTS - remove all markdown and special characters
+    clean_text = assistant_message
+    # Remove markdown headers
+    clean_text = clean_text.replace('###', '').replace('##', '').replace('#', '')
+    # Remove markdown formatting
+    clean_text = clean_text.replace('**', '').replace('*', '').replace('`', '').replace('_', '')
+    # Remove brackets and special characters
+    clean_text = clean_text.replace('[', '').replace(']', '').replace('|', '')
+    # Remove extra whitespace and newlines
+    clean_text = ' '.join(clean_text.split())
+    
+    # Limit length for better performance
+    if len(clean_text) > 500:
+        clean_text = clean_text[:500] + "... Full text visible above."
+    
+    # Escape text for JavaScript
+    import json
+    safe_text = json.dumps(clean_text)
     
-    text_data = "="*70 + "\n"
-    text_data += "COMPANY RESEARCH ACCOUNT PLAN\n"
-    text_data += f"Generated: {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n"
-    text_data += "="*70 + "\n\n"
+    # Generate unique ID for this response
+    response_id = st.session_state.voice_component_key
     
-    for key, name in section_names.items():
-        text_data += "\n" + "="*70 + "\n"
-        text_data += f"{name.upper()}\n"
-        text_data += "="*70 + "\n\n"
-        content = st.session_state.account_plan.get(key, "Not available")
-        text_data += content.strip() + "\n\n"
+    st.write(f"🎤 **Text length:** {len(clean_text)} characters")
+    st.caption(f"Preview: {clean_text[:100]}...")
     
-    text_data += "\n" + "="*70 + "\n"
-    text_data += "END OF REPORT\n"
-    text_data += "="*70 + "\n"
+    tts_html = f"""
+    <div style="margin: 15px 0; padding: 20px; background-color: #f0f2f6; border-radius: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
+        <div style="margin-bottom: 15px;">
+            <button id="playBtn_{response_id}" 
+                style="background-color: #4CAF50; color: white; border: none; padding: 14px 28px; 
+                border-radius: 8px; cursor: pointer; font-size: 16px; margin-right: 10px; 
+                font-weight: 600; transition: all 0.3s; box-shadow: 0 2px 4px rgba(0,0,0,0.2);">
+                ▶️ Play Audio
+            </button>
+            <button id="stopBtn_{response_id}" 
+                style="background-color: #f44336; color: white; border: none; padding: 14px 28px; 
+                border-radius: 8px; cursor: pointer; font-size: 16px; font-weight: 600; 
+                transition: all 0.3s; box-shadow: 0 2px 4px rgba(0,0,0,0.2);">
+                ⏹️ Stop
+            </button>
+        </div>
+        <div style="margin-bottom: 12px;">
+            <label style="font-size: 14px; font-weight: 600; color: #333; margin-right: 10px; display: inline-block; margin-bottom: 8px;">
+                🎚️ Playback Speed:
+            </label>
+            <br>
+            <button id="speed075_{response_id}"
+                style="background-color: #e0e0e0; border: 2px solid #999; padding: 8px 14px; 
+                border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px;">
+                🐢 0.75x
+            </button>
+            <button id="speed10_{response_id}"
+                style="background-color: #4CAF50; border: 2px solid #2e7d32; color: white; padding: 8px 14px; 
+                border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px; font-weight: 600;">
+                ✓ 1.0x
+            </button>
+            <button id="speed125_{response_id}"
+                style="background-color: #e0e0e0; border: 2px solid #999; padding: 8px 14px; 
+                border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px;">
+                ⚡ 1.25x
+            </button>
+            <button id="speed15_{response_id}"
+                style="background-color: #e0e0e0; border: 2px solid #999; padding: 8px 14px; 
+                border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px;">
+                🚀 1.5x
+            </button>
+        </div>
+        <div id="status_{response_id}" style="margin-top: 12px; padding: 10px; background-color: white; border-radius: 5px; font-size: 14px; color: #333; min-height: 40px;"></div>
+    </div>
+    <script>
+        (function() {{
+            console.log('=== TTS Script {response_id} Initializing ===');
+            
+            const playBtn = document.getElementById('playBtn_{response_id}');
+            const stopBtn = document.getElementById('stopBtn_{response_id}');
+            const statusDiv = document.getElementById('status_{response_id}');
+            const speed075 = document.getElementById('speed075_{response_id}');
+            const speed10 = document.getElementById('speed10_{response_id}');
+            const speed125 = document.getElementById('speed125_{response_id}');
+            const speed15 = document.getElementById('speed15_{response_id}');
+            
+            if (!playBtn || !stopBtn || !statusDiv) {{
+                console.error('TTS buttons not found for {response_id}!');
+                return;
+            }}
+            
+            console.log('✓ All TTS elements found for {response_id}');
+            
+            let utterance_{response_id} = null;
+            let currentSpeed_{response_id} = 1.0;
+            let isPlaying_{response_id} = false;
+            
+            // Check browser support immediately
+            if (!('speechSynthesis' in window)) {{
+                statusDiv.innerHTML = '❌ Text-to-speech not supported in this browser. Please use Chrome, Edge, or Safari.';
+                playBtn.disabled = true;
+                playBtn.style.opacity = '0.5';
+                playBtn.style.cursor = 'not-allowed';
+                console.error('Speech Synthesis not supported');
+                return;
+            }}
+            
+            console.log('✓ Speech Synthesis available');
+            statusDiv.innerHTML = '✅ Ready to play. Click Play Audio button above.';
+            
+            function setSpeed(speed) {{
+                console.log('Setting speed to:', speed);
+                currentSpeed_{response_id} = speed;
+                
+                // Update button styles
+                [speed075, speed10, speed125, speed15].forEach(btn => {{
+                    if (btn) {{
+                        btn.style.backgroundColor = '#e0e0e0';
+                        btn.style.borderColor = '#999';
+                        btn.style.color = '#000';
+                        btn.style.fontWeight = 'normal';
+                    }}
+                }});
+                
+                // Highlight selected
+                let selectedBtn = null;
+                if (speed === 0.75) selectedBtn = speed075;
+                else if (speed === 1.0) selectedBtn = speed10;
+                else if (speed === 1.25) selectedBtn = speed125;
+                else if (speed === 1.5) selectedBtn = speed15;
+                
+                if (selectedBtn) {{
+                    selectedBtn.style.backgroundColor = '#4CAF50';
+                    selectedBtn.style.borderColor = '#2e7d32';
+                    selectedBtn.style.color = 'white';
+                    selectedBtn.style.fontWeight = '600';
+                }}
+                
+                statusDiv.innerHTML = '✓ Speed set to ' + speed + 'x';
+                
+                // If currently playing, restart with new speed
+                if (isPlaying_{response_id} && window.speechSynthesis.speaking) {{
+                    window.speechSynthesis.cancel();
+                    setTimeout(function() {{
+                        playAudio();
+                    }}, 150);
+                }}
+            }}
+            
+            function playAudio() {{
+                console.log('>>> Play button clicked for {response_id} >>>');
+                
+                if (!('speechSynthesis' in window)) {{
+                    statusDiv.innerHTML = '❌ Speech synthesis not available';
+                    console.error('Speech synthesis not available');
+                    return;
+                }}
+                
+                try {{
+                    // Cancel any ongoing speech
+                    window.speechSynthesis.cancel();
+                    
+                    const text = {safe_text};
+                    console.log('Text to speak (first 100 chars):', text.substring(0, 100));
+                    console.log('Text length:', text.length);
+                    
+                    if (!text || text.trim() === '') {{
+                        statusDiv.innerHTML = '❌ No text to speak';
+                        console.error('No text provided');
+                        return;
+                    }}
+                    
+                    utterance_{response_id} = new SpeechSynthesisUtterance(text);
+                    utterance_{response_id}.rate = currentSpeed_{response_id};
+                    utterance_{response_id}.pitch = 1.0;
+                    utterance_{response_id}.volume = 1.0;
+                    utterance_{response_id}.lang = 'en-US';
+                    
+                    utterance_{response_id}.onstart = function() {{
+                        console.log('✓ Speech STARTED for {response_id}');
+                        isPlaying_{response_id} = true;
+                        const estimatedTime = Math.round(text.length / currentSpeed_{response_id} / 15);
+                        statusDiv.innerHTML = '🔊 <b>Playing</b> at ' + currentSpeed_{response_id} + 'x speed... (~' + estimatedTime + 's)';
+                        playBtn.style.opacity = '0.6';
+                        playBtn.style.transform = 'scale(0.95)';
+                    }};
+                    
+                    utterance_{response_id}.onend = function() {{
+                        console.log('✓ Speech ENDED for {response_id}');
+                        isPlaying_{response_id} = false;
+                        statusDiv.innerHTML = '✅ Audio finished playing';
+                        playBtn.style.opacity = '1';
+                        playBtn.style.transform = 'scale(1)';
+                    }};
+                    
+                    utterance_{response_id}.onerror = function(event) {{
+                        console.error('Speech ERROR for {response_id}:', event.error, event);
+                        isPlaying_{response_id} = false;
+                        let errorMsg = '❌ <b>Error:</b> ';
+                        if (event.error === 'not-allowed') {{
+                            errorMsg += 'Permission denied. Check browser settings.';
+                        }} else if (event.error === 'network') {{
+                            errorMsg += 'Network error. Check connection.';
+                        }} else if (event.error === 'synthesis-failed') {{
+                            errorMsg += 'Synthesis failed. Try again.';
+                        }} else {{
+                            errorMsg += event.error;
+                        }}
+                        statusDiv.innerHTML = errorMsg;
+                        playBtn.style.opacity = '1';
+                        playBtn.style.transform = 'scale(1)';
+                    }};
+                    
+                    statusDiv.innerHTML = '⏳ Starting playback...';
+                    console.log('Calling speechSynthesis.speak()...');
+                    window.speechSynthesis.speak(utterance_{response_id});
+                    
+                }} catch (error) {{
+                    console.error('Exception in playAudio:', error);
+                    statusDiv.innerHTML = '❌ Error: ' + error.message;
+                }}
+            }}
+            
+            function stopAudio() {{
+                console.log('>>> Stop button clicked for {response_id} >>>');
+                
+                if ('speechSynthesis' in window) {{
+                    window.speechSynthesis.cancel();
+                    isPlaying_{response_id} = false;
+                    statusDiv.innerHTML = '⏹️ Audio stopped';
+                    playBtn.style.opacity = '1';
+                    playBtn.style.transform = 'scale(1)';
+                    console.log('✓ Audio stopped');
+                }}
+            }}
+            
+            // Attach event listeners
+            playBtn.addEventListener('click', playAudio);
+            stopBtn.addEventListener('click', stopAudio);
+            
+            if (speed075) speed075.addEventListener('click', function() {{ setSpeed(0.75); }});
+            if (speed10) speed10.addEventListener('click', function() {{ setSpeed(1.0); }});
+            if (speed125) speed125.addEventListener('click', function() {{ setSpeed(1.25); }});
+            if (speed15) speed15.addEventListener('click', function() {{ setSpeed(1.5); }});
+            
+            console.log('=== TTS Script {response_id} Ready ===');
+        }})();
+    </script>
+    """
     
-    return text_data
+    st.markdown(tts_html, unsafe_allow_html=True)
+    st.session_state.voice_component_key += 1
 
 # Sidebar
-with st.sidebar:
+@st.fragment
+def render_sidebar():
+    """Sidebar controls and research notes, rerun on their own so chat and plan are not redrawn"""
+    session = current_session()
     st.markdown('<p class="main-header">🏢 Research Assistant</p>', unsafe_allow_html=True)
     
     # Voice mode toggle
@@ -422,6 +625,12 @@ with st.sidebar:
         else:
             st.info("Voice mode disabled")
     
+    st.session_state.parallel_plan_mode = st.toggle(
+        "⚡ Parallel Plan Generation",
+        value=st.session_state.parallel_plan_mode,
+        help="Generate the ten account plan sections as concurrent requests instead of one long completion"
+    )
+    
     # Voice input in sidebar
     if st.session_state.voice_mode:
         st.markdown("#### 🎙️ Voice Input")
@@ -694,9 +903,9 @@ with st.sidebar:
     st.markdown("---")
     
     st.markdown("### 📊 Research Notes")
-    if st.session_state.research_notes:
+    if session.notes:
         # Show last 5 notes
-        for note in st.session_state.research_notes[-5:]:
+        for note in session.notes[-5:]:
             st.markdown(f'''
             <div class="research-note">
                 <div class="research-note-time">🕐 {note["timestamp"]}</div>
@@ -708,11 +917,84 @@ with st.sidebar:
     
     st.markdown("---")
     
+    st.markdown("### 💾 Saved Plans")
+    saved_companies = plan_store.list_companies()
+    if saved_companies:
+        selected = st.selectbox(
+            "Load an existing plan",
+            saved_companies,
+            format_func=lambda c: f"{c['company']} ({c['plan_count']} saved, {datetime.fromtimestamp(c['updated_at']).strftime('%Y-%m-%d %H:%M')})"
+        )
+        if st.button("📂 Load Latest Plan", use_container_width=True):
+            load_saved_plan(plan_store.latest_plan(selected["company"]))
+            st.rerun()
+    else:
+        st.info("No saved plans yet")
+    
+    st.markdown("---")
+    
+    if speculator is not None:
+        speculation_stats = speculator.stats()
+        st.caption(
+            f"🔮 Speculative plans: {speculation_stats['submitted']} started, {speculation_stats['hits']} used, "
+            f"~{speculation_stats['budget_remaining']:,} tokens of budget left"
+        )
+    cache_stats = response_cache.stats()
+    st.caption(
+        f"⚡ Response cache: {cache_stats['hits']} hits / {cache_stats['misses']} misses "
+        f"({cache_stats['hit_rate']:.0%} hit rate)"
+    )
+    limiter_stats = pipeline.rate_limiter.stats()
+    st.caption(
+        f"🚦 Groq quota: concurrency {limiter_stats['in_flight']}/{limiter_stats['concurrency_limit']}, "
+        f"{limiter_stats['throttled']} throttled, {limiter_stats['retries']} retries"
+    )
+    session_stats = session_store.stats()
+    st.caption(
+        f"🗂️ Sessions: {session_stats['hot']} in memory, "
+        f"{session_stats['evicted']} evicted when idle, {session_stats['loaded']} loaded from the session backend"
+    )
+    if pipeline.document_index is not None:
+        document_stats = pipeline.document_index.stats()
+        st.caption(
+            f"📚 Reference documents: {document_stats['documents']} files, "
+            f"{document_stats['chunks']} excerpts indexed"
+        )
+    
+    with st.expander("📈 Groq Call Diagnostics", expanded=False):
+        call_summary = pipeline.metrics.summary()
+        if call_summary:
+            st.dataframe(call_summary, hide_index=True, use_container_width=True)
+            st.caption("Latency quantiles are histogram bucket upper bounds")
+            routing_summary = pipeline.metrics.routing_summary()
+            if routing_summary:
+                st.markdown("**Model routing**")
+                st.dataframe(routing_summary, hide_index=True, use_container_width=True)
+                seconds_saved = pipeline.metrics.estimated_seconds_saved()
+                if seconds_saved is not None:
+                    st.caption(f"Estimated latency saved by smaller models: {seconds_saved:.1f}s")
+            st.markdown("**Recent calls**")
+            for record in reversed(pipeline.metrics.recent):
+                ttft = f", first token {record.ttft:.2f}s" if record.ttft is not None else ""
+                tokens = f", {record.prompt_tokens}+{record.completion_tokens} tokens" if record.prompt_tokens is not None else ""
+                status = f" ✗ {record.error}" if record.error else ""
+                st.caption(f"`{record.call_site}` {record.total:.2f}s (queued {record.queue_wait:.2f}s{ttft}){tokens}{status}")
+            st.download_button(
+                label="📤 Prometheus Metrics",
+                data=pipeline.metrics.prometheus_text(),
+                file_name="groq_metrics.prom",
+                mime="text/plain",
+                use_container_width=True
+            )
+        else:
+            st.info("No Groq calls yet")
+    
     if st.button("🔄 Start New Research", use_container_width=True):
-        st.session_state.messages = []
-        st.session_state.account_plan = None
-        st.session_state.research_notes = []
-        st.session_state.chat_history = []
+        current_session().reset()
+        plan_store.delete_messages(st.session_state.session_id)
+        if speculator is not None:
+            speculator.cancel(st.session_state.session_id)
+        st.session_state.comparison = None
         st.session_state.voice_component_key += 1
         st.session_state.voice_transcript = ""
         add_research_note("Started new research session")
@@ -728,23 +1010,37 @@ with st.sidebar:
     5. **Edit sections** as needed
     """)
 
+with st.sidebar:
+    render_sidebar()
+
 # Main content area
 st.markdown('<p class="main-header">Company Research Assistant</p>', unsafe_allow_html=True)
 st.markdown("Ask me to research any company and I'll create a comprehensive account plan for you.")
 
 # Create tabs
-tab1, tab2 = st.tabs(["💬 Chat & Research", "📄 Account Plan"])
+tab1, tab2, tab3, tab4 = st.tabs(["💬 Chat & Research", "📄 Account Plan", "🆚 Compare Companies", "🔎 Search"])
 
-with tab1:
+@st.fragment
+def render_chat():
+    """Chat history and chat turns; a turn reruns only this fragment, plans are generated as background jobs"""
+    session = current_session()
     # Display chat messages
-    for message in st.session_state.messages:
+    for index, message in enumerate(session.messages):
         with st.chat_message(message["role"]):
             st.markdown(message["content"])
+            # Replay the player for a response whose turn ended in a full rerun
+            if index == len(session.messages) - 1 and st.session_state.pop("speak_last_response", False):
+                render_voice_response(message["content"])
+    
+    if plan_notice := st.session_state.pop("plan_notice", None):
+        st.success(plan_notice)
+    if job_error := st.session_state.pop("job_error", None):
+        st.error(job_error)
     
     # Chat input (Streamlit automatically positions this at the bottom)
     if prompt := st.chat_input("Ask me to research a company (e.g., 'Research Tesla' or 'Create an account plan for Microsoft')"):
         # Add user message
-        st.session_state.messages.append({"role": "user", "content": prompt})
+        save_chat_message("user", prompt)
         add_research_note(f"Researching: {prompt[:40]}...")
         
         with st.chat_message("user"):
@@ -752,381 +1048,264 @@ with tab1:
         
         # Get response from Groq
         with st.chat_message("assistant"):
-            with st.spinner("⚡ Researching with Groq AI..."):
-                try:
-                    # Prepare chat history
-                    groq_history = []
-                    for msg in st.session_state.messages[:-1]:
-                        groq_history.append({"role": msg["role"], "content": msg["content"]})
-                    
-                    # Get response
-                    assistant_message = call_groq_api(prompt, groq_history)
-                    st.markdown(assistant_message)
-                    
-                    # Add to session state
-                    st.session_state.messages.append({
-                        "role": "assistant",
-                        "content": assistant_message
-                    })
-                    
-                    # Voice output with browser TTS
-                    if st.session_state.voice_mode:
-                        st.markdown("---")
-                        st.markdown("### 🔊 Audio Response")
-                        
-                        # Clean text for TTS - remove all markdown and special characters
-                        clean_text = assistant_message
-                        # Remove markdown headers
-                        clean_text = clean_text.replace('###', '').replace('##', '').replace('#', '')
-                        # Remove markdown formatting
-                        clean_text = clean_text.replace('**', '').replace('*', '').replace('`', '').replace('_', '')
-                        # Remove brackets and special characters
-                        clean_text = clean_text.replace('[', '').replace(']', '').replace('|', '')
-                        # Remove extra whitespace and newlines
-                        clean_text = ' '.join(clean_text.split())
-                        
-                        # Limit length for better performance
-                        if len(clean_text) > 500:
-                            clean_text = clean_text[:500] + "... Full text visible above."
-                        
-                        # Escape text for JavaScript
-                        import json
-                        safe_text = json.dumps(clean_text)
-                        
-                        # Generate unique ID for this response
-                        response_id = st.session_state.voice_component_key
-                        
-                        st.write(f"🎤 **Text length:** {len(clean_text)} characters")
-                        st.caption(f"Preview: {clean_text[:100]}...")
-                        
-                        tts_html = f"""
-                        <div style="margin: 15px 0; padding: 20px; background-color: #f0f2f6; border-radius: 10px; box-shadow: 0 2px 4px rgba(0,0,0,0.1);">
-                            <div style="margin-bottom: 15px;">
-                                <button id="playBtn_{response_id}" 
-                                    style="background-color: #4CAF50; color: white; border: none; padding: 14px 28px; 
-                                    border-radius: 8px; cursor: pointer; font-size: 16px; margin-right: 10px; 
-                                    font-weight: 600; transition: all 0.3s; box-shadow: 0 2px 4px rgba(0,0,0,0.2);">
-                                    ▶️ Play Audio
-                                </button>
-                                <button id="stopBtn_{response_id}" 
-                                    style="background-color: #f44336; color: white; border: none; padding: 14px 28px; 
-                                    border-radius: 8px; cursor: pointer; font-size: 16px; font-weight: 600; 
-                                    transition: all 0.3s; box-shadow: 0 2px 4px rgba(0,0,0,0.2);">
-                                    ⏹️ Stop
-                                </button>
-                            </div>
-                            <div style="margin-bottom: 12px;">
-                                <label style="font-size: 14px; font-weight: 600; color: #333; margin-right: 10px; display: inline-block; margin-bottom: 8px;">
-                                    🎚️ Playback Speed:
-                                </label>
-                                <br>
-                                <button id="speed075_{response_id}"
-                                    style="background-color: #e0e0e0; border: 2px solid #999; padding: 8px 14px; 
-                                    border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px;">
-                                    🐢 0.75x
-                                </button>
-                                <button id="speed10_{response_id}"
-                                    style="background-color: #4CAF50; border: 2px solid #2e7d32; color: white; padding: 8px 14px; 
-                                    border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px; font-weight: 600;">
-                                    ✓ 1.0x
-                                </button>
-                                <button id="speed125_{response_id}"
-                                    style="background-color: #e0e0e0; border: 2px solid #999; padding: 8px 14px; 
-                                    border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px;">
-                                    ⚡ 1.25x
-                                </button>
-                                <button id="speed15_{response_id}"
-                                    style="background-color: #e0e0e0; border: 2px solid #999; padding: 8px 14px; 
-                                    border-radius: 5px; cursor: pointer; font-size: 13px; margin: 3px;">
-                                    🚀 1.5x
-                                </button>
-                            </div>
-                            <div id="status_{response_id}" style="margin-top: 12px; padding: 10px; background-color: white; border-radius: 5px; font-size: 14px; color: #333; min-height: 40px;"></div>
-                        </div>
-                        <script>
-                            (function() {{
-                                console.log('=== TTS Script {response_id} Initializing ===');
-                                
-                                const playBtn = document.getElementById('playBtn_{response_id}');
-                                const stopBtn = document.getElementById('stopBtn_{response_id}');
-                                const statusDiv = document.getElementById('status_{response_id}');
-                                const speed075 = document.getElementById('speed075_{response_id}');
-                                const speed10 = document.getElementById('speed10_{response_id}');
-                                const speed125 = document.getElementById('speed125_{response_id}');
-                                const speed15 = document.getElementById('speed15_{response_id}');
-                                
-                                if (!playBtn || !stopBtn || !statusDiv) {{
-                                    console.error('TTS buttons not found for {response_id}!');
-                                    return;
-                                }}
-                                
-                                console.log('✓ All TTS elements found for {response_id}');
-                                
-                                let utterance_{response_id} = null;
-                                let currentSpeed_{response_id} = 1.0;
-                                let isPlaying_{response_id} = false;
-                                
-                                // Check browser support immediately
-                                if (!('speechSynthesis' in window)) {{
-                                    statusDiv.innerHTML = '❌ Text-to-speech not supported in this browser. Please use Chrome, Edge, or Safari.';
-                                    playBtn.disabled = true;
-                                    playBtn.style.opacity = '0.5';
-                                    playBtn.style.cursor = 'not-allowed';
-                                    console.error('Speech Synthesis not supported');
-                                    return;
-                                }}
-                                
-                                console.log('✓ Speech Synthesis available');
-                                statusDiv.innerHTML = '✅ Ready to play. Click Play Audio button above.';
-                                
-                                function setSpeed(speed) {{
-                                    console.log('Setting speed to:', speed);
-                                    currentSpeed_{response_id} = speed;
-                                    
-                                    // Update button styles
-                                    [speed075, speed10, speed125, speed15].forEach(btn => {{
-                                        if (btn) {{
-                                            btn.style.backgroundColor = '#e0e0e0';
-                                            btn.style.borderColor = '#999';
-                                            btn.style.color = '#000';
-                                            btn.style.fontWeight = 'normal';
-                                        }}
-                                    }});
-                                    
-                                    // Highlight selected
-                                    let selectedBtn = null;
-                                    if (speed === 0.75) selectedBtn = speed075;
-                                    else if (speed === 1.0) selectedBtn = speed10;
-                                    else if (speed === 1.25) selectedBtn = speed125;
-                                    else if (speed === 1.5) selectedBtn = speed15;
-                                    
-                                    if (selectedBtn) {{
-                                        selectedBtn.style.backgroundColor = '#4CAF50';
-                                        selectedBtn.style.borderColor = '#2e7d32';
-                                        selectedBtn.style.color = 'white';
-                                        selectedBtn.style.fontWeight = '600';
-                                    }}
-                                    
-                                    statusDiv.innerHTML = '✓ Speed set to ' + speed + 'x';
-                                    
-                                    // If currently playing, restart with new speed
-                                    if (isPlaying_{response_id} && window.speechSynthesis.speaking) {{
-                                        window.speechSynthesis.cancel();
-                                        setTimeout(function() {{
-                                            playAudio();
-                                        }}, 150);
-                                    }}
-                                }}
-                                
-                                function playAudio() {{
-                                    console.log('>>> Play button clicked for {response_id} >>>');
-                                    
-                                    if (!('speechSynthesis' in window)) {{
-                                        statusDiv.innerHTML = '❌ Speech synthesis not available';
-                                        console.error('Speech synthesis not available');
-                                        return;
-                                    }}
-                                    
-                                    try {{
-                                        // Cancel any ongoing speech
-                                        window.speechSynthesis.cancel();
-                                        
-                                        const text = {safe_text};
-                                        console.log('Text to speak (first 100 chars):', text.substring(0, 100));
-                                        console.log('Text length:', text.length);
-                                        
-                                        if (!text || text.trim() === '') {{
-                                            statusDiv.innerHTML = '❌ No text to speak';
-                                            console.error('No text provided');
-                                            return;
-                                        }}
-                                        
-                                        utterance_{response_id} = new SpeechSynthesisUtterance(text);
-                                        utterance_{response_id}.rate = currentSpeed_{response_id};
-                                        utterance_{response_id}.pitch = 1.0;
-                                        utterance_{response_id}.volume = 1.0;
-                                        utterance_{response_id}.lang = 'en-US';
-                                        
-                                        utterance_{response_id}.onstart = function() {{
-                                            console.log('✓ Speech STARTED for {response_id}');
-                                            isPlaying_{response_id} = true;
-                                            const estimatedTime = Math.round(text.length / currentSpeed_{response_id} / 15);
-                                            statusDiv.innerHTML = '🔊 <b>Playing</b> at ' + currentSpeed_{response_id} + 'x speed... (~' + estimatedTime + 's)';
-                                            playBtn.style.opacity = '0.6';
-                                            playBtn.style.transform = 'scale(0.95)';
-                                        }};
-                                        
-                                        utterance_{response_id}.onend = function() {{
-                                            console.log('✓ Speech ENDED for {response_id}');
-                                            isPlaying_{response_id} = false;
-                                            statusDiv.innerHTML = '✅ Audio finished playing';
-                                            playBtn.style.opacity = '1';
-                                            playBtn.style.transform = 'scale(1)';
-                                        }};
-                                        
-                                        utterance_{response_id}.onerror = function(event) {{
-                                            console.error('Speech ERROR for {response_id}:', event.error, event);
-                                            isPlaying_{response_id} = false;
-                                            let errorMsg = '❌ <b>Error:</b> ';
-                                            if (event.error === 'not-allowed') {{
-                                                errorMsg += 'Permission denied. Check browser settings.';
-                                            }} else if (event.error === 'network') {{
-                                                errorMsg += 'Network error. Check connection.';
-                                            }} else if (event.error === 'synthesis-failed') {{
-                                                errorMsg += 'Synthesis failed. Try again.';
-                                            }} else {{
-                                                errorMsg += event.error;
-                                            }}
-                                            statusDiv.innerHTML = errorMsg;
-                                            playBtn.style.opacity = '1';
-                                            playBtn.style.transform = 'scale(1)';
-                                        }};
-                                        
-                                        statusDiv.innerHTML = '⏳ Starting playback...';
-                                        console.log('Calling speechSynthesis.speak()...');
-                                        window.speechSynthesis.speak(utterance_{response_id});
-                                        
-                                    }} catch (error) {{
-                                        console.error('Exception in playAudio:', error);
-                                        statusDiv.innerHTML = '❌ Error: ' + error.message;
-                                    }}
-                                }}
-                                
-                                function stopAudio() {{
-                                    console.log('>>> Stop button clicked for {response_id} >>>');
-                                    
-                                    if ('speechSynthesis' in window) {{
-                                        window.speechSynthesis.cancel();
-                                        isPlaying_{response_id} = false;
-                                        statusDiv.innerHTML = '⏹️ Audio stopped';
-                                        playBtn.style.opacity = '1';
-                                        playBtn.style.transform = 'scale(1)';
-                                        console.log('✓ Audio stopped');
-                                    }}
-                                }}
-                                
-                                // Attach event listeners
-                                playBtn.addEventListener('click', playAudio);
-                                stopBtn.addEventListener('click', stopAudio);
-                                
-                                if (speed075) speed075.addEventListener('click', function() {{ setSpeed(0.75); }});
-                                if (speed10) speed10.addEventListener('click', function() {{ setSpeed(1.0); }});
-                                if (speed125) speed125.addEventListener('click', function() {{ setSpeed(1.25); }});
-                                if (speed15) speed15.addEventListener('click', function() {{ setSpeed(1.5); }});
-                                
-                                console.log('=== TTS Script {response_id} Ready ===');
-                            }})();
-                        </script>
-                        """
-                        
-                        st.markdown(tts_html, unsafe_allow_html=True)
-                        st.session_state.voice_component_key += 1
+            try:
+                # Prepare chat history within the token budget
+                groq_history, history_stats = build_history_window(
+                    session.messages[:-1],
+                    HISTORY_TOKEN_BUDGET,
+                    is_plan=detect_account_plan_intent
+                )
+                if history_stats["saved_tokens"]:
+                    add_research_note(
+                        f"Trimmed chat history: ~{history_stats['saved_tokens']} tokens saved "
+                        f"({history_stats['summarized_plans']} plans summarized, "
+                        f"{history_stats['dropped_messages']} messages dropped)"
+                    )
+                
+                turn = classify_turn(prompt, groq_history)
+                if pipeline.routing and turn != "plan":
+                    add_research_note(f"Routed {turn} turn to {ROUTES[turn].model}")
+                
+                if turn == "plan":
+                    speculative = speculator.take(session.session_id, prompt, session.messages[:-1]) if speculator else None
+                    if speculative is not None:
+                        # Generated in the background from this same conversation, so it can be used as is
+                        apply_speculative_plan(*speculative)
+                        st.rerun()
+                    running = speculator.adopt(session.session_id, prompt, session.messages[:-1]) if speculator else None
+                    if running is not None:
+                        # Already being written from this same conversation; render_jobs applies it when done
+                        st.session_state.watched_jobs.add(running)
+                        add_research_note(f"Waiting for the speculative account plan (job {running[:8]})")
+                        st.info("📋 The account plan is already being generated. It will appear here when ready.")
+                        return
+                    if speculator is not None:
+                        speculator.cancel(session.session_id)
                     
-                    # Check if account plan generated
-                    if detect_account_plan_intent(assistant_message):
-                        st.session_state.account_plan = parse_account_plan(assistant_message)
-                        st.success("✅ Account plan generated! Check the 'Account Plan' tab to view and edit.")
-                        add_research_note("Account plan created successfully")
+                    # Generated on the job pool; render_jobs picks the plan up when it is done
+                    parallel = st.session_state.parallel_plan_mode
+                    job_id = job_queue.submit(
+                        "plan",
+                        session.session_id,
+                        lambda report: run_plan_job(session.session_id, prompt, groq_history, parallel, report),
+                        description=f"Account plan: {prompt[:40]}"
+                    )
+                    st.session_state.watched_jobs.add(job_id)
+                    add_research_note(f"Queued account plan generation (job {job_id[:8]})")
+                    st.info("📋 Generating the account plan in the background. Keep chatting; it will appear here when ready.")
+                    return
                 
-                except Exception as e:
-                    st.error(f"Error: {str(e)}")
-                    add_research_note(f"Error occurred: {str(e)}")
+                # Spinner only covers the wait for the first token; the rest is rendered as it streams
+                with st.spinner("⚡ Researching with Groq AI..."):
+                    response_stream = call_groq_api(prompt, groq_history, stream=True, turn=turn)
+                assistant_message = st.write_stream(response_stream)
+                
+                # Add to session state
+                save_chat_message("assistant", assistant_message)
+                
+                # Voice output with browser TTS
+                if st.session_state.voice_mode:
+                    render_voice_response(assistant_message)
+                
+                if speculator is not None:
+                    # The history window a plan request would be sent with next turn
+                    plan_history, _ = build_history_window(
+                        session.messages, HISTORY_TOKEN_BUDGET, is_plan=detect_account_plan_intent
+                    )
+                    plan_company = session.plan_company if session.plan else None
+                    if speculator.maybe_speculate(session.session_id, session.messages, plan_history, plan_company):
+                        add_research_note("Preparing a speculative account plan in the background")
+            
+            except Exception as e:
+                st.error(f"Error: {str(e)}")
+                add_research_note(f"Error occurred: {str(e)}")
 
-with tab2:
-    if st.session_state.account_plan:
+def apply_speculative_plan(markdown: str, plan: Dict[str, str], company: str):
+    """Answer the current plan request with a speculative plan"""
+    session = current_session()
+    save_chat_message("assistant", markdown, session=session)
+    session.set_plan(plan, plan_store.save_plan(company, plan), company)
+    add_research_note(f"Account plan for {company} ready from speculative generation", session=session)
+    st.session_state.plan_notice = f"✅ Account plan for {company} generated and saved! Check the 'Account Plan' tab to view and edit."
+    st.session_state.speak_last_response = st.session_state.voice_mode
+
+# Where a failed job's error is shown, by job kind
+JOB_ERROR_KEYS = {"plan": "job_error", SPECULATIVE_PLAN: "job_error", "enhance": "enhance_error", "compare": "compare_error"}
+
+def finish_job(job: dict):
+    """Apply a finished job's result to the session state the tabs render from"""
+    if job["status"] != DONE:
+        st.session_state[JOB_ERROR_KEYS[job["kind"]]] = f"❌ {job['description']} failed: {job['error']}"
+        add_research_note(f"Error occurred: {job['error']}")
+        return
+    result = job["result"]
+    if job["kind"] == SPECULATIVE_PLAN:
+        apply_speculative_plan(result["markdown"], result["plan"], result["company"])
+    elif job["kind"] == "plan":
+        st.session_state.plan_notice = (
+            f"✅ Account plan for {result['company']} generated and saved! "
+            "Check the 'Account Plan' tab to view and edit."
+        )
+        st.session_state.speak_last_response = st.session_state.voice_mode
+    elif job["kind"] == "enhance":
+        # Editors keep their widget state across reruns; drop it so they show the enhanced text
+        if current_session().plan_id == result["plan_id"]:
+            for key in result["enhanced"]:
+                st.session_state[f"reload_{key}"] = True
+        if result["enhanced"]:
+            st.session_state.enhance_notice = f"✨ Enhanced {len(result['enhanced'])} sections!"
+    elif job["kind"] == "compare" and result["plans"]:
+        st.session_state.comparison = {key: result[key] for key in ("context", "plans", "reused")}
+    if result.get("failed_sections"):
+        st.session_state[JOB_ERROR_KEYS[job["kind"]]] = f"⚠️ Sections that failed: {', '.join(result['failed_sections'])}"
+
+@st.fragment(run_every=JOB_POLL_SECONDS)
+def render_jobs(kinds: tuple):
+    """Progress of this session's background jobs of the given kinds, polled; reruns the app when one finishes"""
+    watched = st.session_state.watched_jobs
+    active = job_queue.for_session(st.session_state.session_id, active_only=True)
+    for job in active:
+        if job["kind"] == SPECULATIVE_PLAN and SPECULATIVE_PLAN in kinds and job["id"] not in watched:
+            st.caption(f"🔮 {job['description']} ({job['status']})")
+    # Also pick up jobs submitted before a page reload or by another replica
+    watched.update(job["id"] for job in active if job["kind"] in kinds and job["kind"] != SPECULATIVE_PLAN)
+    for job in active:
+        if job["id"] not in watched or job["kind"] not in kinds:
+            continue
+        st.progress(job["progress"], text=f"⏳ {job['description']}: {job['message'] or job['status']}")
+        # Sections of a streamed plan that have already completed
+        if job["result"]:
+            with st.expander(f"Sections ready so far ({len(job['result'])}/{len(SECTION_TITLES)})"):
+                st.markdown(format_plan_markdown(job["result"]))
+    
+    # Finished jobs of other kinds are left for their own tab's poller
+    finished = []
+    for job_id in watched - {job["id"] for job in active}:
+        job = job_queue.get(job_id)
+        if job is None:
+            watched.discard(job_id)
+        elif job["kind"] in kinds:
+            finished.append(job)
+    if not finished:
+        return
+    for job in finished:
+        watched.discard(job["id"])
+        finish_job(job)
+    # Every tab and the sidebar show the result or error
+    st.rerun()
+
+with tab1:
+    render_chat()
+    render_jobs(("plan", SPECULATIVE_PLAN))
+
+def editor_key(plan_id: Optional[int], key: str) -> str:
+    """Widget key of a section editor; keyed by plan so a newly loaded plan never shows the last one's edits"""
+    return f"edit_{plan_id}_{key}"
+
+@st.fragment
+def render_section_editor(key: str, name: str):
+    """Editor for one plan section; Save and AI Enhance rerun only this fragment"""
+    session = current_session()
+    # After an enhancement, drop the editor's widget state so it shows the enhanced text
+    if st.session_state.pop(f"reload_{key}", False):
+        st.session_state.pop(editor_key(session.plan_id, key), None)
+    
+    with st.expander(f"📌 {name}", expanded=True):
+        current_content = session.plan.get(key, "Not available")
+        
+        edited_content = st.text_area(
+            f"Edit {name}",
+            value=current_content,
+            height=200,
+            key=editor_key(session.plan_id, key),
+            label_visibility="collapsed"
+        )
+        
+        col1, col2 = st.columns([1, 4])
+        with col1:
+            if st.button(f"💾 Save", key=f"save_{key}"):
+                session.update_sections({key: edited_content})
+                if session.plan_id:
+                    plan_store.save_section(session.plan_id, key, edited_content, kind="edit")
+                add_research_note(f"Updated {name}")
+                st.toast(f"✅ Saved {name}!", icon="💾")
+        
+        with col2:
+            if st.button(f"✨ AI Enhance", key=f"enhance_{key}"):
+                # First save any edits, then enhance them on the job pool; render_jobs reloads the editor when done
+                session.update_sections({key: edited_content})
+                # Bound now: the job may start after another plan has been loaded
+                plan_id = session.plan_id
+                job_id = job_queue.submit(
+                    "enhance",
+                    session.session_id,
+                    lambda report: run_enhance_job(session.session_id, plan_id, {key: edited_content}, report),
+                    description=f"Enhancing {name}"
+                )
+                st.session_state.watched_jobs.add(job_id)
+                st.info(f"🤖 Enhancing {name} in the background...")
+
+def render_account_plan():
+    """Account Plan tab: downloads, Enhance All and one editor fragment per section"""
+    session = current_session()
+    if session.plan:
         st.markdown('<p class="section-header">📄 Account Plan</p>', unsafe_allow_html=True)
+        if session.plan_company:
+            st.caption(f"🏢 {session.plan_company}")
         
         col1, col2, col3 = st.columns([1, 1, 2])
         
+        # Exports are built when clicked (on a download thread, so without st.session_state)
+        # from the plan dict that section fragments save into, and reused until the plan changes
+        plan = session.plan
+        plan_exports = session.exports
+        
         with col1:
-            json_data = json.dumps(st.session_state.account_plan, indent=2)
             st.download_button(
                 label="📥 Download JSON",
-                data=json_data,
+                data=lambda: plan_exports.get(plan, "json"),
                 file_name=f"account_plan_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json",
                 mime="application/json",
                 use_container_width=True
             )
         
         with col2:
-            text_data = generate_text_export()
             st.download_button(
                 label="📋 Download Text",
-                data=text_data,
+                data=lambda: plan_exports.get(plan, "text"),
                 file_name=f"account_plan_{datetime.now().strftime('%Y%m%d_%H%M%S')}.txt",
                 mime="text/plain",
                 use_container_width=True
             )
         
-        st.markdown("---")
+        with col3:
+            enhance_all_clicked = st.button("✨ Enhance All Sections", use_container_width=True)
         
-        section_names = {
-            "executive_summary": "Executive Summary",
-            "company_overview": "Company Overview",
-            "business_model": "Business Model & Products/Services",
-            "market_position": "Market Position & Competitors",
-            "recent_news": "Recent News & Strategic Initiatives",
-            "key_stakeholders": "Key Stakeholders & Decision Makers",
-            "pain_points": "Pain Points & Challenges",
-            "opportunities": "Opportunities & Recommendations",
-            "engagement_strategy": "Engagement Strategy",
-            "next_steps": "Next Steps"
-        }
+        if enhance_all_clicked:
+            # Include unsaved edits, as the per-section AI Enhance button does
+            current_sections = {
+                key: st.session_state.get(editor_key(session.plan_id, key), content)
+                for key, content in session.plan.items()
+            }
+            plan_id = session.plan_id
+            job_id = job_queue.submit(
+                "enhance",
+                session.session_id,
+                lambda report: run_enhance_job(session.session_id, plan_id, current_sections, report),
+                description="Enhancing all sections"
+            )
+            st.session_state.watched_jobs.add(job_id)
         
-        for key, name in section_names.items():
-            with st.expander(f"📌 {name}", expanded=True):
-                current_content = st.session_state.account_plan.get(key, "Not available")
-                
-                edited_content = st.text_area(
-                    f"Edit {name}",
-                    value=current_content,
-                    height=200,
-                    key=f"edit_{key}",
-                    label_visibility="collapsed"
-                )
-                
-                col1, col2 = st.columns([1, 4])
-                with col1:
-                    if st.button(f"💾 Save", key=f"save_{key}"):
-                        st.session_state.account_plan[key] = edited_content
-                        add_research_note(f"Updated {name}")
-                        st.toast(f"✅ Saved {name}!", icon="💾")
-                        st.rerun()
-                
-                with col2:
-                    if st.button(f"✨ AI Enhance", key=f"enhance_{key}"):
-                        with st.spinner(f"🤖 AI is enhancing {name}..."):
-                            try:
-                                # First save any edits, then enhance
-                                original_content = edited_content
-                                st.session_state.account_plan[key] = edited_content
-                                
-                                # Call AI enhancement
-                                enhanced_text = enhance_section(edited_content, name)
-                                
-                                # Debug: Check if content actually changed
-                                original_length = len(original_content)
-                                enhanced_length = len(enhanced_text) if enhanced_text else 0
-                                
-                                # Only update if we got a valid response
-                                if enhanced_text and enhanced_text.strip():
-                                    st.session_state.account_plan[key] = enhanced_text
-                                    add_research_note(f"✨ AI-enhanced {name} ({original_length} → {enhanced_length} chars)")
-                                    
-                                    # Show change info
-                                    if enhanced_length > original_length * 1.2:
-                                        st.toast(f"✨ Enhanced {name}! (+{enhanced_length - original_length} chars)", icon="🤖")
-                                    elif enhanced_length > original_length:
-                                        st.toast(f"✨ Enhanced {name}! (slightly improved)", icon="🤖")
-                                    else:
-                                        st.toast(f"⚠️ Enhanced {name} (no significant change)", icon="🤖")
-                                    st.rerun()
-                                else:
-                                    st.error("Enhancement returned empty content")
-                            except Exception as e:
-                                st.error(f"❌ Error enhancing: {str(e)}")
-                                import traceback
-                                st.error(traceback.format_exc())
+        if enhance_notice := st.session_state.pop("enhance_notice", None):
+            st.success(enhance_notice)
+        if enhance_error := st.session_state.pop("enhance_error", None):
+            st.error(enhance_error)
+        render_jobs(("enhance",))
+        
+        st.markdown("---")
+        
+        for key, name in SECTION_TITLES.items():
+            render_section_editor(key, name)
     
     else:
         st.info("👈 Start a research conversation in the Chat tab to generate an account plan!")
@@ -1146,6 +1325,117 @@ with tab2:
         ✅ **Edge Cases** - Graceful handling of invalid inputs  
         """)
 
+with tab2:
+    render_account_plan()
+
+@st.fragment
+def render_comparison():
+    """Account plans for several companies side by side, aligned section by section"""
+    st.markdown('<p class="section-header">🆚 Compare Companies</p>', unsafe_allow_html=True)
+    company_input = st.text_input(
+        "Companies to compare",
+        placeholder="e.g. Snowflake, Databricks, Teradata",
+        help=f"Comma-separated, 2 to {COMPARE_MAX_COMPANIES} companies"
+    )
+    focus = st.text_input("Focus (optional)", placeholder="e.g. data platform modernization")
+    reuse_saved = st.checkbox("Reuse saved plans when available", value=True)
+    
+    if st.button("🆚 Compare", use_container_width=True):
+        companies = split_company_list(company_input)
+        if not 2 <= len(companies) <= COMPARE_MAX_COMPANIES:
+            st.warning(f"Enter between 2 and {COMPARE_MAX_COMPANIES} companies")
+        else:
+            existing = {}
+            if reuse_saved:
+                for company in companies:
+                    saved = plan_store.latest_plan(company)
+                    if saved:
+                        existing[company] = saved["sections"]
+            
+            # Generated on the job pool; render_jobs shows the comparison when it is done
+            session_id = st.session_state.session_id
+            job_id = job_queue.submit(
+                "compare",
+                session_id,
+                lambda report: run_comparison_job(session_id, companies, focus, existing, report),
+                description=f"Comparing {', '.join(companies)}"
+            )
+            st.session_state.watched_jobs.add(job_id)
+            st.info("🆚 Comparing in the background. The plans will appear below when ready.")
+    
+    if compare_error := st.session_state.pop("compare_error", None):
+        st.error(compare_error)
+    
+    comparison = st.session_state.comparison
+    if not comparison:
+        st.info("Enter two or more companies to compare their account plans side by side.")
+        return
+    
+    if comparison["reused"]:
+        st.caption(f"💾 Reused saved plans: {', '.join(comparison['reused'])}")
+    if comparison["context"]:
+        with st.expander("🌐 Shared Industry Context", expanded=False):
+            st.markdown(comparison["context"])
+    
+    for key, by_company in align_sections(comparison["plans"]).items():
+        with st.expander(f"📌 {SECTION_TITLES[key]}", expanded=key == "executive_summary"):
+            for column, (company, content) in zip(st.columns(len(by_company)), by_company.items()):
+                with column:
+                    st.markdown(f"**{company}**")
+                    st.markdown(content or "_Not available_")
+
+with tab3:
+    render_comparison()
+    render_jobs(("compare",))
+
+@st.fragment
+def render_search():
+    """Full-text search over every saved plan section and this session's chat messages"""
+    st.markdown('<p class="section-header">🔎 Search Plans & Chats</p>', unsafe_allow_html=True)
+    col1, col2 = st.columns([3, 1])
+    with col1:
+        query = st.text_input("Search", placeholder="e.g. kubernetes migration", label_visibility="collapsed")
+    with col2:
+        section = st.selectbox(
+            "Section",
+            [None, *SECTION_TITLES],
+            format_func=lambda key: "All sections" if key is None else SECTION_TITLES[key],
+            label_visibility="collapsed"
+        )
+    
+    if not query.strip():
+        st.info("Search every saved account plan and this conversation, e.g. which accounts mention a Kubernetes migration as a pain point.")
+        return
+    
+    started = time.perf_counter()
+    section_hits = plan_store.search_sections(query, section=section)
+    message_hits = plan_store.search_messages(query, st.session_state.session_id) if section is None else []
+    st.caption(
+        f"{len(section_hits)} plan sections and {len(message_hits)} chat messages "
+        f"in {(time.perf_counter() - started) * 1000:.0f} ms"
+    )
+    
+    for hit in section_hits:
+        with st.container(border=True):
+            st.markdown(
+                f"**{hit['company']}** · {SECTION_TITLES.get(hit['section'], hit['section'])} · "
+                f"{datetime.fromtimestamp(hit['updated_at']).strftime('%Y-%m-%d %H:%M')}"
+            )
+            st.markdown(hit["snippet"])
+            if st.button("📂 Open Plan", key=f"open_{hit['plan_id']}_{hit['section']}"):
+                load_saved_plan(plan_store.get_plan(hit["plan_id"]))
+                st.rerun()
+    
+    for hit in message_hits:
+        with st.container(border=True):
+            role = "🧑 You" if hit["role"] == "user" else "🤖 Assistant"
+            company = f" · {hit['company']}" if hit["company"] else ""
+            st.markdown(f"{role}{company} · {datetime.fromtimestamp(hit['created_at']).strftime('%Y-%m-%d %H:%M')}")
+            st.markdown(hit["snippet"])
+
+with tab4:
+    render_search()
+
 st.markdown("---")
 st.markdown("""
 <div style='text-align: center; color: #666; padding: 1rem;'>
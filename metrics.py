@@ -0,0 +1,187 @@
+"""Per-call Groq instrumentation: latency and token histograms by call site, and model routing"""
+import bisect
+import threading
+from collections import deque
+from typing import Deque, Dict, List, NamedTuple, Optional, Tuple
+
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+TOKEN_BUCKETS = (64, 128, 256, 512, 1024, 2048, 4096, 8192, 16384)
+
+# metric name -> (CallRecord field, buckets, help text)
+HISTOGRAMS = {
+    "groq_call_queue_wait_seconds": (
+        "queue_wait", LATENCY_BUCKETS, "Time spent waiting for rate limits, concurrency slots and retries"
+    ),
+    "groq_call_time_to_first_token_seconds": (
+        "ttft", LATENCY_BUCKETS, "Time from sending a streamed request to its first content token"
+    ),
+    "groq_call_duration_seconds": (
+        "total", LATENCY_BUCKETS, "Time from the call starting to the last byte of the response, queue wait included"
+    ),
+    "groq_call_prompt_tokens": ("prompt_tokens", TOKEN_BUCKETS, "Prompt tokens reported in response.usage"),
+    "groq_call_completion_tokens": ("completion_tokens", TOKEN_BUCKETS, "Completion tokens reported in response.usage"),
+}
+
+
+class CallRecord(NamedTuple):
+    """One Groq call; fields are None when not measured (e.g. no TTFT for non-streamed calls)"""
+    call_site: str
+    queue_wait: float
+    ttft: Optional[float]
+    total: float
+    prompt_tokens: Optional[int]
+    completion_tokens: Optional[int]
+    error: Optional[str] = None
+    model: Optional[str] = None
+
+
+class Histogram:
+    """Cumulative-bucket histogram in the Prometheus style"""
+
+    def __init__(self, buckets: Tuple[float, ...]):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # last slot is +Inf
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th observation (the last finite bound for +Inf)"""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for index, count in enumerate(self.counts):
+            seen += count
+            if seen >= rank and count:
+                return self.buckets[min(index, len(self.buckets) - 1)]
+        return self.buckets[-1]
+
+
+class CallMetrics:
+    """Thread-safe registry of Groq call records, shared by every session"""
+
+    def __init__(self, recent_calls: int = 50, reference_model: Optional[str] = None):
+        self.recent: Deque[CallRecord] = deque(maxlen=recent_calls)
+        self.calls: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self.routes: Dict[Tuple[str, str], int] = {}
+        self.reference_model = reference_model
+        self._histograms: Dict[Tuple[str, str], Histogram] = {}
+        # model -> [successful calls, seconds, completion tokens]
+        self._model_totals: Dict[str, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def record(self, record: CallRecord) -> None:
+        with self._lock:
+            self.recent.append(record)
+            self.calls[record.call_site] = self.calls.get(record.call_site, 0) + 1
+            if record.error:
+                self.errors[record.call_site] = self.errors.get(record.call_site, 0) + 1
+            elif record.model and record.completion_tokens:
+                totals = self._model_totals.setdefault(record.model, [0, 0.0, 0])
+                totals[0] += 1
+                totals[1] += record.total
+                totals[2] += record.completion_tokens
+            for name, (field, buckets, _) in HISTOGRAMS.items():
+                value = getattr(record, field)
+                if value is None:
+                    continue
+                histogram = self._histograms.get((name, record.call_site))
+                if histogram is None:
+                    histogram = self._histograms[(name, record.call_site)] = Histogram(buckets)
+                histogram.observe(value)
+
+    def record_route(self, route: str, model: str) -> None:
+        with self._lock:
+            self.routes[(route, model)] = self.routes.get((route, model), 0) + 1
+
+    def estimated_seconds_saved(self) -> Optional[float]:
+        """Estimated latency saved by calls routed away from reference_model
+
+        Each other model's completion tokens are priced at the reference model's
+        observed seconds per completion token, minus the time they actually took.
+        None until the reference model has completed a call.
+        """
+        with self._lock:
+            reference = self._model_totals.get(self.reference_model)
+            if not reference:
+                return None
+            seconds_per_token = reference[1] / reference[2]
+            return sum(
+                tokens * seconds_per_token - seconds
+                for model, (_, seconds, tokens) in self._model_totals.items()
+                if model != self.reference_model
+            )
+
+    def routing_summary(self) -> List[Dict]:
+        """One row per (route, model) for the diagnostics panel"""
+        with self._lock:
+            return [
+                {"route": route, "model": model, "turns": count}
+                for (route, model), count in sorted(self.routes.items())
+            ]
+
+    def summary(self) -> List[Dict]:
+        """One row per call site for the diagnostics panel (latency quantiles are bucket upper bounds)"""
+        with self._lock:
+            rows = []
+            for call_site in sorted(self.calls):
+                duration = self._histograms.get(("groq_call_duration_seconds", call_site))
+                ttft = self._histograms.get(("groq_call_time_to_first_token_seconds", call_site))
+                queue_wait = self._histograms.get(("groq_call_queue_wait_seconds", call_site))
+                prompt = self._histograms.get(("groq_call_prompt_tokens", call_site))
+                completion = self._histograms.get(("groq_call_completion_tokens", call_site))
+                rows.append({
+                    "call_site": call_site,
+                    "calls": self.calls[call_site],
+                    "errors": self.errors.get(call_site, 0),
+                    "p50_seconds": duration.quantile(0.5) if duration else None,
+                    "p95_seconds": duration.quantile(0.95) if duration else None,
+                    "p50_ttft_seconds": ttft.quantile(0.5) if ttft else None,
+                    "avg_queue_wait_seconds": round(queue_wait.sum / queue_wait.count, 3) if queue_wait else None,
+                    "prompt_tokens": int(prompt.sum) if prompt else 0,
+                    "completion_tokens": int(completion.sum) if completion else 0
+                })
+            return rows
+
+    def prometheus_text(self) -> str:
+        """All histograms and counters in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            for name, (_, buckets, help_text) in HISTOGRAMS.items():
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} histogram")
+                for (metric, call_site), histogram in sorted(self._histograms.items()):
+                    if metric != name:
+                        continue
+                    label = f'call_site="{call_site}"'
+                    cumulative = 0
+                    for bound, count in zip(buckets + (float("inf"),), histogram.counts):
+                        cumulative += count
+                        le = "+Inf" if bound == float("inf") else f"{bound:g}"
+                        lines.append(f'{name}_bucket{{{label},le="{le}"}} {cumulative}')
+                    lines.append(f"{name}_sum{{{label}}} {histogram.sum:g}")
+                    lines.append(f"{name}_count{{{label}}} {histogram.count}")
+            for name, counts, help_text in (
+                ("groq_calls_total", self.calls, "Groq calls made, including failed ones"),
+                ("groq_call_errors_total", self.errors, "Groq calls that raised after retries"),
+            ):
+                lines.append(f"# HELP {name} {help_text}")
+                lines.append(f"# TYPE {name} counter")
+                for call_site, count in sorted(counts.items()):
+                    lines.append(f'{name}{{call_site="{call_site}"}} {count}')
+            lines.append("# HELP groq_route_decisions_total Turns routed to each model, by turn kind")
+            lines.append("# TYPE groq_route_decisions_total counter")
+            for (route, model), count in sorted(self.routes.items()):
+                lines.append(f'groq_route_decisions_total{{route="{route}",model="{model}"}} {count}')
+        saved = self.estimated_seconds_saved()
+        if saved is not None:
+            lines.append("# HELP groq_route_estimated_seconds_saved Latency saved by routing turns to smaller models")
+            lines.append("# TYPE groq_route_estimated_seconds_saved gauge")
+            lines.append(f"groq_route_estimated_seconds_saved {saved:g}")
+        return "\n".join(lines) + "\n"
@@ -0,0 +1,71 @@
+"""Plain-text and JSON renderings of an account plan"""
+import hashlib
+import io
+import json
+import threading
+from datetime import datetime
+from typing import Callable, Dict, TextIO, Tuple
+
+from plan_parser import SECTION_TITLES
+
+RULE = "=" * 70
+
+
+def write_plan_text(plan: Dict[str, str], generated_at: datetime, out: TextIO) -> None:
+    """Write the formatted text export of an account plan to out"""
+    out.write(f"{RULE}\nCOMPANY RESEARCH ACCOUNT PLAN\n")
+    out.write(f"Generated: {generated_at.strftime('%Y-%m-%d %H:%M:%S')}\n")
+    out.write(f"{RULE}\n\n")
+
+    for key, name in SECTION_TITLES.items():
+        out.write(f"\n{RULE}\n{name.upper()}\n{RULE}\n\n")
+        out.write(plan.get(key, "Not available").strip())
+        out.write("\n\n")
+
+    out.write(f"\n{RULE}\nEND OF REPORT\n{RULE}\n")
+
+
+def format_plan_text(plan: Dict[str, str], generated_at: datetime) -> str:
+    """Generate formatted text export of account plan"""
+    out = io.StringIO()
+    write_plan_text(plan, generated_at, out)
+    return out.getvalue()
+
+
+def format_plan_json(plan: Dict[str, str]) -> str:
+    out = io.StringIO()
+    json.dump(plan, out, indent=2)
+    return out.getvalue()
+
+
+EXPORT_FORMATS: Dict[str, Callable[[Dict[str, str]], str]] = {
+    "json": format_plan_json,
+    "text": lambda plan: format_plan_text(plan, datetime.now()),
+}
+
+
+class PlanExports:
+    """Exports of the current plan, built on first download and reused while the plan is unchanged
+
+    Cached exports are keyed by a hash of the plan contents they were built from,
+    so an export is never served for another version of the plan, whenever the
+    plan changed. get() may run on a download thread, so access is locked.
+    """
+
+    def __init__(self):
+        self._built: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, plan: Dict[str, str], export_format: str) -> str:
+        """The plan rendered in export_format ("json" or "text"), from cache when built from the same contents"""
+        # A copy, so the export and its key describe the same contents even if a section is saved meanwhile
+        plan = dict(plan)
+        key = hashlib.sha256(json.dumps(plan, sort_keys=True).encode("utf-8")).hexdigest()
+        with self._lock:
+            built = self._built.get(export_format)
+            if built is not None and built[0] == key:
+                return built[1]
+        content = EXPORT_FORMATS[export_format](plan)
+        with self._lock:
+            self._built[export_format] = (key, content)
+        return content
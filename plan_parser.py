@@ -0,0 +1,195 @@
+"""Account plan section definitions, the single-pass plan parser and the JSON plan readers (whole and streamed)"""
+import json
+import re
+from typing import Dict, List, NamedTuple, Optional
+
+# Account plan sections in the order they appear in SYSTEM_PROMPT
+SECTION_TITLES = {
+    "executive_summary": "Executive Summary",
+    "company_overview": "Company Overview",
+    "business_model": "Business Model & Products/Services",
+    "market_position": "Market Position & Competitors",
+    "recent_news": "Recent News & Strategic Initiatives",
+    "key_stakeholders": "Key Stakeholders & Decision Makers",
+    "pain_points": "Pain Points & Challenges",
+    "opportunities": "Opportunities & Recommendations",
+    "engagement_strategy": "Engagement Strategy",
+    "next_steps": "Next Steps"
+}
+
+# Header phrases that identify each section; extend together with SECTION_TITLES
+SECTION_MARKERS = {
+    "Executive Summary": "executive_summary",
+    "Company Overview": "company_overview",
+    "Business Model": "business_model",
+    "Market Position": "market_position",
+    "Recent News": "recent_news",
+    "Key Stakeholders": "key_stakeholders",
+    "Pain Points": "pain_points",
+    "Opportunities": "opportunities",
+    "Engagement Strategy": "engagement_strategy",
+    "Next Steps": "next_steps"
+}
+
+_MARKER_KEYS = {marker.lower(): key for marker, key in SECTION_MARKERS.items()}
+_MARKERS = "|".join(re.escape(marker) for marker in SECTION_MARKERS)
+
+# A header line is one of:
+#   "## 3. Business Model & Products/Services"   (markdown header mentioning a marker)
+#   "**Pain Points & Challenges:**"              (a line that is entirely bold)
+#   "7. Pain Points & Challenges:"               (a plain line holding only a section title)
+# Body lines such as "- **Pain Points**: churn" or "Next steps: call the CFO" are not headers.
+HEADER_PATTERN = re.compile(
+    rf"""^[ \t]*(?:
+        \#{{1,6}}[^\n]*?\b(?P<md>{_MARKERS})\b[^\n]*
+      | \*\*[ \t]*(?:\d+[.)][ \t]*)?(?P<bold>{_MARKERS})\b[^\n*]{{0,60}}\*\*[ \t]*:?
+      | (?:\d+[.)][ \t]*)?(?P<plain>{_MARKERS})\b(?:[ \t]*(?:&|and)[ \t]*[\w/ ]{{1,40}})?[ \t]*:?
+    )[ \t]*$""",
+    re.IGNORECASE | re.MULTILINE | re.VERBOSE
+)
+
+
+class SectionSpan(NamedTuple):
+    """Offsets into the source text: header line and the body that follows it"""
+    key: str
+    header_start: int
+    start: int
+    end: int
+
+
+def parse_section_spans(text: str) -> List[SectionSpan]:
+    """Locate every section header in one regex pass and return body spans in document order"""
+    headers = []
+    for match in HEADER_PATTERN.finditer(text):
+        marker = match.group("md") or match.group("bold") or match.group("plain")
+        body_start = match.end() + 1 if match.end() < len(text) else match.end()
+        headers.append((_MARKER_KEYS[marker.lower()], match.start(), body_start))
+
+    spans = []
+    for index, (key, header_start, start) in enumerate(headers):
+        end = headers[index + 1][1] if index + 1 < len(headers) else len(text)
+        spans.append(SectionSpan(key, header_start, start, max(start, end)))
+    return spans
+
+
+def section_body(text: str, span: SectionSpan) -> str:
+    """Body text of a span with blank lines removed, one trailing newline per line"""
+    return "".join(line + "\n" for line in text[span.start:span.end].split("\n") if line.strip())
+
+
+def parse_account_plan(text: str) -> Dict[str, str]:
+    """Parse the account plan from AI response"""
+    sections = {key: "" for key in SECTION_TITLES}
+    for span in parse_section_spans(text):
+        sections[span.key] += section_body(text, span)
+    return sections
+
+
+def parse_plan_json(text: str) -> Dict[str, str]:
+    """Sections of a plan generated as a JSON object keyed by section id
+
+    Unknown keys and empty sections are dropped; raises ValueError if the text is
+    not a JSON object or holds no section.
+    """
+    data = json.loads(text)
+    if not isinstance(data, dict):
+        raise ValueError("plan JSON is not an object")
+    sections = {
+        key: data[key].strip()
+        for key in SECTION_TITLES
+        if isinstance(data.get(key), str) and data[key].strip()
+    }
+    if not sections:
+        raise ValueError("plan JSON has no sections")
+    return sections
+
+
+def salvage_plan(text: str) -> Dict[str, str]:
+    """Sections recoverable from a plan response that is not valid JSON
+
+    Covers a JSON response cut off at max_tokens (its completed sections) and a model
+    that answered in markdown instead; empty if neither yields a section.
+    """
+    parser = IncrementalPlanParser()
+    parser.feed(text)
+    markdown = {key: body.strip() for key, body in parse_account_plan(text).items() if body.strip()}
+    return max(parser.sections, markdown, key=len)
+
+
+def align_sections(plans: Dict[str, Dict[str, str]]) -> Dict[str, Dict[str, str]]:
+    """Regroup parsed plans by section: {section_key: {company: content}}, in SECTION_TITLES order"""
+    return {
+        key: {company: sections.get(key, "") for company, sections in plans.items()}
+        for key in SECTION_TITLES
+    }
+
+
+class IncrementalPlanParser:
+    """Read a JSON plan from streamed chunks, completing each section as its string value closes
+
+    Feeding a response chunk by chunk and calling close() yields the same dict
+    as parse_plan_json on the full text.
+    """
+
+    def __init__(self):
+        self.sections: Dict[str, str] = {}
+        self._chunks: List[str] = []
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self._literal: List[str] = []
+        self._key: Optional[str] = None
+        self._expect_value = False
+
+    def feed(self, chunk: str) -> List[str]:
+        """Consume a chunk; returns the keys of sections completed by it"""
+        self._chunks.append(chunk)
+        completed = []
+        for char in chunk:
+            if self._in_string:
+                if self._escape:
+                    self._escape = False
+                elif char == "\\":
+                    self._escape = True
+                elif char == '"':
+                    self._in_string = False
+                    if self._depth == 1:
+                        key = self._finish_string()
+                        if key:
+                            completed.append(key)
+                    continue
+                if self._depth == 1:
+                    self._literal.append(char)
+            elif char == '"':
+                self._in_string = True
+                self._literal = []
+            elif char in "{[":
+                self._depth += 1
+            elif char in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and char == ":":
+                self._expect_value = True
+            elif self._depth == 1 and char == ",":
+                # Also ends a non-string value, which is ignored
+                self._key = None
+                self._expect_value = False
+        return completed
+
+    def close(self) -> Dict[str, str]:
+        """Parse the complete response; raises ValueError as parse_plan_json does"""
+        return parse_plan_json("".join(self._chunks))
+
+    def _finish_string(self) -> Optional[str]:
+        """Record a top-level key, or complete its section when this was a section's value"""
+        try:
+            text = json.loads('"' + "".join(self._literal) + '"')
+        except ValueError:
+            text = None
+        if not self._expect_value:
+            self._key = text
+            return None
+        key, self._key, self._expect_value = self._key, None, False
+        if key in SECTION_TITLES and text and text.strip():
+            self.sections[key] = text.strip()
+            return key
+        return None
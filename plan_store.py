@@ -0,0 +1,275 @@
+"""Persistent SQLite store for account plans and their section edits"""
+import os
+import re
+import sqlite3
+import threading
+import time
+from typing import Dict, List, Optional
+
+from plan_parser import SECTION_TITLES
+
+_QUERY_TERM = re.compile(r"\w+")
+
+# Words that match nearly every document and say nothing about what is being searched for
+STOPWORDS = frozenset("""
+    a an and are as at be been but by can could did do does for from had has have how i if in into is it
+    its me my no not of on or our so than that the their them then there these they this those to us
+    was we were what when where which who why will with would you your
+""".split())
+
+_COMPANY_SUFFIXES = re.compile(
+    r"\b(inc|incorporated|corp|corporation|co|company|ltd|limited|llc|plc|gmbh|ag|sa)\b\.?$"
+)
+
+
+def company_key(company: str) -> str:
+    """Normalize a company name for lookup, so "Tesla, Inc." and "tesla" share plans"""
+    key = re.sub(r"[^\w&\s]", " ", company.lower())
+    key = " ".join(key.split())
+    key = _COMPANY_SUFFIXES.sub("", key).strip()
+    return key or company.strip().lower()
+
+
+def query_terms(text: str) -> List[str]:
+    """Lowercased words of free text, without stopwords"""
+    return [term for term in _QUERY_TERM.findall(text.lower()) if term not in STOPWORDS]
+
+
+def fts_query(text: str) -> Optional[str]:
+    """FTS5 MATCH expression for free text: any term may match, BM25 ranks documents matching more terms first"""
+    terms = query_terms(text)
+    return " OR ".join(f'"{term}"' for term in terms) if terms else None
+
+
+class PlanStore:
+    """Account plans indexed by company, creation time and section, in SQLite WAL mode
+
+    Plan sections and chat messages are also full-text indexed (FTS5, BM25
+    ranking). Triggers keep the index in step with every insert and update.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.row_factory = sqlite3.Row
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        fts_exists = self._conn.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'plan_sections_fts'"
+        ).fetchone() is not None
+        self._conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS plans (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                company TEXT NOT NULL,
+                company_key TEXT NOT NULL,
+                source TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                updated_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_plans_company ON plans(company_key, created_at DESC);
+            CREATE INDEX IF NOT EXISTS idx_plans_created ON plans(created_at DESC);
+
+            CREATE TABLE IF NOT EXISTS plan_sections (
+                plan_id INTEGER NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+                section TEXT NOT NULL,
+                content TEXT NOT NULL,
+                updated_at REAL NOT NULL,
+                PRIMARY KEY (plan_id, section)
+            );
+            CREATE INDEX IF NOT EXISTS idx_sections_section ON plan_sections(section, updated_at DESC);
+
+            CREATE TABLE IF NOT EXISTS section_edits (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                plan_id INTEGER NOT NULL REFERENCES plans(id) ON DELETE CASCADE,
+                section TEXT NOT NULL,
+                kind TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_edits_plan ON section_edits(plan_id, section, created_at);
+
+            CREATE TABLE IF NOT EXISTS chat_messages (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                company TEXT,
+                role TEXT NOT NULL,
+                content TEXT NOT NULL,
+                created_at REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS idx_messages_session ON chat_messages(session_id);
+
+            -- External-content index keyed by plan_sections' implicit rowid; VACUUM can renumber
+            -- those, so run INSERT INTO plan_sections_fts(plan_sections_fts) VALUES ('rebuild') after one
+            CREATE VIRTUAL TABLE IF NOT EXISTS plan_sections_fts USING fts5(
+                content, content='plan_sections', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS plan_sections_fts_insert AFTER INSERT ON plan_sections BEGIN
+                INSERT INTO plan_sections_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS plan_sections_fts_update AFTER UPDATE OF content ON plan_sections BEGIN
+                INSERT INTO plan_sections_fts(plan_sections_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+                INSERT INTO plan_sections_fts(rowid, content) VALUES (new.rowid, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS plan_sections_fts_delete AFTER DELETE ON plan_sections BEGIN
+                INSERT INTO plan_sections_fts(plan_sections_fts, rowid, content) VALUES ('delete', old.rowid, old.content);
+            END;
+
+            CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+                content, content='chat_messages', content_rowid='id', tokenize='porter unicode61'
+            );
+            CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+                INSERT INTO chat_messages_fts(rowid, content) VALUES (new.id, new.content);
+            END;
+            CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+                INSERT INTO chat_messages_fts(chat_messages_fts, rowid, content) VALUES ('delete', old.id, old.content);
+            END;
+            """
+        )
+        if not fts_exists:
+            # Index sections saved before full-text search existed
+            self._conn.execute("INSERT INTO plan_sections_fts(plan_sections_fts) VALUES ('rebuild')")
+        self._conn.commit()
+
+    def save_plan(self, company: str, sections: Dict[str, str], source: str = "chat") -> int:
+        """Store a freshly parsed plan and return its id"""
+        now = time.time()
+        with self._lock, self._conn:
+            cursor = self._conn.execute(
+                "INSERT INTO plans (company, company_key, source, created_at, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (company, company_key(company), source, now, now)
+            )
+            plan_id = cursor.lastrowid
+            self._conn.executemany(
+                "INSERT INTO plan_sections (plan_id, section, content, updated_at) VALUES (?, ?, ?, ?)",
+                [(plan_id, section, content, now) for section, content in sections.items()]
+            )
+        return plan_id
+
+    def save_section(self, plan_id: int, section: str, content: str, kind: str = "edit") -> None:
+        """Update one section of a stored plan and record the change ("edit" or "enhance")"""
+        now = time.time()
+        with self._lock, self._conn:
+            # Upsert rather than INSERT OR REPLACE: REPLACE deletes without firing the index triggers
+            self._conn.execute(
+                """INSERT INTO plan_sections (plan_id, section, content, updated_at) VALUES (?, ?, ?, ?)
+                   ON CONFLICT(plan_id, section) DO UPDATE SET content = excluded.content, updated_at = excluded.updated_at""",
+                (plan_id, section, content, now)
+            )
+            self._conn.execute(
+                "INSERT INTO section_edits (plan_id, section, kind, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (plan_id, section, kind, content, now)
+            )
+            self._conn.execute("UPDATE plans SET updated_at = ? WHERE id = ?", (now, plan_id))
+
+    def get_plan(self, plan_id: int) -> Optional[Dict]:
+        """Plan record with its sections, or None if it does not exist"""
+        with self._lock:
+            row = self._conn.execute("SELECT * FROM plans WHERE id = ?", (plan_id,)).fetchone()
+            if row is None:
+                return None
+            section_rows = self._conn.execute(
+                "SELECT section, content FROM plan_sections WHERE plan_id = ?", (plan_id,)
+            ).fetchall()
+        sections = {key: "" for key in SECTION_TITLES}
+        sections.update({r["section"]: r["content"] for r in section_rows})
+        return {
+            "id": row["id"],
+            "company": row["company"],
+            "source": row["source"],
+            "created_at": row["created_at"],
+            "updated_at": row["updated_at"],
+            "sections": sections
+        }
+
+    def latest_plan(self, company: str) -> Optional[Dict]:
+        """Most recent plan for a company (matched on the normalized name)"""
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT id FROM plans WHERE company_key = ? ORDER BY created_at DESC LIMIT 1",
+                (company_key(company),)
+            ).fetchone()
+        return self.get_plan(row["id"]) if row else None
+
+    def list_companies(self) -> List[Dict]:
+        """One entry per company with its plan count and latest update, most recent first"""
+        with self._lock:
+            rows = self._conn.execute(
+                """SELECT company_key, MAX(updated_at) AS updated_at, COUNT(*) AS plan_count,
+                          (SELECT company FROM plans p2 WHERE p2.company_key = plans.company_key
+                           ORDER BY created_at DESC LIMIT 1) AS company
+                   FROM plans GROUP BY company_key ORDER BY updated_at DESC"""
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def section_history(self, plan_id: int, section: str) -> List[Dict]:
+        """Every recorded edit of one section, oldest first"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT kind, content, created_at FROM section_edits WHERE plan_id = ? AND section = ? ORDER BY created_at",
+                (plan_id, section)
+            ).fetchall()
+        return [dict(r) for r in rows]
+
+    def save_message(self, session_id: str, role: str, content: str, company: Optional[str] = None) -> None:
+        """Store a chat message so it can be searched later"""
+        with self._lock, self._conn:
+            self._conn.execute(
+                "INSERT INTO chat_messages (session_id, company, role, content, created_at) VALUES (?, ?, ?, ?, ?)",
+                (session_id, company, role, content, time.time())
+            )
+
+    def delete_messages(self, session_id: str) -> int:
+        """Remove a session's messages from the store and the search index; returns how many"""
+        with self._lock, self._conn:
+            return self._conn.execute("DELETE FROM chat_messages WHERE session_id = ?", (session_id,)).rowcount
+
+    def search_sections(self, query: str, section: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """Plan sections ranked by BM25 relevance to query, optionally limited to one section key"""
+        match = fts_query(query)
+        if match is None:
+            return []
+        sql = """SELECT ps.plan_id, ps.section, p.company, ps.updated_at,
+                        snippet(plan_sections_fts, 0, '**', '**', ' … ', 16) AS snippet,
+                        bm25(plan_sections_fts) AS score
+                 FROM plan_sections_fts
+                 JOIN plan_sections ps ON ps.rowid = plan_sections_fts.rowid
+                 JOIN plans p ON p.id = ps.plan_id
+                 WHERE plan_sections_fts MATCH ?"""
+        params = [match]
+        if section:
+            sql += " AND ps.section = ?"
+            params.append(section)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(r) for r in rows]
+
+    def search_messages(self, query: str, session_id: Optional[str], limit: int = 20) -> List[Dict]:
+        """Chat messages of session_id ranked by BM25 relevance to query
+
+        Pass session_id=None to search every session's messages (e.g. for an admin tool).
+        """
+        match = fts_query(query)
+        if match is None:
+            return []
+        sql = """SELECT m.id, m.session_id, m.company, m.role, m.created_at,
+                        snippet(chat_messages_fts, 0, '**', '**', ' … ', 16) AS snippet,
+                        bm25(chat_messages_fts) AS score
+                 FROM chat_messages_fts
+                 JOIN chat_messages m ON m.id = chat_messages_fts.rowid
+                 WHERE chat_messages_fts MATCH ?"""
+        params = [match]
+        if session_id is not None:
+            sql += " AND m.session_id = ?"
+            params.append(session_id)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+        with self._lock:
+            rows = self._conn.execute(sql, params).fetchall()
+        return [dict(r) for r in rows]
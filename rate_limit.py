@@ -0,0 +1,303 @@
+"""Client-side Groq quota management: token buckets, retries with backoff, AIMD concurrency"""
+import asyncio
+import os
+import random
+import threading
+import time
+from contextlib import asynccontextmanager, contextmanager
+from typing import AsyncIterator, Awaitable, Callable, Dict, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+
+class TokenBucket:
+    """Refills continuously at rate_per_minute, holding at most one minute of quota"""
+
+    def __init__(self, rate_per_minute: float):
+        self.rate_per_second = rate_per_minute / 60.0
+        self.capacity = rate_per_minute
+        self._available = rate_per_minute
+        self._updated = time.monotonic()
+        # Callers without a reserve that are waiting; reserving callers let them go first
+        self._priority_waiting = 0
+        self._lock = threading.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self._available = min(self.capacity, self._available + (now - self._updated) * self.rate_per_second)
+        self._updated = now
+
+    def acquire(self, amount: float, reserve: float = 0.0) -> float:
+        """Block until amount is available and take it; returns the seconds spent waiting
+
+        reserve is a fraction of capacity to leave for other callers: a reserving caller
+        waits until amount plus the reserve is available (or the bucket is full), and
+        while any caller without a reserve is waiting.
+        """
+        waited = 0.0
+        self._start_waiting(reserve)
+        try:
+            while delay := self._try_take(amount, reserve):
+                time.sleep(delay)
+                waited += delay
+        finally:
+            self._stop_waiting(reserve)
+        return waited
+
+    async def acquire_async(self, amount: float, reserve: float = 0.0) -> float:
+        """acquire for coroutines: waits without blocking the event loop"""
+        waited = 0.0
+        self._start_waiting(reserve)
+        try:
+            while delay := self._try_take(amount, reserve):
+                await asyncio.sleep(delay)
+                waited += delay
+        finally:
+            self._stop_waiting(reserve)
+        return waited
+
+    def _start_waiting(self, reserve: float) -> None:
+        if not reserve:
+            with self._lock:
+                self._priority_waiting += 1
+
+    def _stop_waiting(self, reserve: float) -> None:
+        if not reserve:
+            with self._lock:
+                self._priority_waiting -= 1
+
+    def _try_take(self, amount: float, reserve: float) -> float:
+        """Take amount if the reserve allows it and return 0, otherwise return the seconds to wait before retrying"""
+        amount = min(amount, self.capacity)
+        needed = min(amount + reserve * self.capacity, self.capacity)
+        with self._lock:
+            self._refill()
+            yielding = reserve and self._priority_waiting
+            if self._available >= needed and not yielding:
+                self._available -= amount
+                return 0.0
+            return max((needed - self._available) / self.rate_per_second, 0.05 if yielding else 0.0)
+
+    def adjust(self, amount: float) -> None:
+        """Correct an earlier estimate: positive takes more quota, negative gives some back"""
+        with self._lock:
+            self._refill()
+            self._available = min(self.capacity, self._available - amount)
+
+
+class AdaptiveConcurrency:
+    """Concurrency limit that grows additively on success and halves on throttling (AIMD)"""
+
+    def __init__(self, initial: int, minimum: int = 1, maximum: int = 16):
+        self.minimum = minimum
+        self.maximum = maximum
+        self.limit = float(max(minimum, min(initial, maximum)))
+        self.in_flight = 0
+        self._condition = threading.Condition()
+
+    @contextmanager
+    def slot(self, reserve: int = 0) -> Iterator[None]:
+        """Hold one request slot; a caller with a reserve leaves that many slots free, but may always use one"""
+        self.enter(reserve)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    @asynccontextmanager
+    async def slot_async(self, reserve: int = 0) -> AsyncIterator[None]:
+        """slot for coroutines: waits without blocking the event loop"""
+        while not self._try_enter(reserve):
+            await asyncio.sleep(0.05)
+        try:
+            yield
+        finally:
+            self.leave()
+
+    def enter(self, reserve: int = 0) -> None:
+        """Take a slot, blocking until one is free; pair with leave()"""
+        with self._condition:
+            while not self._try_enter(reserve):
+                self._condition.wait()
+
+    def _try_enter(self, reserve: int) -> bool:
+        with self._condition:
+            if self.in_flight >= max(int(self.limit) - reserve, 1):
+                return False
+            self.in_flight += 1
+            return True
+
+    def leave(self) -> None:
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self) -> None:
+        with self._condition:
+            # +1 per limit-many successes, i.e. roughly one step per round of requests
+            self.limit = min(self.maximum, self.limit + 1.0 / self.limit)
+            self._condition.notify_all()
+
+    def on_throttle(self) -> None:
+        with self._condition:
+            self.limit = max(self.minimum, self.limit / 2)
+
+
+class RateLimiter:
+    """Shared gate in front of every Groq request
+
+    Each attempt takes one request and its estimated tokens from the per-minute
+    buckets and holds an adaptive concurrency slot. Retryable failures back off
+    exponentially with full jitter, or for the server's Retry-After when given.
+    Low-priority calls (speculative work) leave low_priority_reserve of each bucket
+    and one concurrency slot to interactive calls, and wait while those are waiting.
+    """
+
+    def __init__(
+        self,
+        requests_per_minute: float,
+        tokens_per_minute: float,
+        is_retryable: Callable[[Exception], bool],
+        retry_after: Callable[[Exception], Optional[float]] = lambda e: None,
+        is_throttle: Callable[[Exception], bool] = lambda e: False,
+        max_retries: int = 4,
+        base_delay: float = 1.0,
+        max_delay: float = 30.0,
+        initial_concurrency: int = 4,
+        max_concurrency: int = 16,
+        low_priority_reserve: float = 0.25
+    ):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute > 0 else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute > 0 else None
+        self.concurrency = AdaptiveConcurrency(initial_concurrency, maximum=max_concurrency)
+        self.is_retryable = is_retryable
+        self.retry_after = retry_after
+        self.is_throttle = is_throttle
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.low_priority_reserve = low_priority_reserve
+        self.retries = 0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def call(self, fn: Callable[[], T], estimated_tokens: int = 0, low_priority: bool = False, hold: bool = False) -> T:
+        """Run fn under the limits, retrying retryable errors
+
+        With hold, a successful call keeps its concurrency slot, e.g. for a streamed
+        response that is still being read; release it with a releaser().
+        """
+        attempt = 0
+        while True:
+            self.wait_for_quota(estimated_tokens, low_priority)
+            self.concurrency.enter(reserve=1 if low_priority else 0)
+            try:
+                result = fn()
+            except Exception as e:
+                self.concurrency.leave()
+                if attempt >= self.max_retries or not self.is_retryable(e):
+                    raise
+                error = e
+            else:
+                self.concurrency.on_success()
+                if not hold:
+                    self.concurrency.leave()
+                return result
+            # Back off outside the slot so other requests can use it
+            time.sleep(self._on_retry(attempt, error))
+            attempt += 1
+
+    def releaser(self) -> Callable[[], None]:
+        """Function that releases the slot of a call(..., hold=True); only its first call has an effect"""
+        held = [True]
+        lock = threading.Lock()
+
+        def release() -> None:
+            with lock:
+                if not held[0]:
+                    return
+                held[0] = False
+            self.concurrency.leave()
+
+        return release
+
+    async def call_async(
+        self, fn: Callable[[], Awaitable[T]], estimated_tokens: int = 0, low_priority: bool = False
+    ) -> T:
+        """call for coroutines: await fn() under the limits, retrying retryable errors, without blocking the loop"""
+        attempt = 0
+        while True:
+            await self.wait_for_quota_async(estimated_tokens, low_priority)
+            async with self.concurrency.slot_async(reserve=1 if low_priority else 0):
+                try:
+                    result = await fn()
+                    self.concurrency.on_success()
+                    return result
+                except Exception as e:
+                    if attempt >= self.max_retries or not self.is_retryable(e):
+                        raise
+                    error = e
+            await asyncio.sleep(self._on_retry(attempt, error))
+            attempt += 1
+
+    def wait_for_quota(self, estimated_tokens: int, low_priority: bool = False) -> float:
+        """Take one request and the estimated tokens from the buckets; returns seconds waited"""
+        reserve = self.low_priority_reserve if low_priority else 0.0
+        waited = 0.0
+        if self.requests:
+            waited += self.requests.acquire(1, reserve)
+        if self.tokens and estimated_tokens:
+            waited += self.tokens.acquire(estimated_tokens, reserve)
+        return waited
+
+    async def wait_for_quota_async(self, estimated_tokens: int, low_priority: bool = False) -> float:
+        """wait_for_quota for coroutines"""
+        reserve = self.low_priority_reserve if low_priority else 0.0
+        waited = 0.0
+        if self.requests:
+            waited += await self.requests.acquire_async(1, reserve)
+        if self.tokens and estimated_tokens:
+            waited += await self.tokens.acquire_async(estimated_tokens, reserve)
+        return waited
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: Optional[int]) -> None:
+        """Reconcile the token bucket with the usage the API reported"""
+        if self.tokens and actual_tokens is not None:
+            self.tokens.adjust(actual_tokens - estimated_tokens)
+
+    def _on_retry(self, attempt: int, error: Exception) -> float:
+        """Count a retry, halving concurrency if it was throttled; returns the seconds to back off"""
+        throttled = self.is_throttle(error)
+        if throttled:
+            self.concurrency.on_throttle()
+        with self._lock:
+            self.retries += 1
+            self.throttled += int(throttled)
+        return self.backoff_delay(attempt, error)
+
+    def backoff_delay(self, attempt: int, error: Exception) -> float:
+        retry_after = self.retry_after(error)
+        if retry_after is not None:
+            return min(retry_after, self.max_delay)
+        return random.uniform(0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def stats(self) -> Dict[str, float]:
+        return {
+            "retries": self.retries,
+            "throttled": self.throttled,
+            "concurrency_limit": int(self.concurrency.limit),
+            "in_flight": self.concurrency.in_flight
+        }
+
+
+def limiter_from_env(**kwargs) -> RateLimiter:
+    """RateLimiter configured by GROQ_RPM_LIMIT, GROQ_TPM_LIMIT and related variables (0 disables a bucket)"""
+    return RateLimiter(
+        requests_per_minute=float(os.getenv("GROQ_RPM_LIMIT", "30")),
+        tokens_per_minute=float(os.getenv("GROQ_TPM_LIMIT", "12000")),
+        max_retries=int(os.getenv("GROQ_MAX_RETRIES", "4")),
+        initial_concurrency=int(os.getenv("GROQ_INITIAL_CONCURRENCY", "4")),
+        max_concurrency=int(os.getenv("GROQ_MAX_CONCURRENCY", "16")),
+        low_priority_reserve=float(os.getenv("GROQ_LOW_PRIORITY_RESERVE", "0.25")),
+        **kwargs
+    )
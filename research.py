@@ -0,0 +1,964 @@
+"""Streamlit-free research pipeline: prompts, Groq calls, plan generation and enhancement
+
+Shared by the Streamlit app (main.py) and the headless batch CLI (batch_research.py).
+"""
+import asyncio
+import json
+import os
+import re
+import time
+import weakref
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Awaitable, Callable, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple, TypeVar, Union
+
+from chat_history import estimate_tokens
+from document_index import DocumentIndex, format_reference_context
+from groq_client import AsyncGroqRunner
+from metrics import CallMetrics, CallRecord
+from plan_parser import SECTION_TITLES, IncrementalPlanParser, parse_account_plan, parse_plan_json, salvage_plan
+from rate_limit import RateLimiter
+from response_cache import ResponseCache, SingleFlight, content_fingerprint, make_cache_key
+
+MODEL = "llama-3.3-70b-versatile"
+SMALL_MODEL = os.getenv("GROQ_SMALL_MODEL", "llama-3.1-8b-instant")
+
+# Send clarifying and ordinary chat turns to SMALL_MODEL; set to 0 to use MODEL for everything
+MODEL_ROUTING = os.getenv("MODEL_ROUTING", "1") != "0"
+
+
+class Route(NamedTuple):
+    model: str
+    max_tokens: int
+
+
+# Turn kind -> model and completion budget; only plans and enhancements need the large model
+ROUTES = {
+    "clarify": Route(SMALL_MODEL, 512),
+    "chat": Route(SMALL_MODEL, 2048),
+    "plan": Route(MODEL, 8192),
+    "enhance": Route(MODEL, 8192),
+}
+UNROUTED = Route(MODEL, 8192)
+
+PLAN_SECTION_SAMPLING = {"temperature": 0.7, "max_tokens": 2048, "top_p": 0.95}
+ENHANCE_SAMPLING = {"temperature": 0.8, "max_tokens": 8192, "top_p": 0.95}
+ENHANCE_RETRY_SAMPLING = {"temperature": 0.9, "max_tokens": 8192}
+
+T = TypeVar("T")
+
+# Maximum concurrent Groq requests when generating or enhancing plan sections in parallel
+PLAN_MAX_CONCURRENCY = int(os.getenv("PLAN_MAX_CONCURRENCY", "5"))
+
+# Prompt tokens and number of excerpts allowed for retrieved reference documents
+REFERENCE_TOKEN_BUDGET = int(os.getenv("REFERENCE_TOKEN_BUDGET", "1500"))
+REFERENCE_TOP_K = int(os.getenv("REFERENCE_TOP_K", "6"))
+# A plan request usually names only the company; excerpts on any plan section's topic are relevant to it
+PLAN_REFERENCE_TOPICS = " ".join(SECTION_TITLES.values())
+
+# System prompt for ordinary chat turns; plans are generated separately with SYSTEM_PROMPT
+CHAT_SYSTEM_PROMPT = """You are an expert Company Research Assistant for B2B sales and business development teams. You research companies: financials, market position, competitors, strategic initiatives and decision-makers.
+
+When a user seems confused or unclear, ask specific clarifying questions.
+When a user provides clear requirements, respond efficiently and directly.
+When a user goes off-topic, gently redirect them back to company research.
+Handle edge cases gracefully by explaining limitations and offering alternatives.
+Do not write full account plans in chat. When one would help, offer to create an account plan."""
+
+# System prompt for plan generation, with the section template
+SYSTEM_PROMPT = """You are an expert Company Research Assistant specialized in gathering business intelligence and creating comprehensive account plans for B2B sales and business development teams.
+
+When generating account plans, you MUST use this EXACT format with clear section headers and comprehensive content:
+
+## 1. Executive Summary
+[2-3 paragraphs summarizing the company and key opportunities]
+
+## 2. Company Overview
+- **Industry**: [industry name]
+- **Founded**: [year]
+- **Headquarters**: [location]
+- **Revenue**: [annual revenue]
+- **Employees**: [number]
+- **Market Cap/Valuation**: [if public]
+
+## 3. Business Model & Products/Services
+- **Primary Business Model**: [description]
+- **Key Products/Services**:
+  - Product 1: [description]
+  - Product 2: [description]
+- **Revenue Streams**: [description]
+- **Target Markets**: [description]
+
+## 4. Market Position & Competitors
+- **Market Position**: [leader/challenger/niche]
+- **Market Share**: [percentage if known]
+- **Key Competitors**:
+  - Competitor 1: [comparison]
+  - Competitor 2: [comparison]
+- **Competitive Advantages**: [list]
+
+## 5. Recent News & Strategic Initiatives
+- **Recent Developments** (Last 12 months):
+  - [Initiative 1]
+  - [Initiative 2]
+  - [Initiative 3]
+- **Strategic Focus**: [description]
+
+## 6. Key Stakeholders & Decision Makers
+- **CEO/Leadership**: [names and backgrounds]
+- **Key Executives**:
+  - [Title]: [Name] - [relevant info]
+  - [Title]: [Name] - [relevant info]
+- **Board Members**: [if relevant]
+
+## 7. Pain Points & Challenges
+- **Challenge 1**: [description and impact]
+- **Challenge 2**: [description and impact]
+- **Challenge 3**: [description and impact]
+
+## 8. Opportunities & Recommendations
+- **Opportunity 1**: [specific recommendation with rationale]
+- **Opportunity 2**: [specific recommendation with rationale]
+- **Opportunity 3**: [specific recommendation with rationale]
+
+## 9. Engagement Strategy
+- **Approach**: [recommended engagement method]
+- **Key Messages**: [what to emphasize]
+- **Value Proposition**: [tailored value prop]
+- **Timeline**: [suggested timeline]
+
+## 10. Next Steps
+1. [Specific action item with owner and deadline]
+2. [Specific action item with owner and deadline]
+3. [Specific action item with owner and deadline]
+
+Be comprehensive, professional, and data-driven. Use bullet points, clear formatting, and specific details."""
+
+# JSON schema of a plan generated in one request: one markdown string per section id
+PLAN_SCHEMA = {
+    "type": "object",
+    "properties": {key: {"type": "string", "description": title} for key, title in SECTION_TITLES.items()},
+    "required": list(SECTION_TITLES),
+    "additionalProperties": False
+}
+
+PLAN_JSON_PROMPT = SYSTEM_PROMPT + f"""
+
+Respond with a single JSON object and nothing else, matching this JSON schema:
+{json.dumps(PLAN_SCHEMA)}
+
+Each value is the markdown content of that section as described in the format above, without the "## N." section header."""
+
+# "json_object" (JSON mode) works on every Groq chat model; "json_schema" enforces PLAN_SCHEMA on models that support it
+PLAN_RESPONSE_FORMAT = os.getenv("PLAN_RESPONSE_FORMAT", "json_object")
+
+
+def plan_response_format() -> Dict:
+    if PLAN_RESPONSE_FORMAT == "json_schema":
+        return {"type": "json_schema", "json_schema": {"name": "account_plan", "schema": PLAN_SCHEMA}}
+    return {"type": "json_object"}
+
+
+def section_header(section_key: str) -> str:
+    """Markdown header for a plan section, numbered as in SYSTEM_PROMPT"""
+    number = list(SECTION_TITLES).index(section_key) + 1
+    return f"## {number}. {SECTION_TITLES[section_key]}"
+
+
+def format_plan_markdown(plan: Dict[str, str]) -> str:
+    """Plan sections as one markdown document, in the SYSTEM_PROMPT format"""
+    return "\n\n".join(f"{section_header(key)}\n{plan[key]}" for key in SECTION_TITLES if key in plan)
+
+
+# "account plan", or a plan verb followed by "the/a/full/new ... plan"; other plans ("a 30-60-90 day plan",
+# "an outreach plan email") are ordinary chat
+PLAN_REQUEST = re.compile(
+    r"\b(?:(?:create|generate|build|write|make|draft|prepare|redo|regenerate|update)\s+"
+    r"(?:(?:the|a|an|my|our|its|their|that|this|full|complete|new|whole|entire|updated)\s+)*)?"
+    r"account plans?\b"
+    r"|\b(?:create|generate|build|write|make|draft|prepare|redo|regenerate|update)\s+"
+    r"(?:(?:the|a|an|my|our|its|their|that|this|full|complete|new|whole|entire|updated)\s+)*plans?\b",
+    re.IGNORECASE
+)
+AFFIRMATIVE = re.compile(r"^\W*(?:yes|yeah|yep|sure|ok(?:ay)?|please|go ahead|do it|sounds good)\b", re.IGNORECASE)
+CLARIFY_MAX_WORDS = 8
+# Questions and research instructions need a full answer however short they are
+RESEARCH_QUESTION = re.compile(
+    r"\?|^\W*(?:who|what|when|where|why|how|which|is|are|does|do|can|tell|explain|describe|compare|list|"
+    r"give|show|research|find|summari[sz]e|analy[sz]e|draft|write|create|make|prepare|build|generate)\b",
+    re.IGNORECASE
+)
+# A capitalized word after the first one is most likely a name (company, product, person)
+PROPER_NOUN = re.compile(r"(?<=\s)[A-Z][\w&'-]*")
+
+
+def wants_account_plan(user_message: str) -> bool:
+    """Detect if the user is asking for a full account plan"""
+    return PLAN_REQUEST.search(user_message) is not None
+
+
+def is_clarifying_reply(user_message: str) -> bool:
+    """Short reply that asks nothing and names nothing, e.g. "yes", "the second one" or "focus on cloud" """
+    return (
+        len(user_message.split()) <= CLARIFY_MAX_WORDS
+        and not RESEARCH_QUESTION.search(user_message)
+        and not PROPER_NOUN.search(user_message)
+        and not extract_company_name(user_message)
+    )
+
+
+def classify_turn(user_message: str, chat_history: List = None) -> str:
+    """Route key for a chat turn: "plan", "clarify" (see is_clarifying_reply) or "chat"
+
+    A short yes to an assistant offer of an account plan counts as a plan request.
+    """
+    if wants_account_plan(user_message):
+        return "plan"
+    last_reply = next((m["content"] for m in reversed(chat_history or []) if m["role"] == "assistant"), "")
+    if AFFIRMATIVE.match(user_message) and wants_account_plan(last_reply[-300:]):
+        return "plan"
+    if is_clarifying_reply(user_message):
+        return "clarify"
+    return "chat"
+
+
+def detect_account_plan_intent(text: str) -> bool:
+    """Detect if the response contains or references an account plan"""
+    plan_keywords = [
+        "account plan",
+        "executive summary",
+        "company overview",
+        "engagement strategy",
+        "key stakeholders",
+        "pain points"
+    ]
+    
+    text_lower = text.lower()
+    matches = sum(1 for keyword in plan_keywords if keyword in text_lower)
+    return matches >= 3
+
+
+def split_company_list(text: str) -> List[str]:
+    """Company names from comma-, semicolon- or newline-separated text, without blanks or duplicates"""
+    companies = []
+    seen = set()
+    for name in re.split(r"[,;\n]", text):
+        name = name.strip()
+        if name and name.lower() not in seen:
+            seen.add(name.lower())
+            companies.append(name)
+    return companies
+
+
+COMPANY_PATTERNS = [
+    re.compile(r"(?i:account plan|plan|research|researching|about|on|for|at|analy[sz]e)\s+(?P<name>[A-Z0-9][\w&'-]*(?:\s+(?:[A-Z0-9][\w&'-]*|&|of|and))*)"),
+    re.compile(r"(?:account plan for|research|about)\s+(?P<name>[\w&'-]+)", re.IGNORECASE),
+]
+
+COMPANY_STOPWORDS = {
+    "the", "a", "an", "my", "our", "your", "their", "its", "his", "her", "this", "that", "these", "those",
+    "it", "them", "company", "companies", "me", "us"
+}
+
+
+def extract_company_name(text: str) -> Optional[str]:
+    """Best-effort company name from a request like "Create an account plan for Microsoft" """
+    for pattern in COMPANY_PATTERNS:
+        for match in pattern.finditer(text):
+            words = match.group("name").split()
+            while words and words[-1].lower() in ("of", "and", "&"):
+                words.pop()
+            if words and words[-1].endswith("'s"):
+                words[-1] = words[-1][:-2]
+            if words and words[0].lower() not in COMPANY_STOPWORDS:
+                return " ".join(words)
+    return None
+
+
+def detect_company(messages: List[Dict]) -> Optional[str]:
+    """Company named in the most recent user message that names one"""
+    for message in reversed(messages):
+        if message["role"] == "user":
+            company = extract_company_name(message["content"])
+            if company:
+                return company
+    return None
+
+
+def estimate_request_tokens(messages: List[Dict], max_tokens: Optional[int]) -> int:
+    """Tokens a request is expected to use against the per-minute quota
+
+    Completions rarely use the full max_tokens, so at most 1024 are reserved up
+    front and the difference is settled from response.usage afterwards.
+    """
+    prompt_tokens = sum(estimate_tokens(m["content"]) for m in messages)
+    return prompt_tokens + min(max_tokens or 1024, 1024)
+
+
+def response_usage(response) -> Tuple[Optional[int], Optional[int]]:
+    """(prompt_tokens, completion_tokens) from a response or final stream chunk, if reported
+
+    Groq reports usage on the last streamed chunk under x_groq.usage.
+    """
+    usage = getattr(response, "usage", None) or getattr(getattr(response, "x_groq", None), "usage", None)
+    if usage is None:
+        return None, None
+    return getattr(usage, "prompt_tokens", None), getattr(usage, "completion_tokens", None)
+
+
+def iter_stream_deltas(response, on_complete: Callable[[str], None] = None) -> Iterator[str]:
+    """Yield the text deltas of a streamed chat completion
+
+    on_complete receives the full text once the stream finishes; errors propagate to the consumer.
+    """
+    parts = []
+    for chunk in response:
+        if not chunk.choices:
+            continue
+        delta = chunk.choices[0].delta.content
+        if delta:
+            parts.append(delta)
+            yield delta
+    if on_complete and parts:
+        on_complete("".join(parts))
+
+
+def enhancement_messages(section_content: str, section_name: str) -> List[Dict]:
+    """Messages asking to enhance an account plan section"""
+    prompt = f"""You are an expert business analyst enhancing an account plan section. You MUST significantly improve and expand the content.
+
+IMPORTANT: Do NOT just repeat the original content. You must:
+1. Add MORE specific details, data points, and examples
+2. Expand on key points with deeper analysis
+3. Include actionable recommendations
+4. Add relevant metrics, timelines, or frameworks
+5. Make it at least 30-50% longer and more comprehensive
+6. Use professional business language
+
+Section: {section_name}
+
+Current content:
+{section_content}
+
+Now provide an ENHANCED, EXPANDED, and MORE DETAILED version (do NOT just copy the original):"""
+    
+    return [
+        {"role": "system", "content": "You are an expert business analyst who creates detailed, professional account plans. When asked to enhance content, you ALWAYS make it significantly better, longer, and more detailed. Never return the same content."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+def enhancement_retry_messages(section_content: str, section_name: str) -> List[Dict]:
+    """Stronger enhancement request, for when the first answer just echoed the section"""
+    prompt = f"""The previous enhancement was not sufficient. You MUST create a NEW, EXPANDED version that is SIGNIFICANTLY different from the original.
+
+Original section ({section_name}):
+{section_content}
+
+Create a COMPLETELY REWRITTEN and MUCH MORE DETAILED version with:
+- At least 50% more content
+- Specific examples and data
+- Actionable insights
+- Professional business frameworks
+- Strategic recommendations
+
+ENHANCED VERSION:"""
+    
+    return [
+        {"role": "system", "content": "You are an expert business analyst. You MUST significantly expand and improve content. Never return unchanged content."},
+        {"role": "user", "content": prompt}
+    ]
+
+
+class ResearchPipeline:
+    """Groq calls behind the response cache, on the sync or async client
+
+    Methods raise on API errors rather than reporting them, so they are safe to
+    call from worker threads and from code without a Streamlit script context.
+    """
+
+    def __init__(
+        self,
+        client,
+        response_cache: ResponseCache,
+        async_runner: Optional[AsyncGroqRunner] = None,
+        enhance_flights: Optional[SingleFlight] = None,
+        rate_limiter: Optional[RateLimiter] = None,
+        metrics: Optional[CallMetrics] = None,
+        document_index: Optional[DocumentIndex] = None,
+        routing: bool = MODEL_ROUTING
+    ):
+        self.client = client
+        self.response_cache = response_cache
+        self.async_runner = async_runner
+        self.enhance_flights = enhance_flights or SingleFlight()
+        # memo key -> in-flight enhancement task; only touched on the async runner's loop
+        self._async_enhance_flights: Dict[str, asyncio.Future] = {}
+        self.rate_limiter = rate_limiter
+        self.metrics = metrics or CallMetrics(reference_model=MODEL)
+        self.document_index = document_index
+        self.routing = routing
+
+    def create_completion(self, call_site: str = "chat", low_priority: bool = False, **kwargs):
+        """Create a chat completion within the rate limits, retrying throttled and failed requests
+
+        Streamed responses are returned as a regular iterator of chunks; only
+        opening the stream is retried, but the request keeps its concurrency slot
+        until the stream is read or dropped. Timings and token usage are recorded
+        in self.metrics under call_site. low_priority requests yield quota to the others.
+        """
+        started = time.perf_counter()
+        sent = [started]
+        estimated_tokens = estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+        
+        def send():
+            sent[0] = time.perf_counter()
+            return self._send(**kwargs)
+        
+        stream = bool(kwargs.get("stream"))
+        try:
+            if self.rate_limiter is None:
+                response = send()
+            else:
+                response = self.rate_limiter.call(send, estimated_tokens, low_priority, hold=stream)
+        except Exception as e:
+            self._record_failure(call_site, kwargs["model"], started, sent[0], e)
+            raise
+        
+        if stream:
+            release = self.rate_limiter.releaser() if self.rate_limiter is not None else None
+            chunks = self._measure_stream(
+                response, call_site, kwargs["model"], started, sent[0], estimated_tokens, release
+            )
+            if release is not None:
+                # A stream dropped before it was read never runs its finally block
+                weakref.finalize(chunks, release)
+            return chunks
+        
+        self._record_response(call_site, kwargs["model"], started, sent[0], estimated_tokens, response)
+        return response
+
+    async def create_completion_async(self, call_site: str = "chat", low_priority: bool = False, **kwargs):
+        """create_completion as a coroutine on the async runner's loop, for non-streamed requests"""
+        started = time.perf_counter()
+        sent = [started]
+        estimated_tokens = estimate_request_tokens(kwargs["messages"], kwargs.get("max_tokens"))
+        
+        async def send():
+            sent[0] = time.perf_counter()
+            return await self.async_runner.client.chat.completions.create(**kwargs)
+        
+        try:
+            if self.rate_limiter is None:
+                response = await send()
+            else:
+                response = await self.rate_limiter.call_async(send, estimated_tokens, low_priority)
+        except Exception as e:
+            self._record_failure(call_site, kwargs["model"], started, sent[0], e)
+            raise
+        
+        self._record_response(call_site, kwargs["model"], started, sent[0], estimated_tokens, response)
+        return response
+
+    def _record_failure(self, call_site: str, model: str, started: float, sent: float, error: Exception) -> None:
+        self.metrics.record(CallRecord(
+            call_site, sent - started, None, time.perf_counter() - started, None, None, type(error).__name__, model
+        ))
+
+    def _record_response(
+        self, call_site: str, model: str, started: float, sent: float, estimated_tokens: int, response
+    ) -> None:
+        prompt_tokens, completion_tokens = response_usage(response)
+        self.metrics.record(CallRecord(
+            call_site, sent - started, None, time.perf_counter() - started, prompt_tokens, completion_tokens,
+            model=model
+        ))
+        self._record_usage(estimated_tokens, prompt_tokens, completion_tokens)
+
+    def _measure_stream(
+        self,
+        response,
+        call_site: str,
+        model: str,
+        started: float,
+        sent: float,
+        estimated_tokens: int,
+        release: Optional[Callable[[], None]] = None
+    ) -> Iterator:
+        """Pass stream chunks through, recording time to first token and the usage on the final chunk
+
+        release, if given, frees the request's concurrency slot once the stream ends.
+        """
+        first_token = None
+        prompt_tokens = completion_tokens = None
+        error = None
+        try:
+            for chunk in response:
+                if first_token is None and chunk.choices and chunk.choices[0].delta.content:
+                    first_token = time.perf_counter()
+                chunk_prompt, chunk_completion = response_usage(chunk)
+                if chunk_prompt is not None or chunk_completion is not None:
+                    prompt_tokens, completion_tokens = chunk_prompt, chunk_completion
+                yield chunk
+        except Exception as e:
+            error = type(e).__name__
+            raise
+        finally:
+            # Also runs when the consumer stops early (GeneratorExit)
+            self.metrics.record(CallRecord(
+                call_site,
+                sent - started,
+                first_token - sent if first_token is not None else None,
+                time.perf_counter() - started,
+                prompt_tokens,
+                completion_tokens,
+                error,
+                model
+            ))
+            self._record_usage(estimated_tokens, prompt_tokens, completion_tokens)
+            if release is not None:
+                release()
+
+    def _record_usage(self, estimated_tokens: int, prompt_tokens: Optional[int], completion_tokens: Optional[int]) -> None:
+        if self.rate_limiter is not None and prompt_tokens is not None and completion_tokens is not None:
+            self.rate_limiter.record_usage(estimated_tokens, prompt_tokens + completion_tokens)
+
+    def _send(self, **kwargs):
+        """Send one request on the async client when enabled, otherwise the sync client"""
+        if self.async_runner is None:
+            return self.client.chat.completions.create(**kwargs)
+        response = self.async_runner.run(self.async_runner.client.chat.completions.create(**kwargs))
+        if kwargs.get("stream"):
+            return self.async_runner.iterate(response)
+        return response
+
+    def cached_completion(self, messages: List[Dict], call_site: str = "chat", model: str = MODEL, **sampling) -> str:
+        """Non-streamed completion answered from the response cache when possible"""
+        cache_key = make_cache_key(model, messages, **sampling)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return cached
+        
+        response = self.create_completion(call_site=call_site, model=model, messages=messages, **sampling)
+        content = response.choices[0].message.content
+        self.response_cache.set(cache_key, content)
+        return content
+
+    async def cached_completion_async(
+        self, messages: List[Dict], call_site: str = "chat", model: str = MODEL, **sampling
+    ) -> str:
+        """cached_completion as a coroutine for the async runner's loop; the cache is used off the loop"""
+        cache_key = make_cache_key(model, messages, **sampling)
+        cached = await asyncio.to_thread(self.response_cache.get, cache_key)
+        if cached is not None:
+            return cached
+        
+        response = await self.create_completion_async(call_site=call_site, model=model, messages=messages, **sampling)
+        content = response.choices[0].message.content
+        await asyncio.to_thread(self.response_cache.set, cache_key, content)
+        return content
+
+    def fan_out(
+        self,
+        keys: Iterable[str],
+        fn: Callable[[str], T],
+        fn_async: Callable[[str], Awaitable[T]],
+        max_workers: int
+    ) -> Iterator[Tuple[str, Optional[T], Optional[Exception]]]:
+        """Call fn(key) for every key, at most max_workers at a time; yields (key, result, error) as each finishes
+
+        With the async runner, the fn_async(key) coroutines are gathered on its loop
+        instead, so requests waiting on the network hold no threads.
+        """
+        if self.async_runner is not None:
+            yield from self.async_runner.gather({key: fn_async(key) for key in keys}, max_workers)
+            return
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(fn, key): key for key in keys}
+            for future in as_completed(futures):
+                error = future.exception()
+                yield futures[future], None if error else future.result(), error
+
+    def reference_messages(self, query: str, company: Optional[str] = None) -> List[Dict]:
+        """System message with the local document excerpts most relevant to query, if any
+
+        With company, only excerpts that mention it are used.
+        """
+        if self.document_index is None:
+            return []
+        chunks = self.document_index.retrieve(query, REFERENCE_TOKEN_BUDGET, REFERENCE_TOP_K, company=company)
+        if not chunks:
+            return []
+        return [{"role": "system", "content": f"""Reference excerpts from the user's own documents (filings, press releases, CRM notes). They are more current than your training data: prefer them where they conflict with what you know, and name the source file when you use them.
+
+{format_reference_context(chunks)}"""}]
+
+    def turn_references(self, user_message: str, chat_history: List = None, topics: str = "") -> List[Dict]:
+        """Reference excerpts for a chat turn, limited to the company under discussion when there is one
+
+        topics adds search words for turns whose message names little beyond the company, like plan requests.
+        """
+        company = detect_company((chat_history or []) + [{"role": "user", "content": user_message}])
+        return self.reference_messages(f"{user_message} {topics}" if topics else user_message, company)
+
+    def route(self, kind: str) -> Route:
+        """Model and completion budget for a kind of turn, recorded in self.metrics"""
+        route = ROUTES[kind] if self.routing else UNROUTED
+        self.metrics.record_route(kind, route.model)
+        return route
+
+    def chat(
+        self, user_message: str, chat_history: List = None, stream: bool = False, turn: Optional[str] = None
+    ) -> Union[str, Iterator[str]]:
+        """Answer a chat turn with the short chat prompt, on the model its turn kind is routed to
+
+        turn is a classify_turn() result; it is classified here when not given. Plan
+        turns should go to generate_account_plan() instead.
+        With stream=True, the request is sent immediately and an iterator of text deltas is returned.
+        """
+        turn = turn or classify_turn(user_message, chat_history)
+        route = self.route(turn)
+        messages = [{"role": "system", "content": CHAT_SYSTEM_PROMPT}]
+        # A clarifying reply ("yes", "the second one") is answered from the conversation, not the documents
+        if turn != "clarify":
+            messages.extend(self.turn_references(user_message, chat_history))
+        
+        if chat_history:
+            messages.extend(chat_history)
+        
+        messages.append({"role": "user", "content": user_message})
+        
+        sampling = {"temperature": 0.7, "max_tokens": route.max_tokens, "top_p": 0.95}
+        if not stream:
+            return self.cached_completion(messages, model=route.model, **sampling)
+        
+        cache_key = make_cache_key(route.model, messages, **sampling)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            return iter([cached])
+        
+        response = self.create_completion(
+            call_site="chat", model=route.model, messages=messages, stream=True, **sampling
+        )
+        return iter_stream_deltas(response, on_complete=lambda text: self.response_cache.set(cache_key, text))
+
+    def plan_completion(
+        self,
+        messages: List[Dict],
+        call_site: str,
+        model: str = MODEL,
+        max_tokens: int = 8192,
+        on_section: Callable[[str, str], None] = None,
+        low_priority: bool = False
+    ) -> Dict[str, str]:
+        """Plan sections from a JSON-mode completion; only responses that parse as a plan are cached
+
+        With on_section, on_section(section_key, text) is called as each section's value
+        completes. The response is streamed in json_object mode only (Groq does not stream
+        json_schema responses); otherwise, and for a cached response, once per section.
+        A response that is not valid JSON, e.g. cut off at max_tokens, keeps the sections
+        salvage_plan recovers; one that yields none is retried once without streaming.
+        """
+        sampling = {"temperature": 0.7, "max_tokens": max_tokens, "top_p": 0.95, "response_format": plan_response_format()}
+        cache_key = make_cache_key(model, messages, **sampling)
+        cached = self.response_cache.get(cache_key)
+        if cached is not None:
+            plan = parse_plan_json(cached)
+            for key, text in plan.items() if on_section else ():
+                on_section(key, text)
+            return plan
+        
+        reported = set()
+        stream = on_section is not None and sampling["response_format"]["type"] == "json_object"
+        for attempt_stream in ([True, False] if stream else [False]):
+            if attempt_stream:
+                response = self.create_completion(
+                    call_site=call_site, low_priority=low_priority, model=model, messages=messages, stream=True, **sampling
+                )
+                parser = IncrementalPlanParser()
+                completed = []
+                for delta in iter_stream_deltas(response, on_complete=completed.append):
+                    for key in parser.feed(delta):
+                        reported.add(key)
+                        on_section(key, parser.sections[key])
+                content = completed[0] if completed else ""
+            else:
+                response = self.create_completion(
+                    call_site=call_site, low_priority=low_priority, model=model, messages=messages, **sampling
+                )
+                content = response.choices[0].message.content or ""
+            try:
+                plan = parse_plan_json(content)
+            except ValueError:
+                plan = salvage_plan(content)
+            else:
+                self.response_cache.set(cache_key, content)
+            if plan:
+                break
+        if not plan:
+            raise ValueError("plan response holds no sections")
+        for key, text in plan.items() if on_section else ():
+            if key not in reported:
+                on_section(key, text)
+        return plan
+
+    def generate_account_plan(
+        self,
+        user_message: str,
+        chat_history: List = None,
+        call_site: str = "plan",
+        on_section: Callable[[str, str], None] = None,
+        low_priority: bool = False
+    ) -> Tuple[str, Dict[str, str]]:
+        """Full account plan as structured JSON in one request; returns it as markdown and by section
+
+        With on_section, the plan is streamed and on_section(section_key, text) is called as each section completes.
+        low_priority is for speculative plans, which yield rate-limit quota to interactive requests.
+        """
+        route = self.route("plan")
+        messages = [{"role": "system", "content": PLAN_JSON_PROMPT}]
+        messages.extend(self.turn_references(user_message, chat_history, PLAN_REFERENCE_TOPICS))
+        
+        if chat_history:
+            messages.extend(chat_history)
+        
+        messages.append({"role": "user", "content": user_message})
+        
+        plan = self.plan_completion(
+            messages,
+            call_site=call_site,
+            model=route.model,
+            max_tokens=route.max_tokens,
+            on_section=on_section,
+            low_priority=low_priority
+        )
+        return format_plan_markdown(plan), plan
+
+    def generate_plan_section(self, section_key: str, user_message: str, chat_history: List = None) -> str:
+        """Generate a single account plan section"""
+        messages = self.plan_section_messages(section_key, user_message, chat_history)
+        return self.cached_completion(messages, call_site="plan-section", **PLAN_SECTION_SAMPLING)
+
+    def plan_section_messages(self, section_key: str, user_message: str, chat_history: List = None) -> List[Dict]:
+        """Messages asking for a single account plan section"""
+        header = section_header(section_key)
+        messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+        messages.extend(self.turn_references(user_message, chat_history, SECTION_TITLES[section_key]))
+        
+        if chat_history:
+            messages.extend(chat_history)
+        
+        messages.append({
+            "role": "user",
+            "content": f"""{user_message}
+
+Write ONLY the "{header}" section of the account plan, following the exact format from your instructions for that section. Start with the section header and do not write any other section."""
+        })
+        return messages
+
+    def generate_account_plan_parallel(
+        self,
+        user_message: str,
+        chat_history: List = None,
+        max_workers: int = PLAN_MAX_CONCURRENCY,
+        on_section_done: Callable[[str, Optional[str]], None] = None
+    ) -> Tuple[str, Dict[str, str]]:
+        """Generate all plan sections concurrently over the same research context
+
+        Returns the assembled plan text and the same dict parse_account_plan produces.
+        on_section_done(section_key, error) is called on the calling thread as each section finishes.
+        """
+        self.route("plan")
+        bodies = {}
+        for key, content, error in self.fan_out(
+            SECTION_TITLES,
+            lambda key: self.generate_plan_section(key, user_message, chat_history),
+            # Messages are built here, on the calling thread; only the requests run on the loop
+            lambda key: self.cached_completion_async(
+                self.plan_section_messages(key, user_message, chat_history), call_site="plan-section", **PLAN_SECTION_SAMPLING
+            ),
+            max_workers
+        ):
+            if error is None:
+                # Drop the model's own header lines; the canonical header is added below
+                lines = content.strip().split("\n")
+                while lines and (not lines[0].strip() or lines[0].strip().startswith("#")):
+                    lines.pop(0)
+                bodies[key] = "\n".join(lines)
+            else:
+                bodies[key] = "Not available"
+            if on_section_done:
+                on_section_done(key, None if error is None else str(error))
+        
+        plan_text = "\n\n".join(f"{section_header(key)}\n{bodies[key]}" for key in SECTION_TITLES)
+        return plan_text, parse_account_plan(plan_text)
+
+    def enhance_section(self, section_content: str, section_name: str) -> str:
+        """Enhance a section, memoized per (section name, content fingerprint)
+
+        Concurrent identical requests (e.g. a double-clicked button) share one in-flight call.
+        """
+        self.route("enhance")
+        memo_key = f"enhance:{section_name}:{content_fingerprint(section_content)}"
+        cached = self.response_cache.get(memo_key)
+        if cached is not None:
+            return cached
+        
+        enhanced_content = self.enhance_flights.do(
+            memo_key, lambda: self.request_section_enhancement(section_content, section_name)
+        )
+        self.response_cache.set(memo_key, enhanced_content)
+        return enhanced_content
+
+    def request_section_enhancement(self, section_content: str, section_name: str) -> str:
+        """Call Groq to enhance a section, retrying once if the output just echoes the input"""
+        response = self.create_completion(
+            call_site="enhance",
+            model=MODEL,
+            messages=enhancement_messages(section_content, section_name),
+            **ENHANCE_SAMPLING
+        )
+        enhanced_content = response.choices[0].message.content
+        
+        # Verify the content actually changed (hash compare, ignoring whitespace-only changes)
+        if content_fingerprint(enhanced_content) == content_fingerprint(section_content):
+            # If identical, force a second attempt with stronger instruction
+            response = self.create_completion(
+                call_site="enhance-retry",
+                model=MODEL,
+                messages=enhancement_retry_messages(section_content, section_name),
+                **ENHANCE_RETRY_SAMPLING
+            )
+            enhanced_content = response.choices[0].message.content
+        
+        return enhanced_content
+
+    async def enhance_section_async(self, section_content: str, section_name: str) -> str:
+        """enhance_section as a coroutine for the async runner's loop; the cache is used off the loop"""
+        self.route("enhance")
+        memo_key = f"enhance:{section_name}:{content_fingerprint(section_content)}"
+        cached = await asyncio.to_thread(self.response_cache.get, memo_key)
+        if cached is not None:
+            return cached
+        
+        # Identical requests on the loop share one task, as enhance_flights does for threads
+        flight = self._async_enhance_flights.get(memo_key)
+        if flight is None:
+            flight = asyncio.ensure_future(self.request_section_enhancement_async(section_content, section_name))
+            self._async_enhance_flights[memo_key] = flight
+            flight.add_done_callback(lambda _: self._async_enhance_flights.pop(memo_key, None))
+        enhanced_content = await asyncio.shield(flight)
+        await asyncio.to_thread(self.response_cache.set, memo_key, enhanced_content)
+        return enhanced_content
+
+    async def request_section_enhancement_async(self, section_content: str, section_name: str) -> str:
+        """request_section_enhancement as a coroutine"""
+        response = await self.create_completion_async(
+            call_site="enhance",
+            model=MODEL,
+            messages=enhancement_messages(section_content, section_name),
+            **ENHANCE_SAMPLING
+        )
+        enhanced_content = response.choices[0].message.content
+        if content_fingerprint(enhanced_content) == content_fingerprint(section_content):
+            response = await self.create_completion_async(
+                call_site="enhance-retry",
+                model=MODEL,
+                messages=enhancement_retry_messages(section_content, section_name),
+                **ENHANCE_RETRY_SAMPLING
+            )
+            enhanced_content = response.choices[0].message.content
+        return enhanced_content
+
+    def enhance_all_sections(
+        self,
+        sections: Dict[str, str],
+        max_workers: int = PLAN_MAX_CONCURRENCY,
+        on_section_done: Callable[[str, Optional[str]], None] = None
+    ) -> Dict[str, str]:
+        """Enhance every non-empty section concurrently, at most max_workers at a time (see fan_out)
+
+        Returns the enhanced text per section; sections that failed or came back empty are left out.
+        on_section_done(section_key, error) is called on the calling thread as each section finishes.
+        """
+        enhanced = {}
+        pending = [key for key, content in sections.items() if content.strip()]
+        for key, result, error in self.fan_out(
+            pending,
+            lambda key: self.enhance_section(sections[key], SECTION_TITLES[key]),
+            lambda key: self.enhance_section_async(sections[key], SECTION_TITLES[key]),
+            max_workers
+        ):
+            if error is None and not (result and result.strip()):
+                error = "Enhancement returned empty content"
+            if error is None:
+                enhanced[key] = result
+            if on_section_done:
+                on_section_done(key, None if error is None else str(error))
+        return enhanced
+
+    def shared_industry_context(self, companies: List[str], focus: str = "") -> str:
+        """Industry overview shared by a set of companies, generated once per set and cached"""
+        names = ", ".join(sorted(companies, key=str.lower))
+        focus_text = f" with a focus on {focus}" if focus else ""
+        messages = [
+            {"role": "system", "content": "You are an expert business analyst who writes concise, factual market research."},
+            {"role": "user", "content": f"""Write a shared industry overview for an account comparison of {names}{focus_text}.
+
+Cover the market these companies compete in: size and growth, key trends, regulation, customer buying patterns, and how the companies are positioned against each other. Do not write account plans or company-by-company profiles. Keep it under 400 words."""}
+        ]
+        return self.cached_completion(messages, call_site="compare-context", temperature=0.3, max_tokens=1024, top_p=0.95)
+
+    def generate_company_plan(self, company: str, shared_context: str, focus: str = "") -> Tuple[str, Dict[str, str]]:
+        """Full account plan for one company that builds on an already generated industry overview"""
+        focus_text = f" focused on {focus}" if focus else ""
+        messages = [
+            {"role": "system", "content": PLAN_JSON_PROMPT},
+            *self.reference_messages(f"{company} {focus} {PLAN_REFERENCE_TOPICS}", company),
+            {"role": "user", "content": f"""Create an account plan for {company}{focus_text}.
+
+This plan is part of a multi-company comparison. The shared industry context below has already been researched; build on it rather than repeating it, and concentrate on what is specific to {company}.
+
+Shared industry context:
+{shared_context}"""}
+        ]
+        plan = self.plan_completion(messages, call_site="compare-plan")
+        return format_plan_markdown(plan), plan
+
+    def compare_companies(
+        self,
+        companies: List[str],
+        focus: str = "",
+        existing: Dict[str, Dict[str, str]] = None,
+        max_workers: int = PLAN_MAX_CONCURRENCY,
+        on_company_done: Callable[[str, Optional[str]], None] = None
+    ) -> Tuple[str, Dict[str, Dict[str, str]]]:
+        """Plans for several companies, generated concurrently over one shared industry context
+
+        Companies in existing (e.g. plans loaded from the plan store) are reused as they are.
+        Returns the shared context ("" if nothing had to be generated) and the plan per company,
+        in the order given; companies that failed are left out.
+        on_company_done(company, error) is called on the calling thread as each company finishes.
+        """
+        existing = existing or {}
+        plans = {company: existing[company] for company in companies if company in existing}
+        to_generate = [company for company in companies if company not in existing]
+        if not to_generate:
+            return "", plans
+        
+        shared_context = self.shared_industry_context(companies, focus)
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {
+                executor.submit(self.generate_company_plan, company, shared_context, focus): company
+                for company in to_generate
+            }
+            for future in as_completed(futures):
+                company = futures[future]
+                error = None
+                try:
+                    plans[company] = future.result()[1]
+                except Exception as e:
+                    error = str(e)
+                if on_company_done:
+                    on_company_done(company, error)
+        
+        return shared_context, {company: plans[company] for company in companies if company in plans}
@@ -0,0 +1,253 @@
+"""Content-addressed cache for Groq chat completion responses"""
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, List, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def make_cache_key(model: str, messages: List[Dict], **params) -> str:
+    """Hash the model, messages (system prompt included) and sampling params into a cache key"""
+    payload = json.dumps(
+        {"model": model, "messages": messages, "params": params},
+        sort_keys=True,
+        ensure_ascii=False
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+def content_fingerprint(text: str) -> str:
+    """Whitespace-insensitive hash, so reflowed text compares and caches as identical"""
+    return hashlib.sha256(" ".join(text.split()).encode("utf-8")).hexdigest()
+
+
+class CacheBackend(ABC):
+    """Storage interface for cached responses; values carry an absolute expiry time"""
+
+    @abstractmethod
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        ...
+
+    @abstractmethod
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        ...
+
+    @abstractmethod
+    def delete(self, key: str) -> None:
+        ...
+
+    @abstractmethod
+    def clear(self) -> None:
+        ...
+
+    @abstractmethod
+    def __len__(self) -> int:
+        ...
+
+
+class MemoryBackend(CacheBackend):
+    """In-process LRU store bounded by entry count"""
+
+    def __init__(self, max_entries: int = 256):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[str, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+            return entry
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class SQLiteBackend(CacheBackend):
+    """On-disk store shared across reruns and processes, evicting least recently used rows"""
+
+    def __init__(self, path: str, max_entries: int = 5000):
+        self.path = path
+        self.max_entries = max_entries
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS responses (
+                key TEXT PRIMARY KEY,
+                value TEXT NOT NULL,
+                expires_at REAL NOT NULL,
+                last_access REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_responses_last_access ON responses(last_access)")
+        self._conn.commit()
+
+    def get(self, key: str) -> Optional[Tuple[str, float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT value, expires_at FROM responses WHERE key = ?", (key,)
+            ).fetchone()
+            if row is not None:
+                self._conn.execute(
+                    "UPDATE responses SET last_access = ? WHERE key = ?", (time.time(), key)
+                )
+                self._conn.commit()
+            return row
+
+    def set(self, key: str, value: str, expires_at: float) -> None:
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO responses (key, value, expires_at, last_access) VALUES (?, ?, ?, ?)",
+                (key, value, expires_at, time.time())
+            )
+            now = time.time()
+            self._conn.execute("DELETE FROM responses WHERE expires_at <= ?", (now,))
+            self._conn.execute(
+                """DELETE FROM responses WHERE key IN (
+                    SELECT key FROM responses ORDER BY last_access DESC LIMIT -1 OFFSET ?
+                )""",
+                (self.max_entries,)
+            )
+            self._conn.commit()
+
+    def delete(self, key: str) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses WHERE key = ?", (key,))
+            self._conn.commit()
+
+    def clear(self) -> None:
+        with self._lock:
+            self._conn.execute("DELETE FROM responses")
+            self._conn.commit()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM responses").fetchone()[0]
+
+
+class ResponseCache:
+    """Read-through cache over one or more backends, fastest first, with TTL and hit/miss counters"""
+
+    def __init__(self, backends: List[CacheBackend], ttl_seconds: float = 24 * 3600):
+        self.backends = backends
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        """Return the cached response for key, or None on a miss"""
+        now = time.time()
+        for index, backend in enumerate(self.backends):
+            entry = backend.get(key)
+            if entry is None:
+                continue
+            value, expires_at = entry
+            if expires_at <= now:
+                backend.delete(key)
+                continue
+            # Promote to the faster tiers so the next lookup stays in memory
+            for faster in self.backends[:index]:
+                faster.set(key, value, expires_at)
+            self._count(hit=True)
+            return value
+        self._count(hit=False)
+        return None
+
+    def set(self, key: str, value: str) -> None:
+        """Store a response in every backend"""
+        expires_at = time.time() + self.ttl_seconds
+        for backend in self.backends:
+            backend.set(key, value, expires_at)
+
+    def clear(self) -> None:
+        for backend in self.backends:
+            backend.clear()
+
+    def stats(self) -> Dict[str, float]:
+        """Hit/miss counters for the diagnostics sidebar"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self.backends[0]) if self.backends else 0
+        }
+
+    def _count(self, hit: bool) -> None:
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+
+def cache_from_env() -> ResponseCache:
+    """Memory tier plus optional SQLite tier, configured by RESPONSE_CACHE_* variables"""
+    backends: List[CacheBackend] = [MemoryBackend(max_entries=int(os.getenv("RESPONSE_CACHE_MEMORY_ENTRIES", "256")))]
+    cache_path = os.getenv("RESPONSE_CACHE_PATH", ".cache/responses.sqlite3")
+    if cache_path:
+        backends.append(SQLiteBackend(cache_path, max_entries=int(os.getenv("RESPONSE_CACHE_DISK_ENTRIES", "5000"))))
+    return ResponseCache(backends, ttl_seconds=float(os.getenv("RESPONSE_CACHE_TTL_SECONDS", "86400")))
+
+
+class SingleFlight:
+    """Collapse concurrent calls with the same key into one in-flight call
+
+    The first caller runs the function; callers arriving before it finishes
+    wait for and share its result (or exception).
+    """
+
+    def __init__(self):
+        self._calls: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        self.collapsed = 0
+
+    def do(self, key: str, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = Future()
+                self._calls[key] = future
+            else:
+                self.collapsed += 1
+        if not leader:
+            return future.result()
+        try:
+            result = fn()
+            future.set_result(result)
+            return result
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        finally:
+            with self._lock:
+                self._calls.pop(key, None)
@@ -0,0 +1,503 @@
+"""Per-user research sessions: a hot in-memory tier over a pluggable persistent backend
+
+st.session_state only holds the session id; messages, research notes and the
+current plan live here. Every change is written through to the backend, so a
+session can be dropped from memory when idle and picked up again later, by
+this process or by another replica sharing the backend. New messages and
+notes are appended as change records after the session's last full snapshot,
+so a chat turn does not rewrite the whole conversation.
+"""
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+import weakref
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from typing import Callable, Dict, List, Optional, Tuple
+
+from plan_export import PlanExports
+
+
+class Message:
+    """One chat message; roles are interned so every message shares the same few strings"""
+    __slots__ = ("role", "content")
+
+    def __init__(self, role: str, content: str):
+        self.role = sys.intern(role)
+        self.content = content
+
+    def __getitem__(self, key: str) -> str:
+        # Dict-style access, as used by chat_history and research helpers
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+class Note:
+    """One research note"""
+    __slots__ = ("timestamp", "action")
+
+    def __init__(self, timestamp: str, action: str):
+        self.timestamp = timestamp
+        self.action = action
+
+    def __getitem__(self, key: str) -> str:
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+
+class ResearchSession:
+    """Conversation, research notes and current account plan of one browser session
+
+    Change it only through its methods, which report every change to
+    on_change(session, record) (the store's write-through); record is the change
+    record of a new message or note, and None for changes that need a full save.
+    lock serializes changes, their write-through and reloads, so concurrent
+    writers (script thread, job workers) cannot save out of order. exports is a
+    per-process cache and is not persisted.
+    """
+    __slots__ = (
+        "session_id", "messages", "notes", "plan", "plan_id", "plan_company", "exports",
+        "version", "appended", "last_access", "checked_at", "on_change", "lock", "__weakref__"
+    )
+
+    def __init__(self, session_id: str):
+        self.session_id = session_id
+        self.messages: List[Message] = []
+        self.notes: List[Note] = []
+        self.plan: Optional[Dict[str, str]] = None
+        self.plan_id: Optional[int] = None
+        self.plan_company: Optional[str] = None
+        self.exports = PlanExports()
+        self.version: Optional[int] = None
+        # Change records stored after the last full snapshot
+        self.appended = 0
+        self.last_access = time.monotonic()
+        # When the backend version was last compared with this copy's
+        self.checked_at = time.monotonic()
+        self.on_change: Optional[Callable[["ResearchSession", Optional[list]], None]] = None
+        self.lock = threading.RLock()
+
+    def _changed(self, record: Optional[list] = None) -> None:
+        if self.on_change is not None:
+            self.on_change(self, record)
+
+    def add_message(self, role: str, content: str) -> Message:
+        message = Message(role, content)
+        with self.lock:
+            self.messages.append(message)
+            self._changed(["message", message.role, content])
+        return message
+
+    def add_note(self, timestamp: str, action: str) -> None:
+        with self.lock:
+            self.notes.append(Note(timestamp, action))
+            self._changed(["note", timestamp, action])
+
+    def set_plan(self, plan: Dict[str, str], plan_id: Optional[int], company: Optional[str]) -> None:
+        with self.lock:
+            self.plan = plan
+            self.plan_id = plan_id
+            self.plan_company = company
+            self._changed()
+
+    def update_sections(self, sections: Dict[str, str]) -> None:
+        with self.lock:
+            self.plan.update(sections)
+            self._changed()
+
+    def reset(self) -> None:
+        """Forget the conversation, notes and plan, keeping the session id"""
+        with self.lock:
+            self.messages = []
+            self.notes = []
+            self.plan = None
+            self.plan_id = None
+            self.plan_company = None
+            self._changed()
+
+    def replace_contents(self, other: "ResearchSession") -> None:
+        """Take over another copy's conversation, notes, plan and version, e.g. a newer one from the backend"""
+        with self.lock:
+            self.messages = other.messages
+            self.notes = other.notes
+            self.plan = other.plan
+            self.plan_id = other.plan_id
+            self.plan_company = other.plan_company
+            self.version = other.version
+            self.appended = other.appended
+
+    def to_json(self) -> str:
+        """Full snapshot, on one line"""
+        return json.dumps({
+            "messages": [[m.role, m.content] for m in self.messages],
+            "notes": [[n.timestamp, n.action] for n in self.notes],
+            "plan": self.plan,
+            "plan_id": self.plan_id,
+            "plan_company": self.plan_company
+        }, ensure_ascii=False)
+
+    @classmethod
+    def from_json(cls, session_id: str, text: str) -> "ResearchSession":
+        """Session from a snapshot line followed by the change records appended since, one per line"""
+        # JSON escapes newlines inside strings, so every record is one line
+        snapshot, *records = text.split("\n")
+        data = json.loads(snapshot)
+        session = cls(session_id)
+        session.messages = [Message(role, content) for role, content in data["messages"]]
+        session.notes = [Note(timestamp, action) for timestamp, action in data["notes"]]
+        session.plan = data["plan"]
+        session.plan_id = data["plan_id"]
+        session.plan_company = data["plan_company"]
+        for record in records:
+            kind, *fields = json.loads(record)
+            if kind == "message":
+                session.messages.append(Message(*fields))
+            elif kind == "note":
+                session.notes.append(Note(*fields))
+        session.appended = len(records)
+        return session
+
+
+class SessionBackend(ABC):
+    """Persistent storage interface for serialized sessions
+
+    Versions change on every save, so a process can tell whether its in-memory
+    copy is still current. Implement this over a networked store (Redis,
+    Postgres, ...) to share sessions between nodes.
+    """
+
+    @abstractmethod
+    def load(self, session_id: str) -> Optional[Tuple[int, str]]:
+        """(version, data) of a saved session, or None; data is the snapshot followed by appended records, one per line"""
+
+    @abstractmethod
+    def version(self, session_id: str) -> Optional[int]:
+        ...
+
+    @abstractmethod
+    def save(self, session_id: str, data: str) -> int:
+        """Replace the session with a snapshot, dropping its appended records; returns the new version"""
+
+    @abstractmethod
+    def append(self, session_id: str, record: str) -> Optional[int]:
+        """Add a one-line change record after the session's snapshot; returns the new version, or None if the session is not stored"""
+
+    @abstractmethod
+    def expire(self, older_than: float) -> List[str]:
+        """Delete sessions last saved before the older_than timestamp; returns their ids"""
+
+
+class FileSessionBackend(SessionBackend):
+    """One file per session, replaced atomically and appended to; versions are derived from the file's stat
+
+    Shared by processes on one machine, or by nodes with a common volume.
+    """
+
+    def __init__(self, directory: str):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+
+    def _path(self, session_id: str) -> str:
+        # Session ids are validated hex strings (see main.py)
+        return os.path.join(self.directory, f"{session_id}.json")
+
+    @staticmethod
+    def _version(stat: os.stat_result) -> int:
+        # mtime alone can repeat within one clock tick; every save also gets a new inode from os.replace
+        return hash((stat.st_mtime_ns, stat.st_ino, stat.st_size))
+
+    def load(self, session_id: str) -> Optional[Tuple[int, str]]:
+        try:
+            with open(self._path(session_id), encoding="utf-8") as f:
+                return self._version(os.fstat(f.fileno())), f.read()
+        except OSError:
+            return None
+
+    def version(self, session_id: str) -> Optional[int]:
+        try:
+            return self._version(os.stat(self._path(session_id)))
+        except OSError:
+            return None
+
+    def save(self, session_id: str, data: str) -> int:
+        path = self._path(session_id)
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+        return self._version(os.stat(path))
+
+    def append(self, session_id: str, record: str) -> Optional[int]:
+        try:
+            # No O_CREAT: a record without its snapshot would be unreadable
+            fd = os.open(self._path(session_id), os.O_WRONLY | os.O_APPEND)
+        except FileNotFoundError:
+            return None
+        with open(fd, "a", encoding="utf-8") as f:
+            f.write("\n" + record)
+            f.flush()
+            return self._version(os.fstat(f.fileno()))
+
+    def expire(self, older_than: float) -> List[str]:
+        removed = []
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            try:
+                if os.path.getmtime(path) < older_than:
+                    os.remove(path)
+                    if name.endswith(".json"):
+                        removed.append(name[:-len(".json")])
+            except OSError:
+                continue
+        return removed
+
+
+class SQLiteSessionBackend(SessionBackend):
+    """Sessions table in a SQLite database, shared by every process that opens the same file"""
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False, timeout=30)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS sessions (
+                id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                version INTEGER NOT NULL,
+                updated_at REAL NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated_at ON sessions(updated_at)")
+        self._conn.execute(
+            """CREATE TABLE IF NOT EXISTS session_records (
+                id INTEGER PRIMARY KEY AUTOINCREMENT,
+                session_id TEXT NOT NULL,
+                record TEXT NOT NULL
+            )"""
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_session_records_session ON session_records(session_id, id)")
+        self._conn.commit()
+
+    def load(self, session_id: str) -> Optional[Tuple[int, str]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT version, data FROM sessions WHERE id = ?", (session_id,)
+            ).fetchone()
+            if row is None:
+                return None
+            records = self._conn.execute(
+                "SELECT record FROM session_records WHERE session_id = ? ORDER BY id", (session_id,)
+            ).fetchall()
+        return row[0], "\n".join([row[1], *(record for record, in records)])
+
+    def version(self, session_id: str) -> Optional[int]:
+        with self._lock:
+            row = self._conn.execute("SELECT version FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return row[0] if row else None
+
+    def save(self, session_id: str, data: str) -> int:
+        with self._lock, self._conn:
+            self._conn.execute("DELETE FROM session_records WHERE session_id = ?", (session_id,))
+            return self._conn.execute(
+                """INSERT INTO sessions (id, data, version, updated_at) VALUES (?, ?, 1, ?)
+                   ON CONFLICT(id) DO UPDATE SET
+                       data = excluded.data, version = sessions.version + 1, updated_at = excluded.updated_at
+                   RETURNING version""",
+                (session_id, data, time.time())
+            ).fetchone()[0]
+
+    def append(self, session_id: str, record: str) -> Optional[int]:
+        with self._lock, self._conn:
+            row = self._conn.execute(
+                "UPDATE sessions SET version = version + 1, updated_at = ? WHERE id = ? RETURNING version",
+                (time.time(), session_id)
+            ).fetchone()
+            if row is None:
+                return None
+            self._conn.execute(
+                "INSERT INTO session_records (session_id, record) VALUES (?, ?)", (session_id, record)
+            )
+        return row[0]
+
+    def expire(self, older_than: float) -> List[str]:
+        with self._lock, self._conn:
+            rows = self._conn.execute(
+                "DELETE FROM sessions WHERE updated_at < ? RETURNING id", (older_than,)
+            ).fetchall()
+            self._conn.executemany("DELETE FROM session_records WHERE session_id = ?", rows)
+        return [row[0] for row in rows]
+
+
+class SessionStore:
+    """Hot in-memory tier over a SessionBackend, shared by every session on this server
+
+    Changes are written through to the backend as they happen: new messages and
+    notes as appended records, other changes and every compact_every-th record
+    as a full snapshot. Sessions idle for
+    idle_seconds, and the least recently used ones beyond max_hot, are dropped
+    from memory. max_hot is a soft cap: sessions used in the last min_idle_seconds
+    are never dropped, since a script run or job may still be updating them. A
+    dropped session that something still holds is handed back as the same object
+    rather than reloaded, so one process never has two copies writing over each
+    other. get() reloads a session when the backend holds a newer version, e.g.
+    one saved by another replica, checking at most every version_check_interval
+    seconds per session. Sessions not saved for ttl_seconds are
+    deleted from the backend, and on_expire(session_id) is called for each, so
+    data kept elsewhere for the session can go with it.
+    """
+
+    def __init__(
+        self,
+        backend: SessionBackend,
+        idle_seconds: float = 600.0,
+        max_hot: int = 200,
+        min_idle_seconds: float = 120.0,
+        ttl_seconds: float = 7 * 24 * 3600,
+        sweep_interval: float = 60.0,
+        on_expire: Optional[Callable[[str], None]] = None,
+        compact_every: int = 200,
+        version_check_interval: float = 1.0
+    ):
+        self.backend = backend
+        self.compact_every = compact_every
+        self.version_check_interval = version_check_interval
+        self.on_expire = on_expire
+        self.idle_seconds = max(idle_seconds, min_idle_seconds)
+        self.max_hot = max_hot
+        self.min_idle_seconds = min_idle_seconds
+        self.ttl_seconds = ttl_seconds
+        self.sweep_interval = sweep_interval
+        self.evicted = 0
+        self.loaded = 0
+        self._hot: "OrderedDict[str, ResearchSession]" = OrderedDict()
+        # Dropped sessions that are still referenced somewhere, e.g. by a job worker
+        self._evicted: "weakref.WeakValueDictionary[str, ResearchSession]" = weakref.WeakValueDictionary()
+        self._swept_at = time.monotonic()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> ResearchSession:
+        """The current version of the session: from memory, from the backend, or new
+
+        A hot session that another process has saved since is updated in place,
+        so every holder of the object (script thread, job workers) sees the same copy.
+        """
+        with self._lock:
+            session = self._hot.get(session_id)
+            cold = session is None
+            if cold:
+                session = self._evicted.pop(session_id, None)
+                # A handed-back copy may still be behind the backend
+                cold = session is None
+                if cold:
+                    session = self._load(session_id) or self._new(session_id)
+                self._hot[session_id] = session
+            self._hot.move_to_end(session_id)
+            session.last_access = time.monotonic()
+            due = session.last_access - self._swept_at > self.sweep_interval or len(self._hot) > self.max_hot
+        if not cold:
+            self._refresh(session)
+        if due:
+            self.sweep()
+        return session
+
+    def _refresh(self, session: ResearchSession) -> None:
+        # Under the session lock, session.version is always the last version this process saved or
+        # loaded, so a different backend version can only come from another process
+        with session.lock:
+            # One script run calls get() many times; one check covers them all
+            now = time.monotonic()
+            if now - session.checked_at < self.version_check_interval:
+                return
+            session.checked_at = now
+            version = self.backend.version(session.session_id)
+            if version is None or version == session.version:
+                return
+            newer = self._load(session.session_id)
+            if newer is not None:
+                session.replace_contents(newer)
+
+    def _new(self, session_id: str) -> ResearchSession:
+        session = ResearchSession(session_id)
+        session.on_change = self.save
+        return session
+
+    def _load(self, session_id: str) -> Optional[ResearchSession]:
+        stored = self.backend.load(session_id)
+        if stored is None:
+            return None
+        try:
+            session = ResearchSession.from_json(session_id, stored[1])
+        except (ValueError, KeyError, TypeError):
+            return None
+        session.version = stored[0]
+        session.on_change = self.save
+        self.loaded += 1
+        return session
+
+    def save(self, session: ResearchSession, record: Optional[list] = None) -> None:
+        """Write a change through to the backend; serialized per session, so saves land in order
+
+        A change record is appended unless the session was never stored or has
+        compact_every records already; otherwise the whole session is rewritten.
+        """
+        with session.lock:
+            version = None
+            if record is not None and session.version is not None and session.appended < self.compact_every:
+                version = self.backend.append(session.session_id, json.dumps(record, ensure_ascii=False))
+            if version is None:
+                version = self.backend.save(session.session_id, session.to_json())
+                session.appended = 0
+            else:
+                session.appended += 1
+            session.version = version
+            session.last_access = session.checked_at = time.monotonic()
+
+    def sweep(self) -> None:
+        """Drop idle and over-capacity sessions from memory and expire old ones from the backend"""
+        now = time.monotonic()
+        with self._lock:
+            self._swept_at = now
+            evict = [sid for sid, session in self._hot.items() if now - session.last_access > self.idle_seconds]
+            overflow = len(self._hot) - len(evict) - self.max_hot
+            if overflow > 0:
+                # The hot dict is in least-recently-used order
+                idle = set(evict)
+                evict += [
+                    sid for sid, session in self._hot.items()
+                    if sid not in idle and now - session.last_access > self.min_idle_seconds
+                ][:overflow]
+            for session_id in evict:
+                self._evicted[session_id] = self._hot.pop(session_id)
+            self.evicted += len(evict)
+        for session_id in self.backend.expire(time.time() - self.ttl_seconds):
+            if self.on_expire:
+                self.on_expire(session_id)
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"hot": len(self._hot), "evicted": self.evicted, "loaded": self.loaded}
+
+
+def session_store_from_env(on_expire: Optional[Callable[[str], None]] = None) -> SessionStore:
+    """Session store over the backend chosen by SESSION_BACKEND ("file" or "sqlite")"""
+    if os.getenv("SESSION_BACKEND", "file") == "sqlite":
+        backend: SessionBackend = SQLiteSessionBackend(os.getenv("SESSION_STORE_PATH", ".cache/sessions.sqlite3"))
+    else:
+        backend = FileSessionBackend(os.getenv("SESSION_SPILL_DIR", ".cache/sessions"))
+    return SessionStore(
+        backend,
+        idle_seconds=float(os.getenv("SESSION_IDLE_SECONDS", "600")),
+        max_hot=int(os.getenv("SESSION_MAX_HOT", "200")),
+        ttl_seconds=float(os.getenv("SESSION_TTL_SECONDS", str(7 * 24 * 3600))),
+        on_expire=on_expire,
+        version_check_interval=float(os.getenv("SESSION_VERSION_CHECK_SECONDS", "1"))
+    )
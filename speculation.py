@@ -0,0 +1,244 @@
+"""Speculative account plans, generated in the background before the user asks for one
+
+Once a conversation has stayed on one company for a few turns, a low-priority
+job generates that company's plan. A later plain "create the account plan"
+is answered from it instantly, provided nothing material was said since. Every
+user message is material except plain acknowledgements ("thanks", "ok", "yes"):
+a new one changes the conversation's fingerprint and makes the speculation stale. A request that
+arrives while the matching speculation is still running waits for it instead
+of starting over. Speculation spends from a rolling token budget, yields
+rate-limit quota to interactive requests and is cancelled when superseded.
+"""
+import os
+import re
+import threading
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+from chat_history import estimate_tokens
+from jobs import DONE, RUNNING, JobQueue, ProgressFn
+from plan_parser import SECTION_TITLES
+from research import (
+    AFFIRMATIVE, PLAN_JSON_PROMPT, PLAN_REQUEST, REFERENCE_TOKEN_BUDGET, ROUTES,
+    ResearchPipeline, detect_company, extract_company_name
+)
+from response_cache import content_fingerprint
+
+SPECULATIVE_PLAN = "speculative_plan"
+
+# A whole message that only acknowledges, e.g. "ok thanks!" or "yes, sounds good"
+ACKNOWLEDGEMENT = re.compile(
+    r"^\W*(?:(?:yes|yeah|yep|sure|ok(?:ay)?|thanks|thank you|thx|great|cool|nice|perfect|awesome|got it"
+    r"|sounds good|makes sense)\W*)+$",
+    re.IGNORECASE
+)
+REGENERATE = re.compile(r"\b(?:redo|regenerate|again|another|new|fresh|updated?)\b", re.IGNORECASE)
+PLAN_FILLER = {
+    "a", "an", "the", "for", "of", "on", "it", "its", "s", "me", "us", "i", "we", "you", "can", "could",
+    "would", "will", "please", "now", "then", "want", "need", "like", "to", "full", "complete",
+    "ok", "okay", "thanks", "thank", "go", "ahead", "let", "lets", "do", "that", "this", "one", "and"
+}
+
+
+def turns_about(messages: List[Dict], company: str) -> int:
+    """User turns in a row, up to the latest, with company as the company under discussion"""
+    current = None
+    count = 0
+    for message in messages:
+        if message["role"] != "user":
+            continue
+        current = extract_company_name(message["content"]) or current
+        count = count + 1 if current and current.lower() == company.lower() else 0
+    return count
+
+
+def material_fingerprint(company: str, messages: List[Dict]) -> str:
+    """Hash of the company and every user message that is more than an acknowledgement
+
+    Short messages count too: "focus on their healthcare customers only" changes the plan.
+    """
+    material = [
+        message["content"]
+        for message in messages
+        if message["role"] == "user" and not ACKNOWLEDGEMENT.match(message["content"])
+    ]
+    return content_fingerprint("\n".join([company.lower(), *material]))
+
+
+def is_bare_plan_request(user_message: str, company: str) -> bool:
+    """Whether a plan request asks for nothing beyond company's plan, e.g. "create the account plan" or "yes please" """
+    if REGENERATE.search(user_message):
+        return False
+    text = AFFIRMATIVE.sub(" ", PLAN_REQUEST.sub(" ", user_message))
+    text = re.sub(re.escape(company), " ", text, flags=re.IGNORECASE)
+    return all(word in PLAN_FILLER for word in re.findall(r"[a-z]+", text.lower()))
+
+
+class TokenBudget:
+    """Tokens that may be reserved per rolling window; reservations are not refunded"""
+
+    def __init__(self, tokens: int, window_seconds: float = 3600.0):
+        self.tokens = tokens
+        self.window_seconds = window_seconds
+        self._reserved: Deque[Tuple[float, int]] = deque()
+        self._lock = threading.Lock()
+
+    def _used(self, now: float) -> int:
+        while self._reserved and now - self._reserved[0][0] > self.window_seconds:
+            self._reserved.popleft()
+        return sum(tokens for _, tokens in self._reserved)
+
+    def try_reserve(self, tokens: int) -> bool:
+        with self._lock:
+            now = time.monotonic()
+            if self._used(now) + tokens > self.tokens:
+                return False
+            self._reserved.append((now, tokens))
+            return True
+
+    def remaining(self) -> int:
+        with self._lock:
+            return max(self.tokens - self._used(time.monotonic()), 0)
+
+
+class Speculator:
+    """Submits speculative plans to the job queue and hands them out when they are still current
+
+    Each speculation reserves its worst case (full prompt plus the plan's
+    max_tokens) from budget; when the budget is spent, speculation pauses.
+    """
+
+    def __init__(self, pipeline: ResearchPipeline, job_queue: JobQueue, after_turns: int = 3, budget: Optional[TokenBudget] = None):
+        self.pipeline = pipeline
+        self.job_queue = job_queue
+        self.after_turns = after_turns
+        self.budget = budget or TokenBudget(100_000)
+        self.submitted = 0
+        self.hits = 0
+        self.over_budget = 0
+        # session id -> (fingerprint, job id) of its latest speculation in this process
+        self._latest: Dict[str, Tuple[str, str]] = {}
+        self._lock = threading.Lock()
+
+    def maybe_speculate(
+        self, session_id: str, messages: List[Dict], history: List[Dict], plan_company: Optional[str] = None
+    ) -> Optional[str]:
+        """Submit a speculative plan if the conversation has settled on a company; returns the job id
+
+        history is the chat history window a plan request would be sent with now;
+        plan_company is the company of the session's current plan, which is never speculated again.
+        """
+        company = detect_company(messages)
+        if not company or (plan_company and plan_company.lower() == company.lower()):
+            return None
+        if turns_about(messages, company) < self.after_turns:
+            return None
+        fingerprint = material_fingerprint(company, messages)
+        with self._lock:
+            previous = self._latest.get(session_id)
+        if previous and previous[0] == fingerprint:
+            return None
+
+        reserved = (
+            estimate_tokens(PLAN_JSON_PROMPT) + REFERENCE_TOKEN_BUDGET
+            + sum(estimate_tokens(message["content"]) for message in history) + ROUTES["plan"].max_tokens
+        )
+        if not self.budget.try_reserve(reserved):
+            self.over_budget += 1
+            return None
+        if previous:
+            self.job_queue.cancel(previous[1])
+
+        def generate(report: ProgressFn) -> Dict:
+            # Raises JobCancelled if the speculation was superseded while it waited or streamed
+            report(0.0, f"Preparing a plan for {company}")
+            partial = {}
+
+            def on_section(section_key: str, text: str):
+                partial[section_key] = text
+                report(len(partial) / len(SECTION_TITLES), f"{SECTION_TITLES[section_key]} ready", partial=partial)
+
+            markdown, plan = self.pipeline.generate_account_plan(
+                f"Create an account plan for {company}",
+                history,
+                call_site=SPECULATIVE_PLAN,
+                on_section=on_section,
+                low_priority=True
+            )
+            return {"company": company, "fingerprint": fingerprint, "markdown": markdown, "plan": plan}
+
+        job_id = self.job_queue.submit(
+            SPECULATIVE_PLAN, session_id, generate, description=f"Speculative plan for {company}", low_priority=True
+        )
+        with self._lock:
+            self._latest[session_id] = (fingerprint, job_id)
+        self.submitted += 1
+        return job_id
+
+    def _request_fingerprint(self, user_message: str, messages: List[Dict]) -> Optional[str]:
+        """Fingerprint a speculation must have to answer this plan request; None if it asks for more than the plan"""
+        company = detect_company(messages + [{"role": "user", "content": user_message}])
+        if not company or not is_bare_plan_request(user_message, company):
+            return None
+        return material_fingerprint(company, messages)
+
+    def take(self, session_id: str, user_message: str, messages: List[Dict]) -> Optional[Tuple[str, Dict[str, str], str]]:
+        """(markdown, plan, company) of a finished speculation that answers this plan request, if still current
+
+        messages is the conversation before user_message.
+        """
+        fingerprint = self._request_fingerprint(user_message, messages)
+        if fingerprint is None:
+            return None
+        for job in reversed(self.job_queue.for_session(session_id)):
+            if job["kind"] == SPECULATIVE_PLAN and job["status"] == DONE and job["result"]["fingerprint"] == fingerprint:
+                self.hits += 1
+                return job["result"]["markdown"], job["result"]["plan"], job["result"]["company"]
+        return None
+
+    def adopt(self, session_id: str, user_message: str, messages: List[Dict]) -> Optional[str]:
+        """Job id of a running speculation that answers this plan request, to wait for instead of starting over
+
+        The adopted job is no longer cancelled when the session speculates again or cancels.
+        """
+        fingerprint = self._request_fingerprint(user_message, messages)
+        with self._lock:
+            latest = self._latest.get(session_id)
+            if fingerprint is None or latest is None or latest[0] != fingerprint:
+                return None
+            job = self.job_queue.get(latest[1])
+            if job is None or job["status"] != RUNNING:
+                return None
+            del self._latest[session_id]
+        self.hits += 1
+        return job["id"]
+
+    def cancel(self, session_id: str) -> bool:
+        """Cancel the session's pending speculation, e.g. because an interactive plan request replaces it"""
+        with self._lock:
+            latest = self._latest.pop(session_id, None)
+        return latest is not None and self.job_queue.cancel(latest[1])
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "submitted": self.submitted,
+            "hits": self.hits,
+            "over_budget": self.over_budget,
+            "budget_remaining": self.budget.remaining()
+        }
+
+
+def speculator_from_env(pipeline: ResearchPipeline, job_queue: JobQueue) -> Optional[Speculator]:
+    """Speculator when SPECULATIVE_PLANS=1, otherwise None"""
+    if os.getenv("SPECULATIVE_PLANS", "0") != "1":
+        return None
+    return Speculator(
+        pipeline,
+        job_queue,
+        after_turns=int(os.getenv("SPECULATE_AFTER_TURNS", "3")),
+        budget=TokenBudget(
+            int(os.getenv("SPECULATIVE_TOKEN_BUDGET", "100000")),
+            window_seconds=float(os.getenv("SPECULATIVE_BUDGET_SECONDS", "3600"))
+        )
+    )